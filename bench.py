@@ -3,13 +3,13 @@
 import os
 import sys
 import time
-import subprocess
 import gc
-import statistics
-import json
 import threading
-import re
-import csv
+import marshal
+from array import array
+
+# Only modules needed for measurements are imported at startup. Results are
+# written by bench_report, which is imported after benchmarking finishes.
 
 # Need to avoid as much extra CPU usage as possible
 gc.disable()
@@ -35,6 +35,9 @@ POWER_CURRENT_NODES = [
 # Full paths to final nodes
 POWER_CURRENT_NODE = None
 POWER_VOLTAGE_NODE = None
+# Whether to keep the power supply nodes open and re-read them with pread()
+# instead of opening, reading, and closing them for every sample
+POWER_SAMPLE_PREAD = hasattr(os, "preadv")
 
 # Default power sampling intervals
 POWER_SAMPLE_INTERVAL = 1000  # ms
@@ -46,6 +49,17 @@ POWER_SAMPLE_FG_DEFAULT_INTERVALS = {
     # SM8350+ aDSP fuel gauge updates every 1000 ms
     "qcom,pmic_glink": 1000,
 }
+# The defaults above are only used if the fuel gauge's update cadence can't be calibrated
+POWER_CALIBRATION_TIME = 10  # sec
+POWER_CALIBRATION_POLL_INTERVAL = 10  # ms
+# Calibrated intervals are a multiple of the fuel gauge's update period
+# Sampling also uses power, so don't sample more often than this
+POWER_SAMPLE_MIN_INTERVAL = 250  # ms
+# How long after each expected fuel gauge update to take a sample
+POWER_SAMPLE_UPDATE_MARGIN = 10  # ms
+# How long to keep polling after a sample with an unchanged value, to tell
+# repeated readings apart from samples taken just before a late update
+POWER_SAMPLE_PROBE_TIME = 50  # ms
 
 # Needs to match init and cmdline
 HOUSEKEEPING_CPU = 0
@@ -56,15 +70,52 @@ REPLACE_CPUS = {
     HOUSEKEEPING_CPU: 1,
 }
 
-# How long to idle at each freq and measure power before benchmarking
+# Maximum time to wait for power usage to settle at each freq
+FREQ_SETTLE_TIME = 3  # sec
+# Maximum time to idle at each freq and measure power before benchmarking
 FREQ_IDLE_TIME = 5  # sec
 
-# To reduce chances of an array realloc + copy during benchmark runs
+# Settling and idle measurement end early once the 95% confidence interval of
+# mean power is within this fraction of the mean
+POWER_CONVERGENCE_PRECISION = 0.05
+# Minimum number of samples before checking for convergence
+POWER_CONVERGENCE_MIN_SAMPLES = 5
+# Two-sided 95% Student's t critical values by degrees of freedom
+# Larger sample counts use the normal approximation
+T_CRITICAL_95 = [
+    None, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+]
+
+# Power samples are stored in fixed-size arrays to avoid allocations during benchmark runs
 PREALLOC_SECONDS = 300  # seconds of power sampling
+# Samples that don't fit in the arrays are spilled to this file
+# Must be on tmpfs to avoid using power for storage writes
+POWER_SPILL_FILE = "/tmp/power_samples.spill"
+# How much space to preallocate in the spill file
+SPILL_PREALLOC_SECONDS = 1800  # seconds of power sampling
 
-# CoreMark PERFORMANCE_RUN params with 300,000 iterations
+# Fixed number of CoreMark iterations when not targeting a run time
 COREMARK_ITERATIONS = 300000
-COREMARK_PERFORMANCE_RUN = ["0x0", "0x0", "0x66", str(COREMARK_ITERATIONS), "7", "1", "2000"]
+
+# How long each CoreMark (or other workload) run should take
+# Iterations are scaled per frequency to hit this, based on the previous frequency's score
+# 0 = always run COREMARK_ITERATIONS
+COREMARK_TARGET_TIME = 20  # sec
+# CoreMark results are only valid if it runs for at least this long
+COREMARK_MIN_TIME = 10  # sec
+# Iterations for a short run to estimate performance at the first frequency of each CPU
+COREMARK_CALIBRATION_ITERATIONS = 2000
+
+# Launch workloads with posix_spawn() and pin them by inheriting our affinity,
+# instead of forking Python and exec'ing taskset for every run
+WORKLOAD_SPAWN = hasattr(os, "posix_spawnp") and hasattr(os, "memfd_create")
+# SCHED_FIFO priority for spawned workloads
+# 0 = normal scheduling (SCHED_OTHER)
+WORKLOAD_FIFO_PRIORITY = 0
+# Workload output is written to preallocated memfds of this size
+# Output beyond this is truncated
+WORKLOAD_OUTPUT_SIZE = 64 * 1024  # bytes
 
 # Blank lines are for rounded corner & camera cutout protection
 BANNER = """
@@ -85,6 +136,46 @@ BANNER = """
 
 SYS_CPU = "/sys/devices/system/cpu"
 
+# Raw power samples are written to a binary sidecar next to results.json to keep it small
+# Each phase's samples are stored as consecutive little-endian float64 columns
+SAMPLES_FILE = "/tmp/results.samples.bin"
+SAMPLES_MAGIC = b"FBSAMP1\n"
+SAMPLE_COLUMNS = ["power_sample_times", "power_samples", "power_sample_currents", "power_sample_voltages"]
+
+# Append-only journal of completed frequencies, used to resume interrupted runs
+# Written to tmpfs after every frequency and copied to persistent storage at safe points
+JOURNAL_FILE = "/tmp/journal.bin"
+JOURNAL_VERSION = 4
+# Minimum time between copies of the journal to persistent storage
+JOURNAL_PERSIST_INTERVAL = 60  # sec
+# Path to the persistent copy of the journal, passed by init
+# None = don't resume or persist
+PERSIST_JOURNAL_FILE = None
+
+# Number of cores in each frequency domain to run CoreMark on in parallel, passed by init
+# 0 = all cores in the frequency domain except the housekeeping CPU
+BENCH_CORES = 1
+
+# Extra workloads to run after CoreMark at each frequency, passed by init
+# See WORKLOADS for the available workloads
+BENCH_WORKLOADS = []
+# Input data for workloads that process files
+WORKLOAD_DATA_FILE = "/tmp/workload.txt"
+WORKLOAD_DATA_MIB = 4
+
+# Subset of CPUs and frequencies to benchmark, passed by init
+# Uses the same cpu.freq syntax as postprocess/filter_freqs.py, e.g. "1 4.710400-1804800 7.2841600"
+# None = all CPUs and frequencies
+BENCH_OPPS = None
+
+# Whether to record a trace of benchmark phases, power samples, and sysfs accesses, passed by init
+# Unlike debug mode, this doesn't print anything while benchmarking
+TRACE = False
+# Chrome trace event format, which can be opened in Perfetto or chrome://tracing
+TRACE_FILE = "/tmp/trace.json"
+# Trace events are stored in fixed-size arrays for each thread; later events are dropped
+TRACE_MAX_EVENTS = 262144
+
 # "Constants" evaluated at runtime
 for psy_node in POWER_SUPPLY_NODES:
     if os.path.exists(psy_node):
@@ -104,72 +195,576 @@ for fg_string, interval in POWER_SAMPLE_FG_DEFAULT_INTERVALS.items():
         POWER_SAMPLE_INTERVAL = interval
         break
 
+POWER_SAMPLE_INTERVAL_OVERRIDDEN = False
 if len(sys.argv) > 1:
     override_interval = int(sys.argv[1])
     if override_interval > 0:
         POWER_SAMPLE_INTERVAL = override_interval
+        POWER_SAMPLE_INTERVAL_OVERRIDDEN = True
+
+if len(sys.argv) > 2:
+    override_target_time = int(sys.argv[2])
+    if override_target_time >= 0:
+        COREMARK_TARGET_TIME = override_target_time
+
+if len(sys.argv) > 3 and sys.argv[3]:
+    PERSIST_JOURNAL_FILE = sys.argv[3]
+
+if len(sys.argv) > 4 and sys.argv[4].strip():
+    BENCH_OPPS = sys.argv[4]
+
+if len(sys.argv) > 5 and sys.argv[5]:
+    BENCH_CORES = int(sys.argv[5])
+
+if len(sys.argv) > 6:
+    BENCH_WORKLOADS = sys.argv[6].replace(",", " ").split()
+
+if len(sys.argv) > 7:
+    TRACE = sys.argv[7] == "true"
+
+# Make sure the sample buffer covers a full CoreMark run
+PREALLOC_SECONDS = max(PREALLOC_SECONDS, COREMARK_TARGET_TIME * 2)
+
+# Fuel gauge update cadence, set by calibration
+POWER_GAUGE_PERIOD_NS = None
+POWER_GAUGE_PHASE_NS = None
+
+class PowerSampleBuffer:
+    """Fixed-capacity power sample store that never allocates after init.
+
+    Each sample is a row of (timestamp, current, voltage, power) stored in
+    preallocated arrays. When the arrays are full, they are flushed to a
+    preallocated spill file on tmpfs and reused from the start.
+    """
+
+    def __init__(self, slots, spill_path, spill_slots):
+        self.slots = slots
+        self.count = 0
+        self.spilled = 0
+
+        self.time_ns = array("q", [0]) * slots
+        self.current = array("d", [0.0]) * slots
+        self.voltage = array("d", [0.0]) * slots
+        self.power = array("d", [0.0]) * slots
+        self._columns = (self.time_ns, self.current, self.voltage, self.power)
+        self._views = tuple(memoryview(col).cast("B") for col in self._columns)
+
+        self._spill_fd = os.open(spill_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        row_size = sum(col.itemsize for col in self._columns)
+        os.posix_fallocate(self._spill_fd, 0, spill_slots * row_size)
+
+    def reset(self):
+        self.count = 0
+        self.spilled = 0
+        os.lseek(self._spill_fd, 0, os.SEEK_SET)
+
+    def append(self, time_ns, current, voltage, power):
+        i = self.count
+        if i == self.slots:
+            self._spill()
+            i = 0
+
+        self.time_ns[i] = time_ns
+        self.current[i] = current
+        self.voltage[i] = voltage
+        self.power[i] = power
+        self.count = i + 1
+
+    def _spill(self):
+        # Spilled chunks are always full, so they can be read back by size
+        for view in self._views:
+            os.write(self._spill_fd, view)
+
+        self.spilled += self.count
+        self.count = 0
+
+    def collect(self):
+        """Copy all samples, including spilled ones, into new arrays."""
+        columns = tuple(array(col.typecode) for col in self._columns)
+
+        if self.spilled:
+            os.lseek(self._spill_fd, 0, os.SEEK_SET)
+            with os.fdopen(os.dup(self._spill_fd), "rb") as f:
+                for _ in range(self.spilled // self.slots):
+                    for col in columns:
+                        col.fromfile(f, self.slots)
+            os.lseek(self._spill_fd, 0, os.SEEK_SET)
+
+        for col, view in zip(columns, self._views):
+            col.frombytes(view[:self.count * col.itemsize])
+
+        return dict(zip(("time_ns", "current", "voltage", "power"), columns))
+
+class TraceBuffer:
+    """Fixed-capacity trace event store for a single thread.
+
+    Events are rows of (timestamp, name ID, phase) in preallocated arrays, so
+    recording an event doesn't allocate. Names are interned with trace_id().
+    """
+
+    def __init__(self, tid, name, slots):
+        self.tid = tid
+        self.name = name
+        self.slots = slots
+        self.count = 0
+        self.dropped = 0
+
+        self.time_ns = array("q", [0]) * slots
+        self.name_id = array("l", [0]) * slots
+        self.phase = array("b", [0]) * slots
+
+    def add(self, phase, name_id):
+        i = self.count
+        if i == self.slots:
+            self.dropped += 1
+            return
+
+        self.time_ns[i] = time.monotonic_ns()
+        self.name_id[i] = name_id
+        self.phase[i] = phase
+        self.count = i + 1
+
+    def events(self):
+        for i in range(self.count):
+            yield {
+                "name": _trace_names[self.name_id[i]],
+                "ph": chr(self.phase[i]),
+                "ts": self.time_ns[i] / 1000,
+                "pid": 1,
+                "tid": self.tid,
+            }
+
+# Trace event phases
+TRACE_BEGIN = ord("B")
+TRACE_END = ord("E")
+TRACE_INSTANT = ord("i")
+
+_trace_names = []
+_trace_name_ids = {}
+
+def trace_id(name):
+    """Intern a trace event name and return its ID."""
+    name_id = _trace_name_ids.get(name)
+    if name_id is None:
+        name_id = _trace_name_ids[name] = len(_trace_names)
+        _trace_names.append(name)
+
+    return name_id
 
-# Calculate prealloc slots now that the interval is known
-PREALLOC_SLOTS = int(PREALLOC_SECONDS / (POWER_SAMPLE_INTERVAL / 1000))
+# Allocated in init_trace() if tracing is enabled
+_trace_main = None
+_trace_sampler = None
+_trace_main_ident = None
+
+# IDs for events in the sampling loop, interned in advance
+TRACE_SAMPLE = trace_id("sample power")
+TRACE_SAMPLE_STALE = trace_id("stale sample")
+TRACE_MISSED_DEADLINE = trace_id("missed deadline")
+TRACE_READ_CURRENT = trace_id(f"read {POWER_CURRENT_NODE}")
+TRACE_READ_VOLTAGE = trace_id(f"read {POWER_VOLTAGE_NODE}")
 
 _stop_power_mon = False
-_prealloc_samples = [-1] * PREALLOC_SLOTS
-_power_samples = _prealloc_samples
+_power_current_fd = None
+_power_voltage_fd = None
+# Reused for every pread() to avoid allocating a new bytes object per read
+_pread_buf = bytearray(32)
+_pread_bufs = [_pread_buf]
+# Allocated once the sample interval is known
+_sample_buffer = None
+_power_samples = None
 
 def pr_debug(*args, **kwargs):
     if __debug__:
         kwargs["flush"] = True
         print(*args, **kwargs)
 
-def run_cmd(args):
-    pr_debug(f"Running command: {args}")
-    proc = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-    pr_debug(f"Command exited with return code {proc.returncode}")
-    if proc.returncode == 0:
-        return proc.stdout
+def init_trace():
+    global _trace_main
+    global _trace_sampler
+    global _trace_main_ident
+
+    _trace_main = TraceBuffer(1, "main", TRACE_MAX_EVENTS)
+    # Only one power monitor thread runs at a time, so they can share a buffer
+    _trace_sampler = TraceBuffer(2, "power monitor", TRACE_MAX_EVENTS)
+    _trace_main_ident = threading.get_ident()
+
+def trace_event(phase, name):
+    """Record a trace event from the calling thread, if tracing is enabled.
+
+    name can also be an ID from trace_id(), which skips interning the name.
+    """
+    if TRACE:
+        buf = _trace_main if threading.get_ident() == _trace_main_ident else _trace_sampler
+        buf.add(phase, name if type(name) is int else trace_id(name))
+
+def trace_begin(name):
+    trace_event(TRACE_BEGIN, name)
+
+def trace_end(name):
+    trace_event(TRACE_END, name)
+
+def write_trace():
+    import bench_report
+    bench_report.write_trace(TRACE_FILE, [_trace_main, _trace_sampler])
+
+def run_cmds(args_list):
+    """Run commands in parallel and return their outputs."""
+    # Workloads are launched with posix_spawn() when possible, so subprocess is
+    # only imported when needed. main() imports it before measuring if there
+    # are no calibration runs, so the import never lands in a measured run.
+    import subprocess
+
+    pr_debug(f"Running commands in parallel: {args_list}")
+    procs = [
+        subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        for args in args_list
+    ]
+
+    outputs = []
+    for args, proc in zip(args_list, procs):
+        stdout, _ = proc.communicate()
+        pr_debug(f"Command exited with return code {proc.returncode}")
+        if proc.returncode != 0:
+            raise ValueError(f"Subprocess {args} failed with exit code {proc.returncode}:\n{stdout}")
+
+        outputs.append(stdout)
+
+    return outputs
+
+# (memfd, buffer) pairs for workload output, reused across runs
+_spawn_outputs = []
+
+def get_spawn_outputs(count):
+    while len(_spawn_outputs) < count:
+        fd = os.memfd_create("workload-output")
+        os.posix_fallocate(fd, 0, WORKLOAD_OUTPUT_SIZE)
+        _spawn_outputs.append((fd, bytearray(WORKLOAD_OUTPUT_SIZE)))
+
+    return _spawn_outputs[:count]
+
+def spawn_cmds(args_list, cpus):
+    """Spawn commands pinned to the given CPUs and return their PIDs.
+
+    Children inherit the CPU affinity of the calling thread, so this thread is
+    moved to each target CPU just for the spawn and restored afterwards. If a
+    spawn fails, commands that were already started are killed and reaped.
+    """
+    pr_debug(f"Spawning commands on CPUs {cpus}: {args_list}")
+    spawn_attrs = {}
+    if WORKLOAD_FIFO_PRIORITY:
+        spawn_attrs["scheduler"] = (os.SCHED_FIFO, os.sched_param(WORKLOAD_FIFO_PRIORITY))
+
+    orig_affinity = os.sched_getaffinity(0)
+    pids = []
+    try:
+        for args, cpu, (fd, _) in zip(args_list, cpus, get_spawn_outputs(len(args_list))):
+            # Children share the file offset, so rewinding it resets the output
+            os.lseek(fd, 0, os.SEEK_SET)
+            file_actions = [
+                (os.POSIX_SPAWN_DUP2, fd, 1),
+                (os.POSIX_SPAWN_DUP2, fd, 2),
+            ]
+
+            os.sched_setaffinity(0, {cpu})
+            pids.append(os.posix_spawnp(args[0], args, os.environ,
+                    file_actions=file_actions, **spawn_attrs))
+    except BaseException:
+        # Only needed on this error path, so don't import it at startup
+        import signal
+
+        for pid in pids:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        raise
+    finally:
+        os.sched_setaffinity(0, orig_affinity)
+
+    return pids
+
+def wait_cmds(pids):
+    """Wait for spawned commands to exit and return their exit codes."""
+    codes = []
+    for pid in pids:
+        _, status = os.waitpid(pid, 0)
+        if os.WIFEXITED(status):
+            codes.append(os.WEXITSTATUS(status))
+        else:
+            codes.append(-os.WTERMSIG(status))
+
+    return codes
+
+def read_spawn_outputs(args_list, codes):
+    outputs = []
+    for args, code, (fd, buf) in zip(args_list, codes, _spawn_outputs):
+        # Offset is left at the end of the output
+        size = min(os.lseek(fd, 0, os.SEEK_CUR), len(buf))
+        os.preadv(fd, [buf], 0)
+        output = buf[:size].decode(errors="replace")
+
+        pr_debug(f"Command exited with return code {code}")
+        if code != 0:
+            raise ValueError(f"Subprocess {args} failed with exit code {code}:\n{output}")
+
+        outputs.append(output)
+
+    return outputs
+
+def run_pinned_cmds(args_list, cpus):
+    """Run commands in parallel, each pinned to a CPU.
+
+    Returns outputs, start time, and end time. Timestamps only cover the time
+    the commands were running, not reading their output.
+    """
+    if WORKLOAD_SPAWN:
+        start_time = time.monotonic_ns()
+        codes = wait_cmds(spawn_cmds(args_list, cpus))
+        end_time = time.monotonic_ns()
+        outputs = read_spawn_outputs(args_list, codes)
     else:
-        raise ValueError(f"Subprocess {args} failed with exit code {proc.returncode}:\n{proc.stdout}")
+        start_time = time.monotonic_ns()
+        outputs = run_cmds([
+            ["taskset", "-c", f"{cpu}", *args]
+            for args, cpu in zip(args_list, cpus)
+        ])
+        end_time = time.monotonic_ns()
+
+    return outputs, start_time, end_time
+
+def open_power_nodes():
+    global _power_current_fd
+    global _power_voltage_fd
+
+    pr_debug(f"Opening power supply nodes for pread: {POWER_CURRENT_NODE}, {POWER_VOLTAGE_NODE}")
+    _power_current_fd = os.open(POWER_CURRENT_NODE, os.O_RDONLY)
+    _power_voltage_fd = os.open(POWER_VOLTAGE_NODE, os.O_RDONLY)
+
+def pread_int(fd):
+    # sysfs regenerates the value on every read from offset 0
+    size = os.preadv(fd, _pread_bufs, 0)
+    # The buffer still holds the previous value, so don't parse it again
+    if size == 0:
+        raise ValueError(f"Empty read from power supply node (fd {fd})")
+
+    # Parse in place to avoid creating intermediate bytes/str objects
+    buf = _pread_buf
+    i = 0
+    negative = buf[0] == 45  # '-'
+    if negative:
+        i = 1
+
+    start = i
+    value = 0
+    while i < size:
+        digit = buf[i] - 48  # '0'
+        if digit < 0 or digit > 9:
+            break
+        value = value * 10 + digit
+        i += 1
+
+    # Match int() for values without digits
+    if i == start:
+        raise ValueError(f"Invalid value from power supply node (fd {fd}): {bytes(buf[:size])!r}")
+
+    return -value if negative else value
 
 def sample_power():
-    ma = int(read_file(POWER_CURRENT_NODE)) * POWER_CURRENT_FACTOR / 1000
-    mv = int(read_file(POWER_VOLTAGE_NODE)) / 1000
+    if POWER_SAMPLE_PREAD:
+        if TRACE:
+            trace_begin(TRACE_READ_CURRENT)
+        ma = pread_int(_power_current_fd) * POWER_CURRENT_FACTOR / 1000
+        if TRACE:
+            trace_end(TRACE_READ_CURRENT)
+            trace_begin(TRACE_READ_VOLTAGE)
+        mv = pread_int(_power_voltage_fd) / 1000
+        if TRACE:
+            trace_end(TRACE_READ_VOLTAGE)
+    else:
+        ma = int(read_file(POWER_CURRENT_NODE, TRACE_READ_CURRENT)) * POWER_CURRENT_FACTOR / 1000
+        mv = int(read_file(POWER_VOLTAGE_NODE, TRACE_READ_VOLTAGE)) / 1000
 
     mw = ma * mv / 1000
     return ma, mv, abs(mw)
 
-def start_power_thread(sample_interval=POWER_SAMPLE_INTERVAL):
+def calibrate_power_gauge():
+    """Measure the fuel gauge's update period and phase by polling it for changes.
+
+    Returns (period_ns, phase_ns) on the monotonic clock, or None if the fuel
+    gauge didn't update often enough to measure.
+    """
+    poll_ns = POWER_CALIBRATION_POLL_INTERVAL * 1000000
+    deadline = time.monotonic_ns()
+    end_ns = deadline + POWER_CALIBRATION_TIME * 1000000000
+
+    edges = []
+    last_reading = None
+    while deadline < end_ns:
+        delay = deadline - time.monotonic_ns()
+        if delay > 0:
+            time.sleep(delay / 1e9)
+
+        now = time.monotonic_ns()
+        current, voltage, _ = sample_power()
+        if last_reading is not None and (current, voltage) != last_reading:
+            edges.append(now)
+        last_reading = (current, voltage)
+
+        deadline += poll_ns
+
+    pr_debug(f"Detected {len(edges)} fuel gauge updates in {POWER_CALIBRATION_TIME} seconds")
+    if len(edges) < 3:
+        return None
+
+    # Updates are missed when the value doesn't change, so only the shortest
+    # gaps reflect the real period. Gaps that are too short to resolve are noise.
+    gaps = sorted(gap for gap in (b - a for a, b in zip(edges, edges[1:])) if gap > poll_ns * 2)
+    if len(gaps) < 2:
+        return None
+    short_gaps = [gap for gap in gaps if gap < gaps[len(gaps) // 4] * 1.5]
+    period_ns = short_gaps[len(short_gaps) // 2]
+
+    # Refine the period over the whole span to average out polling jitter
+    span_periods = round((edges[-1] - edges[0]) / period_ns)
+    period_ns = (edges[-1] - edges[0]) // span_periods
+
+    # Phase is the median offset of all edges, wrapped around the first one
+    offsets = sorted((edge - edges[0] + period_ns // 2) % period_ns - period_ns // 2 for edge in edges)
+    phase_ns = edges[0] + offsets[len(offsets) // 2]
+
+    return period_ns, phase_ns
+
+def start_power_thread(sample_interval=None):
+    if sample_interval is None:
+        sample_interval = POWER_SAMPLE_INTERVAL
+
     def _power_thread():
         global _power_samples
 
-        sample_dest = _prealloc_samples
+        sample_dest = _sample_buffer
+        sample_dest.reset()
+
+        # Samples are scheduled against absolute deadlines so that read latency
+        # doesn't accumulate into drift over long runs
+        interval_ns = sample_interval * 1000000
+        deadline = start_ns + interval_ns
+        missed = 0
+        jitter_sum = 0
+        jitter_max = 0
+
+        # With a calibrated fuel gauge, wake up just after each expected update.
+        # Unchanged values are kept unless timing shows that no update happened
+        # since the last sample, since fuel gauges can report the same value twice.
+        dedup = POWER_GAUGE_PERIOD_NS is not None
+        stale = 0
+        last_ns = None
+        last_current = None
+        last_voltage = None
+        if dedup:
+            period_ns = POWER_GAUGE_PERIOD_NS
+            margin_ns = POWER_SAMPLE_UPDATE_MARGIN * 1000000
+            poll_ns = POWER_CALIBRATION_POLL_INTERVAL * 1000000
+            probe_ns = min(POWER_SAMPLE_PROBE_TIME * 1000000, period_ns // 2)
+            interval_ns = max(1, round(interval_ns / period_ns)) * period_ns
+            # Time of a fuel gauge update, re-anchored when updates are observed late
+            update_ns = POWER_GAUGE_PHASE_NS
+            phase_ns = update_ns + margin_ns
+            deadline = phase_ns - (phase_ns - deadline) // period_ns * period_ns
+
+        trace = _trace_sampler if TRACE else None
 
         count = 0
         while True:
             # Sleep before first sample to avoid a low first reading
-            time.sleep(sample_interval / 1000)
+            delay = deadline - time.monotonic_ns()
+            if delay > 0:
+                time.sleep(delay / 1e9)
 
             # Check stop flag immediately after sleep to avoid a low last reading
             if _stop_power_mon:
                 pr_debug("Stopping power monitor due to global stop flag")
                 break
 
+            if trace:
+                trace.add(TRACE_BEGIN, TRACE_SAMPLE)
+            now = time.monotonic_ns()
             current, voltage, power = sample_power()
-            pr_debug(f"Power: {power} mW\t(sample {count} from {current} mA * {voltage} mV)")
-
-            try:
-                sample_dest[count] = power
-            except IndexError:
-                pr_debug("Pre-allocated sample slots exhausted, falling back to dynamic allocation")
-                # If out of pre-allocated slots
-                sample_dest.append(power)
+            if trace:
+                trace.add(TRACE_END, TRACE_SAMPLE)
+
+            jitter = now - deadline
+            jitter_sum += jitter
+            if jitter > jitter_max:
+                jitter_max = jitter
+
+            keep = True
+            if dedup and current == last_current and voltage == last_voltage:
+                if (now - update_ns) // period_ns == (last_ns - update_ns) // period_ns:
+                    # No update was due since the last sample, e.g. because it was late
+                    keep = False
+                else:
+                    # Either a repeated value or a read just before a late update.
+                    # Poll briefly to tell them apart.
+                    probe_end = now + probe_ns
+                    while time.monotonic_ns() + poll_ns <= probe_end and not _stop_power_mon:
+                        time.sleep(poll_ns / 1e9)
+                        probe_now = time.monotonic_ns()
+                        reading = sample_power()
+                        if reading[0] != current or reading[1] != voltage:
+                            # The update came late: use the new value, and re-anchor
+                            # the phase to when it was observed
+                            now = probe_now
+                            current, voltage, power = reading
+                            update_ns = probe_now - poll_ns // 2
+                            phase_ns = update_ns + margin_ns
+                            deadline = phase_ns + (now - phase_ns) // interval_ns * interval_ns
+                            stale += 1
+                            if trace:
+                                trace.add(TRACE_INSTANT, TRACE_SAMPLE_STALE)
+                            break
+
+            if keep:
+                sample_dest.append(now, current, voltage, power)
+                last_ns = now
+                last_current = current
+                last_voltage = voltage
+                # Avoid formatting the message at all in optimized mode
+                if __debug__:
+                    pr_debug(f"Power: {power} mW\t(sample {count} from {current} mA * {voltage} mV)")
+            else:
+                stale += 1
+                if trace:
+                    trace.add(TRACE_INSTANT, TRACE_SAMPLE_STALE)
+
+            # Skip deadlines that have already passed instead of sampling in a burst
+            deadline += interval_ns
+            now = time.monotonic_ns()
+            if deadline <= now:
+                skipped = (now - deadline) // interval_ns + 1
+                missed += skipped
+                deadline += skipped * interval_ns
+                if trace:
+                    trace.add(TRACE_INSTANT, TRACE_MISSED_DEADLINE)
 
             count += 1
 
-        if count < len(sample_dest):
-            pr_debug(f"Truncating to first {count} samples from pre-allocated array")
-            _power_samples = sample_dest[:count]
+        # Measurements shorter than the sample interval still need a reading
+        if count == 0:
+            current, voltage, power = sample_power()
+            sample_dest.append(time.monotonic_ns(), current, voltage, power)
+            count = 1
+
+        if sample_dest.spilled:
+            pr_debug(f"Pre-allocated sample slots exhausted, read back {sample_dest.spilled} spilled samples")
+        pr_debug(f"Collecting {count} samples from pre-allocated arrays")
+        _power_samples = sample_dest.collect()
+        _power_samples["start_ns"] = start_ns
+        _power_samples["sample_interval"] = sample_interval
+        _power_samples["jitter_mean_ms"] = jitter_sum / count / 1e6 if count else 0
+        _power_samples["jitter_max_ms"] = jitter_max / 1e6
+        _power_samples["missed_deadlines"] = missed
+        _power_samples["stale_samples"] = stale
 
     pr_debug("Starting power monitor thread")
+    start_ns = time.monotonic_ns()
     thread = threading.Thread(target=_power_thread, daemon=True)
     thread.start()
     return thread
@@ -178,40 +773,489 @@ def stop_power_thread(thread):
     global _stop_power_mon
 
     pr_debug("Setting flag to stop power monitor")
+    end_ns = time.monotonic_ns()
     _stop_power_mon = True
     pr_debug("Waiting for power monitor to stop")
     thread.join()
     _stop_power_mon = False
 
+    _power_samples["end_ns"] = end_ns
     return _power_samples
 
-def write_cpu(cpu, node, content):
+def coremark_args(iterations):
+    # CoreMark PERFORMANCE_RUN params
+    return ["coremark", "0x0", "0x0", "0x66", str(iterations), "7", "1", "2000"]
+
+def parse_coremark(cm_out, iterations, elapsed_sec):
+    """Extract the score and iterations from CoreMark output, or None if it ran too fast."""
+    # Parsed without re to avoid importing it
+    score_start = cm_out.find("CoreMark 1.0 : ")
+    score_end = cm_out.find(" / ", score_start)
+    if score_start == -1 or score_end == -1:
+        if "Must execute for at least 10 secs" in cm_out:
+            return None
+
+        print(cm_out, file=sys.stderr)
+        raise ValueError("Failed to parse CoreMark output")
+
+    score = float(cm_out[score_start + len("CoreMark 1.0 : "):score_end])
+    for line in cm_out.splitlines():
+        key, _, value = line.partition(":")
+        if key.strip() == "Iterations":
+            return score, int(value)
+
+    raise ValueError("Failed to parse CoreMark iterations")
+
+def memwrite_args(mib):
+    # Reading from /dev/zero clears the user buffer in the kernel, which streams
+    # through memory because the buffer is much larger than the caches
+    return ["dd", "if=/dev/zero", "of=/dev/null", "bs=64M", f"count={mib // 64}"]
+
+def memcpy_args(mib):
+    # Copies between 64 MiB buffers, so every copy reads and writes memory
+    return ["bench_kernels", "memcpy", str(mib)]
+
+def fma_args(mflop):
+    return ["bench_kernels", "fma", str(mflop)]
+
+def inflate_args(mib):
+    # Huffman decoding is dominated by unpredictable branches
+    return ["gunzip", "-t", *[f"{WORKLOAD_DATA_FILE}.gz"] * (mib // WORKLOAD_DATA_MIB)]
+
+def parse_throughput(output, work, elapsed_sec):
+    return work / elapsed_sec, work
+
+def init_workload_data():
+    # Only needed for this workload, so don't import it at startup
+    import random
+
+    # Seeded pseudo-random text with skewed letter frequencies, so that the data
+    # compresses with varied Huffman codes and is identical across runs
+    size = WORKLOAD_DATA_MIB * 1024 * 1024
+    alphabet = b"eeeeeettttaaaooiinnsshhrrdlcumwfgypbvk       \n"
+    table = bytes(alphabet[i % len(alphabet)] for i in range(256))
+    data = random.Random(0).getrandbits(size * 8).to_bytes(size, "little").translate(table)
+
+    with open(WORKLOAD_DATA_FILE, "wb") as f:
+        f.write(data)
+
+    # busybox gzip may not support -k, so write the compressed file from stdout
+    import subprocess
+    with open(f"{WORKLOAD_DATA_FILE}.gz", "wb") as f:
+        subprocess.run(["gzip", "-9c", WORKLOAD_DATA_FILE], stdout=f, check=True)
+
+# Benchmark workloads
+# Each workload runs a command for an amount of work, which is scaled per
+# frequency to hit the target run time. Scores are in units of work per second.
+WORKLOADS = {
+    # Compute-bound, fits in L1/L2 caches
+    "coremark": {
+        "args": coremark_args,
+        "parse": parse_coremark,
+        "units": "iter/s",
+        "work_quantum": 1,
+        "default_work": COREMARK_ITERATIONS,
+        "calibration_work": COREMARK_CALIBRATION_ITERATIONS,
+        "min_time": COREMARK_MIN_TIME,
+        "setup": None,
+    },
+    # Memory-bound streaming writes (kernel zero-fill)
+    "memwrite": {
+        "args": memwrite_args,
+        "parse": parse_throughput,
+        "units": "MiB/s",
+        "work_quantum": 64,
+        "default_work": 64 * 256,
+        "calibration_work": 256,
+        "min_time": 0,
+        "setup": None,
+    },
+    # Memory-bound streaming reads and writes
+    "memcpy": {
+        "args": memcpy_args,
+        "parse": parse_throughput,
+        "units": "MiB/s",
+        "work_quantum": 64,
+        "default_work": 64 * 128,
+        "calibration_work": 256,
+        "min_time": 0,
+        "setup": None,
+    },
+    # FP/SIMD-bound, independent vector FMAs in registers
+    "fma": {
+        "args": fma_args,
+        "parse": parse_throughput,
+        "units": "MFLOP/s",
+        "work_quantum": 100,
+        "default_work": 100 * 2000,
+        "calibration_work": 500,
+        "min_time": 0,
+        "setup": None,
+    },
+    # Branch-heavy decompression
+    "inflate": {
+        "args": inflate_args,
+        "parse": parse_throughput,
+        "units": "MiB/s",
+        "work_quantum": WORKLOAD_DATA_MIB,
+        "default_work": WORKLOAD_DATA_MIB * 256,
+        "calibration_work": WORKLOAD_DATA_MIB * 2,
+        "min_time": 0,
+        "setup": init_workload_data,
+    },
+}
+
+def calibrate_workload(workload, cpu):
+    """Estimate workload performance (work/s) with a short run on the given CPU."""
+    work = workload["calibration_work"]
+    _, start_time, end_time = run_pinned_cmds([workload["args"](work)], [cpu])
+
+    # Includes launch overhead, so this underestimates performance and errs on the side of longer runs
+    return work / ((end_time - start_time) / 1e9)
+
+def get_workload_work(workload, est_score):
+    if not COREMARK_TARGET_TIME:
+        return workload["default_work"]
+
+    # Leave some margin above the minimum for estimation errors
+    target_time = max(COREMARK_TARGET_TIME, workload["min_time"] * 1.2)
+    quantum = workload["work_quantum"]
+    return (int(est_score * target_time) // quantum + 1) * quantum
+
+def run_workload(workload, cores, work, base_power):
+    """Run a workload on each core in parallel while sampling power.
+
+    Returns power stats, per-core scores, and the total amount of work done.
+    """
+    while True:
+        thread = start_power_thread()
+        outputs, start_time, end_time = run_pinned_cmds(
+            [workload["args"](work) for _ in cores],
+            cores,
+        )
+        power_samples = stop_power_thread(thread)
+
+        pr_debug(outputs)
+        elapsed_sec = (end_time - start_time) / 1e9
+
+        # Extract score and work done
+        core_results = [workload["parse"](output, work, elapsed_sec) for output in outputs]
+        if None not in core_results:
+            break
+        elif not COREMARK_TARGET_TIME:
+            raise ValueError("Benchmark ran too fast; increase the amount of work and try again")
+
+        # Performance estimate was too far off, so retry based on the real performance
+        work = get_workload_work(workload, work / elapsed_sec)
+        pr_debug(f"Workload ran too fast, retrying with {work} units of work")
+
+    # Adjust for base power usage
+    power_samples["power"] = [sample - base_power for sample in power_samples["power"]]
+
+    # Calculate power values over the real time axis
+    stats = create_power_stats(start_time, end_time, power_samples)
+    core_scores = [core_score for core_score, _ in core_results]
+    total_work = sum(core_work for _, core_work in core_results)
+    return stats, core_scores, total_work
+
+def write_cpu(cpu, node, content, trace_name=None):
     pr_debug(f"Writing CPU value: cpu{cpu}/{node} => {content}")
+    if TRACE:
+        if trace_name is None:
+            trace_name = f"write cpu{cpu}/{node}"
+        trace_begin(trace_name)
+
     with open(f"{SYS_CPU}/cpu{cpu}/{node}", "w") as f:
         f.write(content)
 
-def read_file(node):
+    if TRACE:
+        trace_end(trace_name)
+
+def read_file(node, trace_name=None):
+    if TRACE:
+        if trace_name is None:
+            trace_name = f"read {node}"
+        trace_begin(trace_name)
+
     with open(node, "r") as f:
         content = f.read().strip()
         pr_debug(f"Reading file: {node} = {content}")
-        return content
 
-def create_power_stats(time_ns, samples):
+    if TRACE:
+        trace_end(trace_name)
+    return content
+
+def window_range(start_ns, end_ns, times):
+    """Indices of the first sample in [start_ns, end_ns] and the first one after it."""
+    count = len(times)
+    first = 0
+    while first < count and times[first] < start_ns:
+        first += 1
+
+    end = first
+    while end < count and times[end] <= end_ns:
+        end += 1
+
+    return first, end
+
+def power_at(times, samples, i, t):
+    """Power at time t, interpolated between samples i - 1 and i, or held if either is missing."""
+    if i == 0:
+        return samples[0]
+    if i == len(samples):
+        return samples[-1]
+
+    t0 = times[i - 1]
+    return samples[i - 1] + (samples[i] - samples[i - 1]) * (t - t0) / (times[i] - t0)
+
+def integrate_power(start_ns, end_ns, times, samples):
+    """Integrate power samples (mW) over time (ns) with the trapezoidal rule to get mJ.
+
+    Samples outside the window, e.g. taken after a workload exited but before
+    the sampler stopped, are only used to interpolate power at its edges.
+    """
+    if not samples:
+        raise ValueError("No power samples were collected; increase the measurement time")
+
+    first, end = window_range(start_ns, end_ns, times)
+    last_time = start_ns
+    last_power = power_at(times, samples, first, start_ns)
+    energy = 0
+    for i in range(first, end):
+        energy += (last_power + samples[i]) / 2 * (times[i] - last_time)
+        last_time = times[i]
+        last_power = samples[i]
+
+    energy += (last_power + power_at(times, samples, end, end_ns)) / 2 * (end_ns - last_time)
+    return energy / 1e9
+
+def power_ci95(samples):
+    """Mean and 95% confidence interval half-width of the mean of power samples."""
+    count = len(samples)
+    mean = sum(samples) / count
+    if count < 2:
+        return mean, None
+
+    variance = sum((sample - mean) ** 2 for sample in samples) / (count - 1)
+    df = count - 1
+    t = T_CRITICAL_95[df] if df < len(T_CRITICAL_95) else 1.96
+    return mean, t * (variance / count) ** 0.5
+
+def median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    else:
+        return (values[mid - 1] + values[mid]) / 2
+
+def measure_power_until_converged(max_time, window=None):
+    """Sample power until the mean converges or max_time (sec) passes.
+
+    If window is set, only the most recent samples are considered, which is
+    useful for detecting when power usage has settled. Convergence is checked
+    once the window is full, even if it's smaller than the usual minimum.
+    Besides a tight confidence interval, the means of the older and newer
+    halves of the samples must differ by less than the interval, so that
+    steady drift (e.g. from heating up) doesn't count as converged.
+    """
+    thread = start_power_thread()
+    end_ns = time.monotonic_ns() + int(max_time * 1e9)
+    poll_time = POWER_SAMPLE_INTERVAL / 1000
+
+    converged = False
+    while True:
+        remaining = (end_ns - time.monotonic_ns()) / 1e9
+        if remaining <= 0:
+            break
+        time.sleep(min(poll_time, remaining))
+
+        # The sample buffer can only be inspected safely before it spills
+        buf = _sample_buffer
+        count = buf.count
+        if buf.spilled:
+            continue
+
+        start = max(0, count - window) if window else 0
+        if count - start < (window or POWER_CONVERGENCE_MIN_SAMPLES):
+            continue
+
+        recent = buf.power[start:count]
+        mean, ci = power_ci95(recent)
+        if ci > abs(mean) * POWER_CONVERGENCE_PRECISION:
+            continue
+
+        half = len(recent) // 2
+        drift = sum(recent[half:]) / (len(recent) - half) - sum(recent[:half]) / half
+        if abs(drift) <= ci:
+            converged = True
+            break
+
+    samples = stop_power_thread(thread)
+    samples["converged"] = converged
+    return samples
+
+def create_power_stats(start_ns, end_ns, samples):
+    time_ns = end_ns - start_ns
     sec = time_ns / 1e9
 
-    power = statistics.mean(samples)
-    mj = power * sec
+    power_samples = samples["power"]
+    mj = integrate_power(start_ns, end_ns, samples["time_ns"], power_samples)
+    power = mj / sec
     joules = mj / 1000
+    first, end = window_range(start_ns, end_ns, samples["time_ns"])
+    _, ci = power_ci95(power_samples[first:end]) if end > first else (None, None)
 
     return {
         "elapsed_sec": sec,
         "elapsed_ns": time_ns,
-        "power_samples": samples,
+        "power_samples": list(power_samples),
+        "power_sample_times": [(t - start_ns) / 1e9 for t in samples["time_ns"]],
+        "power_sample_currents": list(samples["current"]),
+        "power_sample_voltages": list(samples["voltage"]),
         "power_mean": power,
+        "power_ci95": ci,
         "energy_millijoules": mj,
         "energy_joules": joules,
+        "sample_jitter_mean_ms": samples["jitter_mean_ms"],
+        "sample_jitter_max_ms": samples["jitter_max_ms"],
+        "missed_sample_deadlines": samples["missed_deadlines"],
+        "stale_samples_dropped": samples["stale_samples"],
     }
 
+def iter_power_stats(data):
+    yield data["housekeeping"]
+    for cpu_data in data["cpus"].values():
+        for freq_data in cpu_data["freqs"].values():
+            yield freq_data["idle"]
+            yield freq_data["active"]
+            yield from freq_data.get("workloads", {}).values()
+
+def write_samples(data, path):
+    """Move raw samples from all power stats into a sidecar file.
+
+    Each set of stats gets a reference to the offset, count, and columns of its samples.
+    """
+    with open(path, "wb") as f:
+        f.write(SAMPLES_MAGIC)
+        for stats in iter_power_stats(data):
+            stats["samples"] = {
+                "offset": f.tell(),
+                "count": len(stats["power_samples"]),
+                "columns": SAMPLE_COLUMNS,
+            }
+
+            for key in SAMPLE_COLUMNS:
+                column = array("d", stats.pop(key))
+                if sys.byteorder == "big":
+                    column.byteswap()
+                column.tofile(f)
+
+    data["samples_file"] = os.path.basename(path)
+
+def journal_config():
+    """Settings that affect results, which must match for a journal to be resumed."""
+    return (
+        BENCH_CORES,
+        tuple(BENCH_WORKLOADS),
+        BENCH_OPPS,
+        # The automatic interval depends on fuel gauge calibration, which can vary slightly between boots
+        POWER_SAMPLE_INTERVAL if POWER_SAMPLE_INTERVAL_OVERRIDDEN else 0,
+        COREMARK_TARGET_TIME,
+    )
+
+def load_journal(path):
+    """Read completed frequencies from a journal as {cpu: {freq: freq_data}}."""
+    completed = {}
+    if not path or not os.path.exists(path):
+        return completed
+
+    with open(path, "rb") as f:
+        try:
+            header = marshal.load(f)
+        except (EOFError, ValueError, TypeError):
+            header = None
+        if not isinstance(header, tuple) or header[:2] != ("freqbench-journal", JOURNAL_VERSION):
+            print(f"Ignoring incompatible journal: {path}")
+            return completed
+        if header[2:] != (journal_config(),):
+            print(f"Ignoring journal from a run with different settings: {path}")
+            return completed
+
+        while True:
+            try:
+                cpu, freq, freq_data = marshal.load(f)
+            except (EOFError, ValueError, TypeError):
+                # End of journal, or a record torn by a crash while it was being written
+                break
+
+            completed.setdefault(cpu, {})[freq] = freq_data
+
+    return completed
+
+def open_journal(completed):
+    # Rewrite the journal to drop any torn records at the end
+    f = open(JOURNAL_FILE, "wb")
+    marshal.dump(("freqbench-journal", JOURNAL_VERSION, journal_config()), f)
+    for cpu, freqs_data in completed.items():
+        for freq, freq_data in freqs_data.items():
+            marshal.dump((cpu, freq, freq_data), f)
+
+    f.flush()
+    return f
+
+def append_journal(journal, cpu, freq, freq_data):
+    marshal.dump((cpu, freq, freq_data), journal)
+    journal.flush()
+
+def persist_journal():
+    if not PERSIST_JOURNAL_FILE:
+        return
+
+    pr_debug(f"Copying journal to {PERSIST_JOURNAL_FILE}")
+    # Replace atomically so that a crash never leaves a truncated copy behind
+    tmp_path = f"{PERSIST_JOURNAL_FILE}.new"
+    with open(JOURNAL_FILE, "rb") as src, open(tmp_path, "wb") as dst:
+        dst.write(src.read())
+        dst.flush()
+        os.fsync(dst.fileno())
+
+    os.replace(tmp_path, PERSIST_JOURNAL_FILE)
+    os.sync()
+
+def parse_opp_selection(spec):
+    """Parse OPP selectors into {cpu: [(min_freq, max_freq), ...]}.
+
+    Selectors are separated by spaces or commas:
+      cpu                    all frequencies of the CPU
+      cpu.freq               a single frequency (kHz)
+      cpu.min_freq-max_freq  an inclusive range of frequencies (kHz)
+    """
+    selection = {}
+    for opp in spec.replace(",", " ").split():
+        cpu, _, freqs = opp.partition(".")
+        cpu = int(cpu)
+        if not freqs:
+            freq_range = (0, float("inf"))
+        else:
+            min_freq, _, max_freq = freqs.partition("-")
+            freq_range = (int(min_freq), int(max_freq or min_freq))
+
+        selection.setdefault(cpu, []).append(freq_range)
+
+    return selection
+
+def select_freqs(cpu, freqs, selection):
+    if selection is None:
+        return freqs
+
+    ranges = selection.get(cpu, [])
+    for min_freq, max_freq in ranges:
+        if min_freq == max_freq and min_freq not in freqs:
+            print(f"Warning: selected frequency {min_freq} kHz is not available on CPU {cpu}")
+
+    return [freq for freq in freqs if any(min_freq <= freq <= max_freq for min_freq, max_freq in ranges)]
+
 def get_cpu_freqs(cpu):
     raw_freqs = read_file(f"{SYS_CPU}/cpu{cpu}/cpufreq/scaling_available_frequencies").split(" ")
     boost_node = f"{SYS_CPU}/cpu{cpu}/cpufreq/scaling_boost_frequencies"
@@ -227,6 +1271,9 @@ def get_cpu_freqs(cpu):
 def init_cpus():
     print("Frequency domains: ", end="", flush=True)
     bench_cpus = []
+    domain_cpus = {}
+    # All CPUs in each domain, including the housekeeping CPU, for postprocessing
+    related_domain_cpus = {}
     for policy_dir in sorted(os.listdir(f"{SYS_CPU}/cpufreq")):
         if policy_dir.startswith("policy"):
             first_cpu = int(policy_dir[len("policy"):])
@@ -235,13 +1282,24 @@ def init_cpus():
 
             print(f"cpu{first_cpu}", end=" ", flush=True)
             bench_cpus.append(first_cpu)
+
+            # The benchmarked CPU goes first, and the housekeeping CPU is never used
+            related_cpus = [int(cpu) for cpu in read_file(f"{SYS_CPU}/cpufreq/{policy_dir}/related_cpus").split()]
+            related_domain_cpus[first_cpu] = related_cpus
+            domain_cpus[first_cpu] = [first_cpu] + [
+                cpu for cpu in related_cpus if cpu != first_cpu and cpu != HOUSEKEEPING_CPU
+            ]
         else:
             pr_debug(f"Unrecognized file/dir in cpufreq: {policy_dir}")
             continue
     print()
 
     print("Offline CPUs: ", end="", flush=True)
-    cpu_count = len(re.findall(r'processor\s+:\s+\d+', read_file("/proc/cpuinfo")))
+    cpu_count = 0
+    for line in read_file("/proc/cpuinfo").splitlines():
+        key, _, value = line.partition(":")
+        if key.strip() == "processor" and value.strip().isdigit():
+            cpu_count += 1
 
     for cpu in range(cpu_count):
         if cpu == HOUSEKEEPING_CPU:
@@ -258,7 +1316,7 @@ def init_cpus():
     write_cpu(HOUSEKEEPING_CPU, "cpufreq/scaling_setspeed", str(min_freq))
     pr_debug()
 
-    return bench_cpus, cpu_count
+    return bench_cpus, domain_cpus, related_domain_cpus, cpu_count
 
 def check_charging(node, charging_value, charging_warned):
     if os.path.exists(node):
@@ -278,6 +1336,10 @@ def check_charging(node, charging_value, charging_warned):
 
 def init_power():
     global POWER_CURRENT_FACTOR
+    global POWER_SAMPLE_INTERVAL
+    global POWER_GAUGE_PERIOD_NS
+    global POWER_GAUGE_PHASE_NS
+    global _sample_buffer
 
     pr_debug(f"Using power supply: {POWER_SUPPLY}")
 
@@ -297,20 +1359,47 @@ def init_power():
         POWER_CURRENT_FACTOR = 1000
     pr_debug(f"Scaling current by {POWER_CURRENT_FACTOR}x (derived from initial sample: {ref_current})")
 
+    if POWER_SAMPLE_PREAD:
+        open_power_nodes()
+
+    pr_debug("Waiting for power usage to settle")
+    time.sleep(5)
+
+    # Calibrating also gives power usage more time to settle
+    pr_debug("Calibrating fuel gauge update cadence")
+    trace_begin("calibrate fuel gauge")
+    calibration = calibrate_power_gauge()
+    trace_end("calibrate fuel gauge")
+    if calibration is None:
+        print("Failed to detect fuel gauge update cadence, using default sample interval")
+        pr_debug(f"Power sample interval adjusted for power supply: {psy_name}")
+    else:
+        POWER_GAUGE_PERIOD_NS, POWER_GAUGE_PHASE_NS = calibration
+        period_ms = POWER_GAUGE_PERIOD_NS / 1e6
+        print(f"Fuel gauge updates every {period_ms:.1f} ms")
+
+        if not POWER_SAMPLE_INTERVAL_OVERRIDDEN:
+            updates = max(1, -(-POWER_SAMPLE_MIN_INTERVAL // period_ms))
+            POWER_SAMPLE_INTERVAL = round(updates * period_ms)
+
+    # Calculate prealloc slots now that the interval is known
+    prealloc_slots = int(PREALLOC_SECONDS / (POWER_SAMPLE_INTERVAL / 1000))
+    spill_prealloc_slots = int(SPILL_PREALLOC_SECONDS / (POWER_SAMPLE_INTERVAL / 1000))
+    _sample_buffer = PowerSampleBuffer(prealloc_slots, POWER_SPILL_FILE, spill_prealloc_slots)
+
     print(f"Sampling power every {POWER_SAMPLE_INTERVAL} ms")
-    pr_debug(f"Pre-allocated {PREALLOC_SLOTS} sample slots for {PREALLOC_SECONDS} seconds")
-    pr_debug(f"Power sample interval adjusted for power supply: {psy_name}")
+    pr_debug(f"Pre-allocated {prealloc_slots} sample slots for {PREALLOC_SECONDS} seconds")
     print("Baseline power usage: ", end="", flush=True)
-    pr_debug("Waiting for power usage to settle")
-    time.sleep(15)
     pr_debug()
 
     pr_debug("Measuring base power usage with only housekeeping CPU")
     # The power used for sampling might affect results here, so sample less often
+    trace_begin("base power")
     thread = start_power_thread(sample_interval=POWER_SAMPLE_INTERVAL * 2)
     time.sleep(60)
     base_power_samples = stop_power_thread(thread)
-    base_power = statistics.median(base_power_samples)
+    trace_end("base power")
+    base_power = median(base_power_samples["power"])
     print(f"{base_power:.0f} mW")
     print()
 
@@ -322,11 +1411,51 @@ def main():
     print(BANNER)
     pr_debug("Running in debug mode")
 
+    if TRACE:
+        init_trace()
+
     pr_debug("Initializing CPU states")
-    bench_cpus, cpu_count = init_cpus()
+    trace_begin("init CPUs")
+    bench_cpus, domain_cpus, related_domain_cpus, cpu_count = init_cpus()
+    trace_end("init CPUs")
+
+    opp_selection = None
+    if BENCH_OPPS:
+        opp_selection = parse_opp_selection(BENCH_OPPS)
+        bench_cpus = [cpu for cpu in bench_cpus if cpu in opp_selection]
+        print(f"Benchmarking selected frequencies: {BENCH_OPPS}")
+        for cpu in opp_selection.keys() - set(bench_cpus):
+            print(f"Warning: selected CPU {cpu} is not the first CPU of any frequency domain")
+
+    for name in BENCH_WORKLOADS:
+        if name not in WORKLOADS:
+            raise ValueError(f"Unknown workload: {name}")
+
+        if WORKLOADS[name]["setup"]:
+            pr_debug(f"Preparing data for workload: {name}")
+            WORKLOADS[name]["setup"]()
+
+    # Without calibration, the first run of each workload is measured, so load
+    # subprocess for run_cmds() now instead of in the middle of that run
+    if not WORKLOAD_SPAWN and not COREMARK_TARGET_TIME:
+        __import__("subprocess")
 
     pr_debug("Initializing power measurements")
+    trace_begin("init power")
     base_power, base_power_samples = init_power()
+    trace_end("init power")
+
+    # Settling must be able to converge within FREQ_SETTLE_TIME, so the window
+    # covers at most half of it at the sample interval
+    settle_window = max(2, FREQ_SETTLE_TIME * 1000 // POWER_SAMPLE_INTERVAL // 2)
+    pr_debug(f"Checking whether power usage has settled over {settle_window} samples")
+
+    completed = load_journal(PERSIST_JOURNAL_FILE)
+    resumed_count = sum(len(freqs_data) for freqs_data in completed.values())
+    if resumed_count:
+        print(f"Resuming interrupted benchmark with {resumed_count} completed frequencies")
+    journal = open_journal(completed)
+    last_persist_time = time.monotonic()
 
     pr_debug("Starting benchmark")
     pr_debug()
@@ -340,12 +1469,27 @@ def main():
             "freqs": {}
         }
         cpus_data[cpu] = cpu_data
+        cpu_completed = completed.get(cpu, {})
+        trace_begin(f"cpu{cpu}")
 
         pr_debug("Onlining CPU")
+        trace_begin("online")
         write_cpu(cpu, "online", "1")
 
+        cores = domain_cpus[cpu]
+        if BENCH_CORES:
+            cores = cores[:BENCH_CORES]
+        if len(cores) > 1:
+            print(f"Cores: {' '.join(str(core) for core in cores)}")
+            pr_debug("Onlining other cores in frequency domain")
+            for core in cores[1:]:
+                write_cpu(core, "online", "1")
+        trace_end("online")
+
         pr_debug("Setting governor")
+        trace_begin("set governor")
         write_cpu(cpu, "cpufreq/scaling_governor", "userspace")
+        trace_end("set governor")
 
         pr_debug("Getting frequencies")
         freqs = get_cpu_freqs(cpu)
@@ -354,6 +1498,7 @@ def main():
 
         # Some kernels may change the defaults
         pr_debug("Setting frequency limits")
+        trace_begin("set limits")
         write_cpu(cpu, "cpufreq/scaling_min_freq", str(min(freqs)))
         write_cpu(cpu, "cpufreq/scaling_max_freq", str(max(freqs)))
         # Sometimes, reading back the limits immediately may give an incorrect result
@@ -361,72 +1506,104 @@ def main():
         time.sleep(1)
 
         # Bail out if the kernel is clamping our values
+        trace_end("set limits")
         pr_debug("Validating frequency limits")
+        trace_begin("validate limits")
         real_min_freq = int(read_file(f"{SYS_CPU}/cpu{cpu}/cpufreq/scaling_min_freq"))
         if real_min_freq != min(freqs):
             raise ValueError(f"Minimum frequency setting {min(freqs)} rejected by kernel; got {real_min_freq}")
         real_max_freq = int(read_file(f"{SYS_CPU}/cpu{cpu}/cpufreq/scaling_max_freq"))
         if real_max_freq != max(freqs):
             raise ValueError(f"Maximum frequency setting {max(freqs)} rejected by kernel; got {real_max_freq}")
-
-        for freq in freqs:
+        trace_end("validate limits")
+
+        # Intern trace names used for every frequency in advance, so tracing
+        # doesn't format names or grow the name table between measurements
+        freq_trace_ids = {freq: trace_id(f"{freq} kHz") for freq in freqs}
+        calibrate_trace_ids = {name: trace_id(f"calibrate {name}") for name in ["coremark", *BENCH_WORKLOADS]}
+        setspeed_trace_id = trace_id(f"write cpu{cpu}/cpufreq/scaling_setspeed")
+        cur_freq_node = f"{SYS_CPU}/cpu{cpu}/cpufreq/scaling_cur_freq"
+        cur_freq_trace_id = trace_id(f"read {cur_freq_node}")
+
+        last_freq = None
+        last_scores = {}
+        for freq in select_freqs(cpu, freqs, opp_selection):
             mhz = freq / 1000
             print(f"{int(mhz):4d}: ", end="", flush=True)
-            write_cpu(cpu, "cpufreq/scaling_setspeed", str(freq))
+
+            if freq in cpu_completed:
+                freq_data = cpu_data["freqs"][freq] = cpu_completed[freq]
+                last_freq = freq
+                last_scores["coremark"] = freq_data["active"]["coremark_score"]
+                for name, workload_data in freq_data.get("workloads", {}).items():
+                    last_scores[name] = workload_data["score"]
+                print("completed in previous run")
+                continue
+
+            trace_begin(freq_trace_ids[freq])
+            trace_begin("set frequency")
+            write_cpu(cpu, "cpufreq/scaling_setspeed", str(freq), setspeed_trace_id)
 
             pr_debug("Waiting for frequency to settle")
             time.sleep(0.1)
 
             pr_debug("Validating frequency")
-            real_freq = int(read_file(f"{SYS_CPU}/cpu{cpu}/cpufreq/scaling_cur_freq"))
+            real_freq = int(read_file(cur_freq_node, cur_freq_trace_id))
             if real_freq != freq:
                 raise ValueError(f"Frequency setting is {freq} but kernel is using {real_freq}")
+            trace_end("set frequency")
+
+            workloads_work = {}
+            for name in ["coremark", *BENCH_WORKLOADS]:
+                workload = WORKLOADS[name]
+                if not COREMARK_TARGET_TIME:
+                    # Fixed amount of work
+                    est_score = None
+                elif name not in last_scores:
+                    pr_debug(f"Estimating {name} performance with a short run")
+                    trace_begin(calibrate_trace_ids[name])
+                    est_score = calibrate_workload(workload, cpu)
+                    trace_end(calibrate_trace_ids[name])
+                else:
+                    # Assume performance scales linearly with frequency
+                    # Memory-bound slowdowns only make the run longer than the target
+                    est_score = last_scores[name] * freq / last_freq
+
+                workloads_work[name] = get_workload_work(workload, est_score)
+                pr_debug(f"Running {name} with {workloads_work[name]} units of work")
 
             pr_debug("Waiting for power usage to settle")
-            time.sleep(3)
+            trace_begin("settle")
+            settle_samples = measure_power_until_converged(FREQ_SETTLE_TIME, window=settle_window)
+            settle_sec = (settle_samples["end_ns"] - settle_samples["start_ns"]) / 1e9
+            trace_end("settle")
 
             pr_debug("Measuring idle power usage")
-            thread = start_power_thread()
-            time.sleep(FREQ_IDLE_TIME)
-            idle_power_samples = stop_power_thread(thread)
-            idle_power = statistics.mean(idle_power_samples)
-            idle_mj = idle_power * FREQ_IDLE_TIME
-            idle_joules = idle_mj / 1000
-            pr_debug(f"Idle: {idle_power:4.0f} mW    {idle_joules:4.1f} J")
+            trace_begin("idle")
+            idle_power_samples = measure_power_until_converged(FREQ_IDLE_TIME)
+            trace_end("idle")
+            idle_stats = create_power_stats(idle_power_samples["start_ns"], idle_power_samples["end_ns"], idle_power_samples)
+            idle_stats["converged"] = idle_power_samples["converged"]
+            idle_stats["settle_sec"] = settle_sec
+            pr_debug(f"Idle: {idle_stats['power_mean']:4.0f} ± {idle_stats['power_ci95'] or 0:.0f} mW    {idle_stats['energy_joules']:4.1f} J    {idle_stats['elapsed_sec']:.1f} s")
 
             pr_debug("Running CoreMark...")
-            thread = start_power_thread()
-            start_time = time.time_ns()
-            cm_out = run_cmd(["taskset", "-c", f"{cpu}", "coremark", *COREMARK_PERFORMANCE_RUN])
-            end_time = time.time_ns()
-            power_samples = stop_power_thread(thread)
-
-            pr_debug(cm_out)
-            elapsed_sec = (end_time - start_time) / 1e9
-
-            # Extract score and iterations
-            match = re.search(r'CoreMark 1\.0 : ([0-9.]+?) / ', cm_out)
-            if not match.group(1):
-                if "Must execute for at least 10 secs" in cm_out:
-                    raise ValueError("Benchmark ran too fast; increase COREMARK_ITERATIONS and try again")
-                else:
-                    print(cm_out, file=sys.stderr)
-                    raise ValueError("Failed to parse CoreMark output")
+            trace_begin("coremark")
+            active_stats, core_scores, iters = run_workload(WORKLOADS["coremark"], cores, workloads_work["coremark"], base_power)
+            trace_end("coremark")
 
-            score = float(match.group(1))
-            match = re.search(r'Iterations\s+:\s+(\d+)', cm_out)
-            iters = float(match.group(1))
+            # Scores are per core, like single-core results, and the aggregate throughput is kept separately
+            total_score = sum(core_scores)
+            score = total_score / len(cores)
+            last_freq = freq
+            last_scores["coremark"] = score
 
-            # Adjust for base power usage
-            power_samples = [sample - base_power for sample in power_samples]
-
-            # Calculate power values
-            power = statistics.mean(power_samples)
+            power = active_stats["power_mean"]
             # CoreMarks/MHz as per EEMBC specs
             cm_mhz = score / mhz
-            # mW * sec = mJ
-            mj = power * elapsed_sec
-            joules = mj / 1000
+            mj = active_stats["energy_millijoules"]
+            joules = active_stats["energy_joules"]
+            elapsed_sec = active_stats["elapsed_sec"]
             # ULPMark-CM score = iterations per millijoule
             ulpmark_score = iters / mj
 
@@ -434,22 +1611,80 @@ def main():
 
             cpu_data["freqs"][freq] = {
                 "active": {
-                    **create_power_stats(end_time - start_time, power_samples),
+                    **active_stats,
                     "coremark_score": score,
+                    "coremark_score_total": total_score,
                     "coremarks_per_mhz": cm_mhz,
-                    "ulpmark_cm_score": ulpmark_score
+                    "ulpmark_cm_score": ulpmark_score,
+                    "coremark_iterations": iters,
+                    "cores": cores,
+                    "coremark_scores": core_scores,
                 },
-                "idle": create_power_stats(int(FREQ_IDLE_TIME * 1e9), idle_power_samples),
+                "idle": idle_stats,
             }
 
+            if BENCH_WORKLOADS:
+                cpu_data["freqs"][freq]["workloads"] = {}
+            for name in BENCH_WORKLOADS:
+                workload = WORKLOADS[name]
+
+                pr_debug("Waiting for power usage to settle")
+                trace_begin("settle")
+                measure_power_until_converged(FREQ_SETTLE_TIME, window=settle_window)
+                trace_end("settle")
+
+                pr_debug(f"Running {name}...")
+                trace_begin(name)
+                stats, core_scores, work = run_workload(workload, cores, workloads_work[name], base_power)
+                trace_end(name)
+                total_score = sum(core_scores)
+                score = total_score / len(cores)
+                last_scores[name] = score
+
+                units = workload["units"]
+                print(f"      {name}: {score:.0f} {units}   {stats['power_mean']:4.0f} mW   {stats['energy_joules']:4.1f} J   {stats['elapsed_sec']:5.1f} s")
+
+                cpu_data["freqs"][freq]["workloads"][name] = {
+                    **stats,
+                    "score": score,
+                    "score_total": total_score,
+                    "score_units": units,
+                    "score_per_mhz": score / mhz,
+                    # Like ULPMark-CM, but for any workload
+                    "work_per_mj": work / stats["energy_millijoules"],
+                    "work": work,
+                    "cores": cores,
+                    "scores": core_scores,
+                }
+
+            trace_begin("journal")
+            append_journal(journal, cpu, freq, cpu_data["freqs"][freq])
+            # Storage writes use power, but the next frequency waits for power usage to settle anyway
+            if time.monotonic() - last_persist_time >= JOURNAL_PERSIST_INTERVAL:
+                persist_journal()
+                last_persist_time = time.monotonic()
+            trace_end("journal")
+            trace_end(freq_trace_ids[freq])
+
         # In case the CPU shares a freq domain with the housekeeping CPU, e.g. cpu1
         pr_debug(f"Minimizing frequency of CPU: {min(freqs)} kHz")
+        trace_begin("offline")
         write_cpu(cpu, "cpufreq/scaling_setspeed", str(min(freqs)))
 
         pr_debug("Offlining CPU")
-        write_cpu(cpu, "online", "0")
+        for core in reversed(cores):
+            write_cpu(core, "online", "0")
+        trace_end("offline")
         print()
 
+        trace_begin("journal")
+        persist_journal()
+        last_persist_time = time.monotonic()
+        trace_end("journal")
+        trace_end(f"cpu{cpu}")
+
+    journal.close()
+
     # Make the rest run faster
     pr_debug("Maxing housekeeping CPU frequency")
     max_hk_freq = max(get_cpu_freqs(HOUSEKEEPING_CPU))
@@ -459,6 +1694,9 @@ def main():
     pr_debug("Enabling Python GC")
     gc.enable()
 
+    # Only needed for writing results
+    import bench_report
+
     print()
     print("Benchmark finished!")
 
@@ -466,53 +1704,42 @@ def main():
 
     pr_debug("Writing JSON data")
     data = {
-        "version": 1,
+        "version": 2,
         "total_elapsed_sec": bench_finish_time - bench_start_time,
-        "housekeeping": create_power_stats(int(5 * 1e9), base_power_samples),
+        "housekeeping": create_power_stats(base_power_samples["start_ns"], base_power_samples["end_ns"], base_power_samples),
         "cpus": cpus_data,
         "meta": {
             "housekeeping_cpu": HOUSEKEEPING_CPU,
             "power_sample_interval": POWER_SAMPLE_INTERVAL,
+            "power_gauge_period_ms": POWER_GAUGE_PERIOD_NS / 1e6 if POWER_GAUGE_PERIOD_NS else None,
+            "coremark_target_time": COREMARK_TARGET_TIME,
+            "power_convergence_precision": POWER_CONVERGENCE_PRECISION,
+            "resumed_freqs": resumed_count,
+            "selected_opps": BENCH_OPPS,
+            "bench_cores": BENCH_CORES,
+            "bench_workloads": BENCH_WORKLOADS,
+            "workload_spawn": WORKLOAD_SPAWN,
+            "workload_fifo_priority": WORKLOAD_FIFO_PRIORITY,
+            "trace": TRACE,
             "cpu_count": cpu_count,
+            "cpu_domains": related_domain_cpus,
         },
     }
 
+    pr_debug("Writing power samples")
+    write_samples(data, SAMPLES_FILE)
+
     pr_debug("Writing JSON results")
-    results_json = json.dumps(data)
+    results_json = bench_report.write_json(data, "/tmp/results.json")
     pr_debug(results_json)
-    with open("/tmp/results.json", "w+") as f:
-        f.write(results_json)
 
     pr_debug("Writing CSV results")
-    with open("/tmp/results.csv", "w+") as f:
-        fields = [
-            "CPU",
-            "Frequency (kHz)",
-            "CoreMarks (iter/s)",
-            "CoreMarks/MHz",
-            "Power (mW)",
-            "Energy (J)",
-            "ULPMark-CM (iter/mJ)",
-            "Time (s)"
-        ]
-
-        writer = csv.DictWriter(f, fieldnames=fields)
-        writer.writeheader()
-
-        for cpu, cpu_data in cpus_data.items():
-            for freq, freq_data in cpu_data["freqs"].items():
-                freq_data = freq_data["active"]
-
-                writer.writerow({
-                    "CPU": cpu,
-                    "Frequency (kHz)": freq,
-                    "CoreMarks (iter/s)": freq_data["coremark_score"],
-                    "CoreMarks/MHz": freq_data["coremarks_per_mhz"],
-                    "Power (mW)": freq_data["power_mean"],
-                    "Energy (J)": freq_data["energy_joules"],
-                    "ULPMark-CM (iter/mJ)": freq_data["ulpmark_cm_score"],
-                    "Time (s)": freq_data["elapsed_sec"],
-                })
+    bench_report.write_csv(cpus_data, "/tmp/results.csv")
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        # Partial traces are still useful for finding out what went wrong
+        if TRACE and _trace_main:
+            write_trace()
@@ -0,0 +1,81 @@
+/*
+ * Extra workloads for bench.py that aren't covered by tools in the ramdisk.
+ *
+ * Usage:
+ *   bench_kernels memcpy MIB    copy MIB MiB between buffers larger than the caches
+ *   bench_kernels fma MFLOP     run MFLOP million flops of independent SIMD FMAs
+ *
+ * Build: zig cc -target aarch64-linux-musl -O2 -ffp-contract=fast -s -o rd/usr/bin/bench_kernels bench_kernels.c
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#define COPY_MIB 64
+#define FMA_ACCUMULATORS 8
+
+typedef float v4f __attribute__((vector_size(16)));
+
+static int run_memcpy(long mib) {
+    size_t size = (size_t)COPY_MIB * 1024 * 1024;
+    char *src = malloc(size);
+    char *dst = malloc(size);
+    if (!src || !dst) {
+        perror("malloc");
+        return 1;
+    }
+
+    // Fault in all pages before copying
+    memset(src, 1, size);
+    memset(dst, 2, size);
+
+    for (long i = 0; i < mib / COPY_MIB; i++) {
+        memcpy(dst, src, size);
+        // Change the source so that copies can't be merged
+        src[i % size]++;
+    }
+
+    printf("%d\n", dst[size - 1] + dst[0]);
+    return 0;
+}
+
+static int run_fma(long mflop) {
+    // Each iteration is one FMA (2 flops) on each lane of each accumulator
+    long iterations = mflop * 1000000 / (FMA_ACCUMULATORS * 4 * 2);
+    v4f mul = {0.999999f, 0.999998f, 0.999997f, 0.999996f};
+    v4f add = {1e-6f, 2e-6f, 3e-6f, 4e-6f};
+
+    // Independent accumulators keep all FMA pipelines busy despite latency
+    v4f acc[FMA_ACCUMULATORS];
+    for (int j = 0; j < FMA_ACCUMULATORS; j++)
+        acc[j] = (v4f){1.0f, 1.0f, 1.0f, 1.0f} * (float)(j + 1);
+
+    for (long i = 0; i < iterations; i++) {
+        for (int j = 0; j < FMA_ACCUMULATORS; j++)
+            acc[j] = acc[j] * mul + add;
+    }
+
+    float sum = 0;
+    for (int j = 0; j < FMA_ACCUMULATORS; j++)
+        sum += acc[j][0] + acc[j][1] + acc[j][2] + acc[j][3];
+
+    printf("%f\n", sum);
+    return 0;
+}
+
+int main(int argc, char **argv) {
+    if (argc != 3) {
+        fprintf(stderr, "Usage: %s memcpy|fma AMOUNT\n", argv[0]);
+        return 2;
+    }
+
+    long amount = atol(argv[2]);
+    if (!strcmp(argv[1], "memcpy"))
+        return run_memcpy(amount);
+    if (!strcmp(argv[1], "fma"))
+        return run_fma(amount);
+
+    fprintf(stderr, "Unknown kernel: %s\n", argv[1]);
+    return 2;
+}
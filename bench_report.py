@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+# Result writing for bench.py, imported after benchmarking is done so that
+# json and csv don't add to startup time or stay resident during measurements
+
+import csv
+import json
+
+CSV_FIELDS = [
+    "CPU",
+    "Frequency (kHz)",
+    "CoreMarks (iter/s)",
+    "CoreMarks/MHz",
+    "Power (mW)",
+    "Energy (J)",
+    "ULPMark-CM (iter/mJ)",
+    "Time (s)"
+]
+
+def write_json(data, path):
+    """Write results as JSON and return the serialized data."""
+    results_json = json.dumps(data)
+    with open(path, "w+") as f:
+        f.write(results_json)
+
+    return results_json
+
+def write_csv(cpus_data, path):
+    with open(path, "w+") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+
+        for cpu, cpu_data in cpus_data.items():
+            for freq, freq_data in cpu_data["freqs"].items():
+                freq_data = freq_data["active"]
+
+                writer.writerow({
+                    "CPU": cpu,
+                    "Frequency (kHz)": freq,
+                    "CoreMarks (iter/s)": freq_data["coremark_score"],
+                    "CoreMarks/MHz": freq_data["coremarks_per_mhz"],
+                    "Power (mW)": freq_data["power_mean"],
+                    "Energy (J)": freq_data["energy_joules"],
+                    "ULPMark-CM (iter/mJ)": freq_data["ulpmark_cm_score"],
+                    "Time (s)": freq_data["elapsed_sec"],
+                })
+
+def write_trace(path, buffers):
+    """Write trace buffers in the Chrome trace event format."""
+    events = []
+    for buf in buffers:
+        events.append({
+            "name": "thread_name",
+            "ph": "M",
+            "pid": 1,
+            "tid": buf.tid,
+            "args": {"name": buf.name},
+        })
+        events.extend(buf.events())
+
+    with open(path, "w+") as f:
+        json.dump({
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "dropped_events": sum(buf.dropped for buf in buffers),
+            },
+        }, f)
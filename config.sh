@@ -9,6 +9,46 @@ DEBUG=false
 # 0 = auto (default is based on fuel gauge)
 POWER_SAMPLE_INTERVAL=0
 
+# How long each CoreMark (or other workload) run should take (in seconds)
+# Iterations are scaled for each frequency to hit this target
+# 0 = fixed number of iterations for all frequencies (slow at low frequencies)
+COREMARK_TARGET_TIME=20
+
+# Number of cores in each frequency domain to run CoreMark on in parallel
+# Scores are per core, with the total across cores saved separately, and power
+# covers the whole frequency domain.
+# 1 = single-core results (default)
+# 0 = all cores in the frequency domain except the housekeeping CPU
+BENCH_CORES=1
+
+# Extra workloads to run after CoreMark at each frequency, separated by spaces
+# Results are saved separately for each workload.
+#   memwrite  memory-bound streaming writes (kernel zero-fill)
+#   memcpy    memory-bound copies between buffers larger than the caches
+#   fma       FP/SIMD-bound vector fused multiply-adds
+#   inflate   branch-heavy gzip decompression
+# Empty = CoreMark only
+BENCH_WORKLOADS=""
+
+# Subset of CPUs and frequencies to benchmark, separated by spaces
+# Syntax matches postprocess/filter_freqs.py, with ranges as an extension:
+#   4               all frequencies of CPU 4's frequency domain
+#   4.1804800       a single frequency (in kHz)
+#   4.710400-1804800  all frequencies in an inclusive range (in kHz)
+# Use postprocess/merge_results.py to merge the results into a full run.
+# Empty = all CPUs and frequencies
+BENCH_OPPS=""
+
+# Whether to resume interrupted benchmark runs from the last completed frequency
+# Progress is saved to the cache or persist partition between frequencies
+RESUME=true
+
+# Whether to record a trace of benchmark phases, power samples, and sysfs accesses
+# Saved as trace.json, which can be opened in Perfetto (ui.perfetto.dev).
+# Unlike DEBUG, this doesn't print anything while benchmarking, so it's safe to
+# enable for final benchmarking, but events are still recorded in memory.
+TRACE=false
+
 # Whether to expose an SSH server for debugging over virtual USB Ethernet
 # Do not enable for final benchmarking
 USB_DEBUG=false
@@ -12,6 +12,9 @@ source /config.sh
 # Must be in /persist or /tmp
 # /persist will be mounted from the cache partition if it exists
 OUT_DIR=/persist/freqbench
+# Journal of completed frequencies for resuming interrupted runs
+# Must be in /persist and outside of OUT_DIR
+JOURNAL_FILE=/persist/freqbench-journal.bin
 
 reboot_end() {
     echo
@@ -96,6 +99,16 @@ on_error() {
     return $e
 }
 
+mount_persist() {
+    if mountpoint -q /persist; then
+        return
+    fi
+
+    mkdir -p /persist
+    persist_part="$(find_part_by_name cache || find_part_by_name persist)"
+    mount -o noatime "$persist_part" /persist
+}
+
 save_logs() {
     saving_logs=true
 
@@ -123,12 +136,9 @@ save_logs() {
     done
     set -e
 
-    mkdir /persist
-    persist_part="$(find_part_by_name cache || find_part_by_name persist)"
-
     # We write everything to tmpfs and copy it to persist afterwards because writing to UFS will use power
     echo
-    mount -o noatime "$persist_part" /persist
+    mount_persist
 
     echo "Writing logs and results to $OUT_DIR"
     rm -fr "$OUT_DIR"
@@ -191,9 +201,21 @@ py_args=()
 if ! $DEBUG; then
     py_args+=(-OO)
 fi
-py_args+=(/bench.py "$POWER_SAMPLE_INTERVAL")
+# Keep persistent storage mounted for the journal; it's only written to between frequencies
+journal_arg=""
+if $RESUME; then
+    mount_persist
+    journal_arg="$JOURNAL_FILE"
+fi
+
+py_args+=(/bench.py "$POWER_SAMPLE_INTERVAL" "$COREMARK_TARGET_TIME" "$journal_arg" "$BENCH_OPPS" "$BENCH_CORES" "$BENCH_WORKLOADS" "$TRACE")
 time taskset 01 python3 "${py_args[@]}" 2>&1 | tee /tmp/run.log || on_error
 
+# The run finished, so the next one should start from scratch
+if $RESUME; then
+    rm -f "$JOURNAL_FILE"
+fi
+
 save_logs
 
 # To debug system load
@@ -17,12 +17,31 @@ from __future__ import print_function
 
 from argparse import ArgumentParser, FileType, Action
 from hashlib import sha1
+import errno
+import os
 from os import fstat
 import re
 from struct import pack
 
 
 BOOT_IMAGE_HEADER_V3_PAGESIZE = 4096
+BOOT_IMAGE_HEADER_V3_SIZE = 1580
+BOOT_IMAGE_HEADER_V4_SIZE = 1584
+VENDOR_BOOT_IMAGE_HEADER_V3_SIZE = 2112
+VENDOR_BOOT_IMAGE_HEADER_V4_SIZE = 2128
+
+VENDOR_RAMDISK_TYPE_PLATFORM = 1
+VENDOR_RAMDISK_NAME_SIZE = 32
+VENDOR_RAMDISK_TABLE_ENTRY_BOARD_ID_SIZE = 16
+VENDOR_RAMDISK_TABLE_ENTRY_V4_SIZE = 108
+
+# Inputs are hashed and copied in chunks of this size, so memory usage doesn't
+# depend on the size of the kernel or ramdisk
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Errors from copy_file_range and sendfile that mean they can't be used for the
+# given files, e.g. across filesystems or on old kernels
+ZERO_COPY_ERRNOS = (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.EBADF, errno.ESPIPE)
 
 def filesize(f):
     if f is None:
@@ -33,13 +52,14 @@ def filesize(f):
         return 0
 
 
-def update_sha(sha, f):
-    if f:
-        sha.update(f.read())
-        f.seek(0)
-        sha.update(pack('I', filesize(f)))
-    else:
-        sha.update(pack('I', 0))
+def read_chunks(f):
+    buf = bytearray(COPY_CHUNK_SIZE)
+    view = memoryview(buf)
+    while True:
+        n = f.readinto(view)
+        if not n:
+            break
+        yield view[:n]
 
 
 def pad_file(f, padding):
@@ -49,7 +69,7 @@ def pad_file(f, padding):
 
 def get_number_of_pages(image_size, page_size):
     """calculates the number of pages required for the image"""
-    return (image_size + page_size - 1) / page_size
+    return (image_size + page_size - 1) // page_size
 
 
 def get_recovery_dtbo_offset(args):
@@ -64,27 +84,37 @@ def get_recovery_dtbo_offset(args):
 
 
 def write_header_v3(args):
-    BOOT_IMAGE_HEADER_V3_SIZE = 1580
     BOOT_MAGIC = 'ANDROID!'.encode()
 
+    if args.header_version > 3:
+        header_size = BOOT_IMAGE_HEADER_V4_SIZE
+    else:
+        header_size = BOOT_IMAGE_HEADER_V3_SIZE
+
     args.output.write(pack('8s', BOOT_MAGIC))
     args.output.write(pack(
         '4I',
         filesize(args.kernel),                          # kernel size in bytes
         filesize(args.ramdisk),                         # ramdisk size in bytes
         (args.os_version << 11) | args.os_patch_level,  # os version and patch level
-        BOOT_IMAGE_HEADER_V3_SIZE))
+        header_size))
 
     args.output.write(pack('4I', 0, 0, 0, 0))           # reserved
 
     args.output.write(pack('I', args.header_version))   # version of bootimage header
     args.output.write(pack('1536s', args.cmdline.encode()))
+    if args.header_version > 3:
+        args.output.write(pack('I', 0))                 # boot signature size (unsigned)
     pad_file(args.output, BOOT_IMAGE_HEADER_V3_PAGESIZE)
 
 def write_vendor_boot_header(args):
-    VENDOR_BOOT_IMAGE_HEADER_V3_SIZE = 2112
     BOOT_MAGIC = 'VNDRBOOT'.encode()
 
+    if args.header_version > 3:
+        header_size = VENDOR_BOOT_IMAGE_HEADER_V4_SIZE
+    else:
+        header_size = VENDOR_BOOT_IMAGE_HEADER_V3_SIZE
+
     args.vendor_boot.write(pack('8s', BOOT_MAGIC))
     args.vendor_boot.write(pack(
         '5I',
@@ -96,11 +126,18 @@ def write_vendor_boot_header(args):
     args.vendor_boot.write(pack('2048s', args.vendor_cmdline.encode()))
     args.vendor_boot.write(pack('I', args.base + args.tags_offset)) # physical addr for kernel tags
     args.vendor_boot.write(pack('16s', args.board.encode())) # asciiz product name
-    args.vendor_boot.write(pack('I', VENDOR_BOOT_IMAGE_HEADER_V3_SIZE)) # header size in bytes
+    args.vendor_boot.write(pack('I', header_size))  # header size in bytes
     if filesize(args.dtb) == 0:
         raise ValueError("DTB image must not be empty.")
     args.vendor_boot.write(pack('I', filesize(args.dtb)))   # size in bytes
     args.vendor_boot.write(pack('Q', args.base + args.dtb_offset)) # dtb physical load address
+
+    if args.header_version > 3:
+        # One table entry for the whole vendor ramdisk
+        args.vendor_boot.write(pack('I', VENDOR_RAMDISK_TABLE_ENTRY_V4_SIZE)) # vendor ramdisk table size
+        args.vendor_boot.write(pack('I', 1))        # number of vendor ramdisk table entries
+        args.vendor_boot.write(pack('I', VENDOR_RAMDISK_TABLE_ENTRY_V4_SIZE)) # table entry size
+        args.vendor_boot.write(pack('I', filesize(args.vendor_bootconfig))) # bootconfig size
     pad_file(args.vendor_boot, args.pagesize)
 
 def write_header(args):
@@ -108,9 +145,9 @@ def write_header(args):
     BOOT_IMAGE_HEADER_V2_SIZE = 1660
     BOOT_MAGIC = 'ANDROID!'.encode()
 
-    if args.header_version > 3:
+    if args.header_version > 4:
         raise ValueError('Boot header version %d not supported' % args.header_version)
-    elif args.header_version == 3:
+    elif args.header_version >= 3:
         return write_header_v3(args)
 
     args.output.write(pack('8s', BOOT_MAGIC))
@@ -131,19 +168,10 @@ def write_header(args):
     args.output.write(pack('16s', args.board.encode())) # asciiz product name
     args.output.write(pack('512s', args.cmdline[:512].encode()))
 
-    sha = sha1()
-    update_sha(sha, args.kernel)
-    update_sha(sha, args.ramdisk)
-    update_sha(sha, args.second)
-
-    if args.header_version > 0:
-        update_sha(sha, args.recovery_dtbo)
-    if args.header_version > 1:
-        update_sha(sha, args.dtb)
-
-    img_id = pack('32s', sha.digest())
-
-    args.output.write(img_id)
+    # The ID is a hash of all inputs. It's calculated while they're copied and
+    # filled in afterwards, so each input is only read once.
+    img_id_offset = args.output.tell()
+    args.output.write(pack('32x'))
     args.output.write(pack('1024s', args.cmdline[512:].encode()))
 
     if args.header_version > 0:
@@ -167,7 +195,7 @@ def write_header(args):
         args.output.write(pack('I', filesize(args.dtb)))   # size in bytes
         args.output.write(pack('Q', args.base + args.dtb_offset)) # dtb physical load address
     pad_file(args.output, args.pagesize)
-    return img_id
+    return img_id_offset
 
 
 class ValidateStrLenAction(Action):
@@ -185,10 +213,63 @@ class ValidateStrLenAction(Action):
         setattr(namespace, self.dest, values)
 
 
-def write_padded_file(f_out, f_in, padding):
+def zero_copy_funcs():
+    """functions that copy (in_fd, out_fd, offset, count) in the kernel, in order of preference"""
+    if hasattr(os, 'copy_file_range'):
+        yield lambda in_fd, out_fd, offset, count: os.copy_file_range(in_fd, out_fd, count, offset)
+    if hasattr(os, 'sendfile'):
+        yield lambda in_fd, out_fd, offset, count: os.sendfile(out_fd, in_fd, offset, count)
+
+
+def copy_file_zero_copy(f_out, f_in):
+    """copies a file without reading it into userspace, returns whether it worked"""
+    size = filesize(f_in)
+    out_start = f_out.tell()
+    for copy in zero_copy_funcs():
+        offset = 0
+        try:
+            while offset < size:
+                n = copy(f_in.fileno(), f_out.fileno(), offset, size - offset)
+                if n == 0:
+                    break
+                offset += n
+        except OSError as e:
+            # Not supported for these files, e.g. across filesystems on old kernels
+            if e.errno not in ZERO_COPY_ERRNOS or offset > 0:
+                raise
+            continue
+
+        # The file object's cached position is stale after copying with its fd
+        f_out.seek(out_start + offset)
+        if offset == size:
+            return True
+        # Truncated input, let the normal copy write the rest
+        f_in.seek(offset)
+        return False
+
+    return False
+
+
+def copy_file(f_out, f_in, sha=None):
+    """copies a file in chunks, updating sha with its contents if given"""
+    f_out.flush()
+    if sha is None and f_out.seekable() and copy_file_zero_copy(f_out, f_in):
+        return
+
+    for chunk in read_chunks(f_in):
+        if sha is not None:
+            sha.update(chunk)
+        f_out.write(chunk)
+
+
+def write_padded_file(f_out, f_in, padding, sha=None):
     if f_in is None:
+        if sha is not None:
+            sha.update(pack('I', 0))
         return
-    f_out.write(f_in.read())
+    copy_file(f_out, f_in, sha)
+    if sha is not None:
+        sha.update(pack('I', filesize(f_in)))
     pad_file(f_out, padding)
 
 
@@ -266,25 +347,43 @@ def parse_cmdline():
     parser.add_argument('-o', '--output', help='output file name', type=FileType('wb'))
     parser.add_argument('--vendor_boot', help='vendor boot output file name', type=FileType('wb'))
     parser.add_argument('--vendor_ramdisk', help='path to the vendor ramdisk', type=FileType('rb'))
+    parser.add_argument('--vendor_bootconfig', help='path to the vendor bootconfig file',
+                        type=FileType('rb'))
 
     return parser.parse_args()
 
 
-def write_data(args, pagesize):
-    write_padded_file(args.output, args.kernel, pagesize)
-    write_padded_file(args.output, args.ramdisk, pagesize)
-    write_padded_file(args.output, args.second, pagesize)
+def write_data(args, pagesize, sha=None):
+    write_padded_file(args.output, args.kernel, pagesize, sha)
+    write_padded_file(args.output, args.ramdisk, pagesize, sha)
+    write_padded_file(args.output, args.second, pagesize, sha)
 
     if args.header_version > 0 and args.header_version < 3:
-        write_padded_file(args.output, args.recovery_dtbo, pagesize)
+        write_padded_file(args.output, args.recovery_dtbo, pagesize, sha)
     if args.header_version == 2:
-        write_padded_file(args.output, args.dtb, pagesize)
+        write_padded_file(args.output, args.dtb, pagesize, sha)
+
+
+def write_vendor_ramdisk_table(args):
+    args.vendor_boot.write(pack(
+        '3I',
+        filesize(args.vendor_ramdisk),                  # ramdisk size in bytes
+        0,                                              # offset in vendor ramdisk section
+        VENDOR_RAMDISK_TYPE_PLATFORM))                  # ramdisk type
+    args.vendor_boot.write(pack('%ds' % VENDOR_RAMDISK_NAME_SIZE, b''))  # asciiz ramdisk name
+    args.vendor_boot.write(pack('%dI' % VENDOR_RAMDISK_TABLE_ENTRY_BOARD_ID_SIZE,
+                                *[0] * VENDOR_RAMDISK_TABLE_ENTRY_BOARD_ID_SIZE))  # board ID
+    pad_file(args.vendor_boot, args.pagesize)
 
 
 def write_vendor_boot_data(args):
     write_padded_file(args.vendor_boot, args.vendor_ramdisk, args.pagesize)
     write_padded_file(args.vendor_boot, args.dtb, args.pagesize)
 
+    if args.header_version > 3:
+        write_vendor_ramdisk_table(args)
+        write_padded_file(args.vendor_boot, args.vendor_bootconfig, args.pagesize)
+
 
 def main():
     args = parse_cmdline()
@@ -293,6 +392,8 @@ def main():
             raise ValueError('--vendor_boot not compatible with given header version')
         if args.vendor_ramdisk is None:
             raise ValueError('--vendor_ramdisk missing or invalid')
+        if args.vendor_bootconfig is not None and args.header_version < 4:
+            raise ValueError('--vendor_bootconfig not compatible with given header version')
         write_vendor_boot_header(args)
         write_vendor_boot_data(args)
     if args.output is not None:
@@ -300,11 +401,18 @@ def main():
             raise ValueError('kernel must be supplied when creating a boot image')
         if args.second is not None and args.header_version > 2:
             raise ValueError('--second not compatible with given header version')
-        img_id = write_header(args)
+        img_id_offset = write_header(args)
         if args.header_version > 2:
+            img_id = None
             write_data(args, BOOT_IMAGE_HEADER_V3_PAGESIZE)
         else:
-            write_data(args, args.pagesize)
+            sha = sha1()
+            write_data(args, args.pagesize, sha)
+            img_id = pack('32s', sha.digest())
+            end = args.output.tell()
+            args.output.seek(img_id_offset)
+            args.output.write(img_id)
+            args.output.seek(end)
         if args.id and img_id is not None:
             # Python 2's struct.pack returns a string, but py3 returns bytes.
             if isinstance(img_id, str):
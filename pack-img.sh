@@ -3,19 +3,62 @@
 oldwd="$PWD"
 cd "$(dirname "$0")"
 
-./packrd-gz.sh
+# Override the DTB with DTB=path, e.g. for a patched energy model
+dtb="${DTB:-alpine-dt.dtb}"
+[[ -n "$DTB" && "$DTB" != /* ]] && dtb="$oldwd/$DTB"
 
-python mkbootimg.py \
-    --header_version 2 \
-    --os_version 11.0.0 \
-    --os_patch_level 2020-11 \
-    --ramdisk rd-new.cpio.gz \
-    --kernel alpine-Image.lz4 \
-    --dtb alpine-dt.dtb \
-    --cmdline 'console=ttyMSM0,115200n8 androidboot.console=ttyMSM0 printk.devkmsg=on msm_rtb.filter=0x237 ehci-hcd.park=3 service_locator.enable=1 androidboot.memcg=1 cgroup.memory=nokmem lpm_levels.sleep_disabled=1 usbcore.autosuspend=7 androidboot.usbcontroller=a600000.dwc3 swiotlb=2048 androidboot.boot_devices=soc/1d84000.ufshc loop.max_part=7 snd_soc_cs35l41_i2c.async_probe=1 i2c_qcom_geni.async_probe=1 st21nfc.async_probe=1 spmi_pmic_arb.async_probe=1 ufs_qcom.async_probe=1 buildvariant=user' \
-    --kernel_offset 0x8000 \
-    --ramdisk_offset 0x1000000 \
-    --dtb_offset 0x1f00000 \
-    --tags_offset 0x100 \
-    --pagesize 4096 \
-    --output "$oldwd/${1:-bench.img}"
+# Boot image header version: 3 and 4 also create a vendor_boot image with the
+# DTB and a vendor ramdisk (empty unless VENDOR_RAMDISK=path is set)
+header_version="${HEADER_VERSION:-2}"
+vendor_ramdisk="${VENDOR_RAMDISK:-/dev/null}"
+[[ -n "$VENDOR_RAMDISK" && "$VENDOR_RAMDISK" != /* ]] && vendor_ramdisk="$oldwd/$VENDOR_RAMDISK"
+
+cmdline='console=ttyMSM0,115200n8 androidboot.console=ttyMSM0 printk.devkmsg=on msm_rtb.filter=0x237 ehci-hcd.park=3 service_locator.enable=1 androidboot.memcg=1 cgroup.memory=nokmem lpm_levels.sleep_disabled=1 usbcore.autosuspend=7 androidboot.usbcontroller=a600000.dwc3 swiotlb=2048 androidboot.boot_devices=soc/1d84000.ufshc loop.max_part=7 snd_soc_cs35l41_i2c.async_probe=1 i2c_qcom_geni.async_probe=1 st21nfc.async_probe=1 spmi_pmic_arb.async_probe=1 ufs_qcom.async_probe=1 buildvariant=user'
+
+# Ramdisk compression: gzip, lz4, zstd, or none. The kernel must support it.
+compressor="${RAMDISK_COMPRESSION:-gzip}"
+case "$compressor" in
+    gzip) ramdisk=rd-new.cpio.gz ;;
+    lz4) ramdisk=rd-new.cpio.lz4 ;;
+    zstd) ramdisk=rd-new.cpio.zst ;;
+    *) ramdisk=rd-new.cpio ;;
+esac
+# MINIMAL_RAMDISK=1 prunes unused Python modules from the ramdisk
+packrd_args=(-c "$compressor" -o "$ramdisk")
+[[ -n "$MINIMAL_RAMDISK" ]] && packrd_args+=(--minimal)
+python packrd.py "${packrd_args[@]}"
+
+if [[ "$header_version" -ge 3 ]]; then
+    # The bootloader appends the boot cmdline to the vendor one
+    python mkbootimg.py \
+        --header_version "$header_version" \
+        --os_version 11.0.0 \
+        --os_patch_level 2020-11 \
+        --ramdisk "$ramdisk" \
+        --kernel alpine-Image.lz4 \
+        --output "$oldwd/${1:-bench.img}" \
+        --vendor_ramdisk "$vendor_ramdisk" \
+        --dtb "$dtb" \
+        --vendor_cmdline "$cmdline" \
+        --kernel_offset 0x8000 \
+        --ramdisk_offset 0x1000000 \
+        --dtb_offset 0x1f00000 \
+        --tags_offset 0x100 \
+        --pagesize 4096 \
+        --vendor_boot "$oldwd/${2:-vendor_boot-bench.img}"
+else
+    python mkbootimg.py \
+        --header_version "$header_version" \
+        --os_version 11.0.0 \
+        --os_patch_level 2020-11 \
+        --ramdisk "$ramdisk" \
+        --kernel alpine-Image.lz4 \
+        --dtb "$dtb" \
+        --cmdline "$cmdline" \
+        --kernel_offset 0x8000 \
+        --ramdisk_offset 0x1000000 \
+        --dtb_offset 0x1f00000 \
+        --tags_offset 0x100 \
+        --pagesize 4096 \
+        --output "$oldwd/${1:-bench.img}"
+fi
@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+#
+# Incremental ramdisk packer for freqbench.
+#
+# The static Alpine tree in rd/ is packed into a base cpio archive that's cached
+# in compressed form, and freqbench's own files are appended as a small overlay
+# archive. The kernel unpacks concatenated (and separately compressed) cpio
+# archives in order, so only the overlay needs to be rebuilt after changing
+# e.g. bench.py.
+#
+# All timestamps are set to SOURCE_DATE_EPOCH (or 0) and owners to root, so the
+# output only depends on file contents and modes.
+#
+# With --minimal, the Python standard library is pruned to the modules that
+# freqbench actually imports, optionally precompiled to optimized bytecode.
+
+import argparse
+import ast
+import hashlib
+import json
+import modulefinder
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+RD_DIR = "rd"
+CACHE_DIR = ".packrd-cache"
+
+# Bump to invalidate cached base archives when the archive format changes
+CACHE_VERSION = 1
+
+# (source, path in ramdisk), always packed fresh
+OVERLAY_FILES = [
+    ("init.sh", "init"),
+    ("config.sh", "config.sh"),
+    ("usb.sh", "usb.sh"),
+    ("bench.py", "bench.py"),
+    ("bench_report.py", "bench_report.py"),
+    ("dhcpd.conf", "dhcpd.conf"),
+]
+
+# Empty directories that are missing from the tree in git
+EXTRA_DIRS = [
+    "tmp", "sys", "srv", "run", "root", "proc", "opt", "mnt", "home", "dev",
+    "var/tmp", "var/opt", "var/mail", "var/log", "var/local", "var/empty",
+]
+
+# Compressors supported by the kernel for initramfs, with file extensions.
+# lz4 must use the legacy frame format.
+COMPRESSORS = {
+    "gzip": ("gz", ["gzip", "-9", "-n", "-c"]),
+    "lz4": ("lz4", ["lz4", "-l", "-9", "-c"]),
+    "zstd": ("zst", ["zstd", "-19", "-q", "-c"]),
+    "none": ("", None),
+}
+
+CPIO_TRAILER = "TRAILER!!!"
+
+PYTHON_LIB = "usr/lib/python3.8"
+PYTHON_VERSION = (3, 8)
+
+# Modules imported by the interpreter itself during startup
+PYTHON_STARTUP_MODULES = [
+    "site", "encodings", "encodings.aliases", "encodings.utf_8", "encodings.ascii", "encodings.latin_1",
+]
+
+# Imports on code paths that freqbench never reaches, which modulefinder can't
+# tell apart from real dependencies: tokenize's command-line interface, the
+# interactive readline hook in site, optional compression support in shutil,
+# and \N{...} escapes in regular expressions
+PYTHON_EXCLUDES = ["argparse", "readline", "rlcompleter", "bz2", "lzma", "unicodedata"]
+
+# Arguments that bench.py runs with in init.sh
+PYTHON_RUN_ARGS = ["-OO"]
+# Runs to take the median of when measuring import time
+IMPORT_TIME_RUNS = 5
+
+
+class CpioWriter:
+    """Writes a cpio archive in the newc (SVR4 without CRC) format."""
+
+    def __init__(self, f, mtime=0):
+        self.f = f
+        self.mtime = mtime
+        self.pos = 0
+        self.ino = 0
+
+    def _write(self, data):
+        self.f.write(data)
+        self.pos += len(data)
+
+    def _pad(self):
+        if self.pos % 4:
+            self._write(b"\0" * (4 - self.pos % 4))
+
+    def add(self, name, mode, data=b"", rdev=0):
+        self.ino += 1
+        name_bytes = name.encode() + b"\0"
+        nlink = 2 if stat.S_ISDIR(mode) else 1
+
+        fields = [
+            self.ino, mode, 0, 0, nlink, self.mtime, len(data),
+            0, 0, os.major(rdev), os.minor(rdev), len(name_bytes), 0,
+        ]
+        self._write(b"070701" + b"".join(b"%08X" % field for field in fields))
+        self._write(name_bytes)
+        self._pad()
+        self._write(data)
+        self._pad()
+
+    def add_path(self, name, path):
+        st = os.lstat(path)
+        if stat.S_ISREG(st.st_mode):
+            with open(path, "rb") as f:
+                self.add(name, st.st_mode, f.read())
+        elif stat.S_ISLNK(st.st_mode):
+            self.add(name, st.st_mode, os.readlink(path).encode())
+        elif stat.S_ISCHR(st.st_mode) or stat.S_ISBLK(st.st_mode):
+            self.add(name, st.st_mode, rdev=st.st_rdev)
+        else:
+            self.add(name, st.st_mode)
+
+    def finish(self):
+        self.add(CPIO_TRAILER, 0)
+
+
+def scan_tree(root, exclude):
+    """Sorted (name, path, stat) for everything in root, excluding the given names"""
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, root)
+            if rel not in exclude:
+                entries.append((rel, path, os.lstat(path)))
+
+    entries.sort()
+    return entries
+
+
+def tree_key(entries, mtime, compressor):
+    """Hash of everything that affects the base archive"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((CACHE_VERSION, mtime, compressor, sorted(EXTRA_DIRS), PYTHON_EXCLUDES)).encode())
+    for rel, path, st in entries:
+        target = os.readlink(path) if stat.S_ISLNK(st.st_mode) else ""
+        h.update(repr((rel, st.st_mode, st.st_size, st.st_mtime_ns, st.st_rdev, target)).encode())
+
+    return h.hexdigest()
+
+
+def cpio_suffix(compressor):
+    ext = COMPRESSORS[compressor][0]
+    return ".cpio" + (f".{ext}" if ext else "")
+
+
+def compress(data, compressor):
+    cmd = COMPRESSORS[compressor][1]
+    if cmd is None:
+        return data
+
+    if compressor == "gzip" and shutil.which("pigz"):
+        cmd = ["pigz"] + cmd[1:]
+
+    return subprocess.run(cmd, input=data, stdout=subprocess.PIPE, check=True).stdout
+
+
+def pack_base(entries, mtime, compressor, bytecode=None):
+    """Pack the base archive, with sourceless bytecode instead of the given {name: data} sources"""
+    bytecode = bytecode or {}
+    buf = BytesIO()
+    cpio = CpioWriter(buf, mtime)
+
+    modes = {rel: st.st_mode for rel, _, st in entries}
+    extra_dirs = {d for d in EXTRA_DIRS if d not in modes}
+    # Parents always sort before their children
+    for rel in sorted(modes.keys() | extra_dirs):
+        if rel in extra_dirs:
+            cpio.add(rel, stat.S_IFDIR | 0o755)
+        elif rel in bytecode:
+            cpio.add(rel[:-len(".py")] + ".pyc", modes[rel] & ~0o111, bytecode[rel])
+        else:
+            cpio.add_path(rel, os.path.join(RD_DIR, rel))
+
+    cpio.finish()
+    return compress(buf.getvalue(), compressor)
+
+
+def pack_overlay(files, mtime, compressor):
+    buf = BytesIO()
+    cpio = CpioWriter(buf, mtime)
+    for src, name in files:
+        cpio.add_path(name, src)
+
+    cpio.finish()
+    return compress(buf.getvalue(), compressor)
+
+
+class StdlibFinder(modulefinder.ModuleFinder):
+    """Finds imports in the ramdisk's standard library, which is for a different Python than this one."""
+
+    def __init__(self, lib_dir):
+        super().__init__(path=[lib_dir], excludes=PYTHON_EXCLUDES)
+        dynload = os.path.join(lib_dir, "lib-dynload")
+        # e.g. _json.cpython-38-aarch64-linux-gnu.so, which the host can't find by name
+        self.extensions = {name.split(".")[0]: os.path.join(dynload, name)
+                for name in os.listdir(dynload) if name.endswith(".so")}
+
+    def find_module(self, name, path, parent=None):
+        if parent is None and name in self.extensions and name not in self.excludes:
+            return None, self.extensions[name], ("", "", modulefinder._C_EXTENSION)
+
+        return super().find_module(name, path, parent)
+
+
+def python_imports(paths, startup=False):
+    """Names of absolute imports in the given Python files.
+
+    Imports in functions are included unless startup is set, which only
+    includes imports that run when the module is loaded.
+    """
+    names = set()
+    for path in paths:
+        with open(path, "rb") as f:
+            tree = ast.parse(f.read(), path)
+
+        if startup:
+            roots = [node for node in tree.body
+                    if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))]
+            nodes = [node for root in roots for node in ast.walk(root)]
+        else:
+            nodes = ast.walk(tree)
+
+        for node in nodes:
+            if isinstance(node, ast.Import):
+                names.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.level == 0:
+                names.add(node.module)
+
+    # Overlay modules are shipped separately
+    return names - {os.path.splitext(os.path.basename(path))[0] for path in overlay_python_files()}
+
+
+def python_closure(imports):
+    """Paths of standard library files needed for imports, relative to rd/"""
+    lib_dir = os.path.join(RD_DIR, PYTHON_LIB)
+    finder = StdlibFinder(lib_dir)
+    for name in sorted(imports) + PYTHON_STARTUP_MODULES:
+        try:
+            finder.import_hook(name)
+        except ImportError:
+            # Built-in modules and optional imports that don't exist on Linux
+            pass
+
+    files = {os.path.relpath(module.__file__, RD_DIR) for module in finder.modules.values()
+            if module.__file__ and os.path.abspath(module.__file__).startswith(os.path.abspath(lib_dir))}
+    # sysconfig imports its data module by a computed name
+    files.update(os.path.join(PYTHON_LIB, name) for name in os.listdir(lib_dir) if name.startswith("_sysconfigdata_"))
+    return sorted(files)
+
+
+def overlay_python_files():
+    return [src for src, _ in OVERLAY_FILES if src.endswith(".py")]
+
+
+def cached_closure(key, imports):
+    """python_closure with results cached by the tree key and imports"""
+    h = hashlib.blake2b(repr((key, sorted(imports))).encode(), digest_size=16).hexdigest()
+    path = os.path.join(CACHE_DIR, f"closure-{h}.json")
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+
+    files = python_closure(imports)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(path, "w+") as f:
+        json.dump(files, f, indent=1)
+
+    for name in os.listdir(CACHE_DIR):
+        if name.startswith("closure-") and os.path.join(CACHE_DIR, name) != path:
+            os.remove(os.path.join(CACHE_DIR, name))
+
+    return files
+
+
+def prune_python(entries, keep):
+    """Drop standard library files that aren't in keep, along with directories that end up empty"""
+    keep = set(keep)
+    dirs = {os.path.dirname(rel) for rel in keep}
+    for rel in list(dirs):
+        while rel:
+            rel = os.path.dirname(rel)
+            dirs.add(rel)
+
+    prefix = PYTHON_LIB + "/"
+    return [entry for entry in entries if not entry[0].startswith(prefix)
+            or entry[0] in keep or entry[0] in dirs]
+
+
+def compile_bytecode(python, names):
+    """Compile standard library sources with a host Python 3.8, optimized for -OO. Returns {name: pyc data}"""
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = [(os.path.join(RD_DIR, name), os.path.join(tmp, f"{i}.pyc"), "/" + name)
+                for i, name in enumerate(names)]
+        # Unchecked hash-based pycs don't depend on source mtimes, which are
+        # irrelevant without sources anyway
+        script = f"""
+import json, py_compile, sys
+assert sys.version_info[:2] == {PYTHON_VERSION!r}, "Python %d.%d is required for bytecode" % {PYTHON_VERSION!r}
+for src, dst, name in json.load(sys.stdin):
+    py_compile.compile(src, dst, name, doraise=True, optimize=2,
+            invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+"""
+        subprocess.run([python, "-c", script], input=json.dumps(jobs).encode(), check=True)
+
+        bytecode = {}
+        for name, (_, dst, _) in zip(names, jobs):
+            with open(dst, "rb") as f:
+                bytecode[name] = f.read()
+
+    return bytecode
+
+
+def python_tag(python):
+    """Version of a host Python, for cache keys"""
+    return subprocess.run([python, "-c", "import sys; print(sys.version)"], stdout=subprocess.PIPE,
+            check=True, universal_newlines=True).stdout.strip()
+
+
+def base_entries(minimal=False):
+    """Entries and files for the Python closure (or None) of the base archive"""
+    entries = scan_tree(RD_DIR, {name for _, name in OVERLAY_FILES})
+    if not minimal:
+        return entries, None
+
+    closure = cached_closure(tree_key(entries, 0, ""), python_imports(overlay_python_files()))
+    return prune_python(entries, closure), closure
+
+
+def cached_base(mtime, compressor, force=False, minimal=False, bytecode_python=None):
+    """Path to the compressed base archive, rebuilding it if rd/ changed"""
+    entries, closure = base_entries(minimal)
+    key = tree_key(entries, mtime, compressor)
+    if bytecode_python:
+        key = hashlib.blake2b(repr((key, python_tag(bytecode_python))).encode(), digest_size=16).hexdigest()
+
+    prefix = "base-minimal-" if minimal else "base-full-"
+    suffix = cpio_suffix(compressor)
+    path = os.path.join(CACHE_DIR, f"{prefix}{key}{suffix}")
+    if os.path.exists(path) and not force:
+        return path, True
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    bytecode = None
+    if bytecode_python:
+        bytecode = compile_bytecode(bytecode_python, [name for name in closure if name.endswith(".py")])
+
+    data = pack_base(entries, mtime, compressor, bytecode)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+    # Drop stale archives of the same kind
+    for name in os.listdir(CACHE_DIR):
+        old = os.path.join(CACHE_DIR, name)
+        if name.startswith(prefix) and name.endswith(suffix) and old != path:
+            os.remove(old)
+
+    return path, False
+
+
+def tree_size(entries):
+    return sum(st.st_size for _, _, st in entries if stat.S_ISREG(st.st_mode))
+
+
+def python_home(home, lib_entries, bytecode=None):
+    """Copy standard library files to a PYTHONHOME directory, with bytecode replacing sources as in pack_base"""
+    for rel, path, st in lib_entries:
+        dst = os.path.join(home, os.path.relpath(rel, "usr"))
+        if stat.S_ISDIR(st.st_mode):
+            os.makedirs(dst, exist_ok=True)
+        elif bytecode and rel in bytecode:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            with open(dst[:-len(".py")] + ".pyc", "wb") as f:
+                f.write(bytecode[rel])
+        else:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy2(path, dst)
+
+
+def import_time(cmd, imports, env=None):
+    """Median total time (µs) of imports with -X importtime, including startup, or None if cmd can't run"""
+    code = "import " + ", ".join(sorted(imports)) if imports else "pass"
+    totals = []
+    for _ in range(IMPORT_TIME_RUNS):
+        try:
+            proc = subprocess.run([*cmd, *PYTHON_RUN_ARGS, "-X", "importtime", "-c", code], env=env,
+                    stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, universal_newlines=True)
+        except OSError:
+            return None
+        if proc.returncode != 0:
+            return None
+
+        # Sum cumulative times of top-level imports
+        total = 0
+        for line in proc.stderr.splitlines():
+            if line.startswith("import time:") and "|" in line:
+                _, cumulative, name = line[len("import time:"):].split("|")
+                if cumulative.strip().isdigit() and not name.startswith("  "):
+                    total += int(cumulative)
+        totals.append(total)
+
+    return sorted(totals)[len(totals) // 2]
+
+
+def format_import_times(cmd, file_imports, env=None):
+    """Startup time and the extra import time of each overlay file, or None if cmd can't run"""
+    startup = import_time(cmd, set(), env)
+    if startup is None:
+        return None
+
+    parts = [f"startup {startup / 1000:.1f} ms"]
+    for path, imports in file_imports:
+        us = import_time(cmd, imports, env)
+        if us is None:
+            return None
+        parts.append(f"{path} +{(us - startup) / 1000:.1f} ms")
+
+    return ", ".join(parts)
+
+
+def report(compressor, bases, overlay_size, bytecode_python=None):
+    """Print sizes and import times of the full and minimal ramdisks.
+
+    Import times are measured by running the ramdisk's python3 directly with
+    its musl loader, which only works on arm64 hosts or with binfmt_misc
+    emulation. Otherwise, the host's Python is measured for reference.
+    Sources are compiled on every run, as they are when freqbench runs for the
+    first time after boot.
+    """
+    file_imports = [(path, python_imports([path], startup=True)) for path in overlay_python_files()]
+    prefix = PYTHON_LIB + "/"
+
+    print("Python imports at startup:")
+    for path, imports in file_imports:
+        print(f"  {path}: {', '.join(sorted(imports))}")
+
+    loader = os.path.join(RD_DIR, "lib", "ld-musl-aarch64.so.1")
+    lib_path = ":".join(os.path.join(RD_DIR, path) for path in ("lib", "usr/lib"))
+    rd_cmd = [loader, "--library-path", lib_path, os.path.join(RD_DIR, "usr", "bin", "python3.8")]
+
+    ran = False
+    for label in ("full", "minimal"):
+        entries, closure = base_entries(label == "minimal")
+        lib_entries = [entry for entry in entries if entry[0].startswith(prefix)]
+        files = sum(1 for _, _, st in lib_entries if stat.S_ISREG(st.st_mode))
+        size = os.path.getsize(bases[label]) + overlay_size
+        print(f"{label}: stdlib {tree_size(lib_entries) / 1e6:.2f} MB in {files} files, "
+                f"tree {tree_size(entries) / 1e6:.1f} MB, ramdisk {size / 1e6:.2f} MB ({compressor})")
+
+        bytecode = None
+        if closure and bytecode_python:
+            bytecode = compile_bytecode(bytecode_python, [name for name in closure if name.endswith(".py")])
+
+        with tempfile.TemporaryDirectory() as home:
+            python_home(home, lib_entries, bytecode)
+            env = dict(os.environ, PYTHONHOME=home, PYTHONDONTWRITEBYTECODE="1")
+            times = format_import_times(rd_cmd, file_imports, env)
+
+        if times is None:
+            print("  import time: skipped, the ramdisk's python3 can't run on this host")
+        else:
+            ran = True
+            print(f"  import time: {times}")
+
+    if not ran:
+        env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+        times = format_import_times([sys.executable, "-I"], file_imports, env)
+        print(f"host Python {sys.version_info[0]}.{sys.version_info[1]} import time: {times}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack the freqbench ramdisk.")
+    parser.add_argument("-c", "--compressor", choices=COMPRESSORS, default="gzip",
+            help="compression for the ramdisk (default: gzip)")
+    parser.add_argument("-o", "--output", help="output path (default: rd-new.cpio with an extension for the compressor)")
+    parser.add_argument("--force", action="store_true", help="rebuild the cached base archive")
+    parser.add_argument("--minimal", action="store_true",
+            help="only include Python standard library modules that freqbench imports")
+    parser.add_argument("--bytecode", metavar="PYTHON3.8",
+            help="with --minimal, precompile the standard library with this Python 3.8 interpreter")
+    parser.add_argument("--report", action="store_true",
+            help="compare the size and Python import time of full and minimal ramdisks")
+    args = parser.parse_args()
+    if args.bytecode and not args.minimal:
+        parser.error("--bytecode requires --minimal")
+
+    start = time.perf_counter()
+    output = os.path.abspath(args.output) if args.output else None
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    output = output or "rd-new" + cpio_suffix(args.compressor)
+    mtime = int(os.environ.get("SOURCE_DATE_EPOCH", 0))
+
+    base_path, cached = cached_base(mtime, args.compressor, args.force, args.minimal, args.bytecode)
+    overlay = pack_overlay(OVERLAY_FILES, mtime, args.compressor)
+
+    tmp_output = output + ".tmp"
+    shutil.copyfile(base_path, tmp_output)
+    with open(tmp_output, "ab") as f:
+        f.write(overlay)
+    os.replace(tmp_output, output)
+
+    elapsed = time.perf_counter() - start
+    print(f"{output}: {os.path.getsize(output) / 1e6:.1f} MB, base {'cached' if cached else 'rebuilt'}, "
+            f"{elapsed * 1000:.0f} ms", file=sys.stderr)
+
+    if args.report:
+        # The other variant is built (and cached) for comparison
+        other_path, _ = cached_base(mtime, args.compressor, minimal=not args.minimal)
+        bases = {"minimal": base_path, "full": other_path} if args.minimal else \
+                {"full": base_path, "minimal": other_path}
+        report(args.compressor, bases, len(overlay), args.bytecode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+
+from freqbench.cli import main
+
+# Usage: analyze.py results.json step [args...] [+ step [args...]]...
+# Run with --help for the list of steps.
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+from freqbench import load_results
+
+# Usage: convert_results.py results.json...
+# Converts results to version 2 in place, moving raw power samples out of
+# results.json into results.samples.bin next to it. Converted results are skipped.
+for path in sys.argv[1:]:
+    results = load_results(path)
+    if results.version >= 2:
+        print(f"{path}: already converted")
+        continue
+
+    old_size = os.path.getsize(path)
+    results.data["version"] = 2
+    results.save(path)
+
+    print(f"{path}: {old_size // 1024} KiB -> {os.path.getsize(path) // 1024} KiB")
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+import csv
+import os
+import sys
+import time
+
+from freqbench.power_model import fit_corpus
+
+results_dir = sys.argv[1] if len(sys.argv) > 1 else "../results"
+
+start = time.perf_counter()
+fits = fit_corpus(results_dir)
+elapsed_ms = (time.perf_counter() - start) * 1000
+print(f"Fitted {len(fits)} clusters in {elapsed_ms:.0f} ms", file=sys.stderr)
+
+writer = csv.writer(sys.stdout)
+writer.writerow(["SoC", "Run", "Voltages", "CPU", "Freqs", "Skipped freqs", "C", "C 95% CI", "C (mean)",
+        "C (shipped)", "C with L", "C with L 95% CI", "L (µW/V)", "L 95% CI", "RMS residual"])
+for soc, results_path, volt_path, fit in fits:
+    writer.writerow([
+        soc,
+        os.path.basename(os.path.dirname(results_path)),
+        os.path.basename(volt_path),
+        fit.cpu,
+        len(fit.freqs),
+        len(fit.dropped),
+        f"{fit.dpc_fit:.1f}",
+        f"{fit.dpc_fit_ci95:.1f}",
+        f"{fit.dpc_mean:.1f}",
+        f"{fit.dpc:.1f}",
+        *[f"{value:.1f}" for pair in zip(fit.coefs, fit.ci95) for value in pair],
+        f"{fit.rms_residual:.4f}",
+    ])
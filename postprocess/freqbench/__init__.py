@@ -0,0 +1,18 @@
+"""Loading and analysis of freqbench results."""
+
+from .cache import load_json
+from .results import CPU_LABELS, Cluster, Results, find_runs, load_results
+from .samples import load_samples
+from .voltages import load_voltages, parse_voltages
+
+__all__ = [
+    "CPU_LABELS",
+    "Cluster",
+    "Results",
+    "find_runs",
+    "load_json",
+    "load_results",
+    "load_samples",
+    "load_voltages",
+    "parse_voltages",
+]
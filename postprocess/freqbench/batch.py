@@ -0,0 +1,139 @@
+"""Headless batch rendering of graphs for a whole results tree.
+
+Figures are rendered in parallel with the Agg backend. A manifest in the output
+directory records a hash of each figure's inputs, so figures are only rendered
+again when their inputs or the renderer change.
+"""
+
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, NamedTuple, Tuple
+
+from .cache import file_hash
+from .results import find_runs
+
+# Bump to invalidate all rendered figures, e.g. when graph styles change
+RENDER_VERSION = 1
+MANIFEST_FILE = ".render_manifest.json"
+
+class RenderJob(NamedTuple):
+    # unified, runs, or voltages
+    kind: str
+    # (label, path) pairs
+    inputs: Tuple[Tuple[str, str], ...]
+    col_name: str
+    title: str
+    out: str
+
+def find_jobs(results_dir: str, out_dir: str, formats: List[str]) -> List[RenderJob]:
+    """List figures for every run, SoC, and metric in a results tree.
+
+    Runs are found with find_runs(), and voltages in soc/voltages*.txt.
+    """
+    from .graphs import COL_LABELS
+
+    jobs = []
+    socs: Dict[str, List[Tuple[str, str]]] = {}
+    for soc, run, path in find_runs(results_dir):
+        socs.setdefault(soc, []).append((run, path))
+
+        for col_name in COL_LABELS:
+            for fmt in formats:
+                out = os.path.join(out_dir, soc, run, f"{col_name}.{fmt}")
+                jobs.append(RenderJob("unified", ((run, path),), col_name, f"{soc} {run}", out))
+
+    # Compare runs of the same SoC
+    for soc, runs in socs.items():
+        if len(runs) < 2:
+            continue
+
+        for col_name in COL_LABELS:
+            for fmt in formats:
+                out = os.path.join(out_dir, soc, "runs", f"{col_name}.{fmt}")
+                jobs.append(RenderJob("runs", tuple(runs), col_name, soc, out))
+
+    for path in sorted(glob.glob(os.path.join(results_dir, "*", "voltages*.txt"))):
+        soc = os.path.basename(os.path.dirname(path))
+        name = os.path.splitext(os.path.basename(path))[0]
+        for fmt in formats:
+            out = os.path.join(out_dir, soc, f"{name}.{fmt}")
+            jobs.append(RenderJob("voltages", ((soc, path),), "", soc, out))
+
+    return jobs
+
+def job_key(job: RenderJob, input_hashes: Dict[str, str]) -> str:
+    """Hash of everything that affects a rendered figure."""
+    import matplotlib
+
+    key = [RENDER_VERSION, matplotlib.__version__, job.kind, job.col_name, job.title, os.path.splitext(job.out)[1]]
+    key += [(label, input_hashes[path]) for label, path in job.inputs]
+    return file_hash(json.dumps(key).encode())
+
+def render_job(job: RenderJob) -> str:
+    from . import graphs
+    from .results import load_results
+    from .voltages import load_voltages
+
+    if job.kind == "unified":
+        _, path = job.inputs[0]
+        fig = graphs.unified_cluster_graph(load_results(path), job.col_name, f"{job.title}: {graphs.col_label(job.col_name)}",
+                headless=True)
+    elif job.kind == "runs":
+        socs = {label: load_results(path) for label, path in job.inputs}
+        fig = graphs.cross_cpu_cluster_graph(socs, job.col_name, flags={"soccolor"}, headless=True)
+        fig.axes[0].set_title(f"{job.title}: {graphs.col_label(job.col_name)}")
+    elif job.kind == "voltages":
+        socs = {label: load_voltages(path) for label, path in job.inputs}
+        fig = graphs.cross_cpu_voltage_graph(socs, headless=True)
+    else:
+        raise ValueError(f"Unknown job kind: {job.kind}")
+
+    os.makedirs(os.path.dirname(job.out), exist_ok=True)
+    graphs.save_figure(fig, job.out)
+    return job.out
+
+def render_all(results_dir: str, out_dir: str, formats: List[str], workers: int = None, force: bool = False) -> int:
+    """Render all figures that are missing or out of date. Returns the number of failures."""
+    jobs = find_jobs(results_dir, out_dir, formats)
+
+    input_hashes = {}
+    for job in jobs:
+        for _, path in job.inputs:
+            if path not in input_hashes:
+                with open(path, "rb") as f:
+                    input_hashes[path] = file_hash(f.read())
+
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    manifest = {}
+    if not force and os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+
+    keys = {job.out: job_key(job, input_hashes) for job in jobs}
+    pending = [job for job in jobs if manifest.get(job.out) != keys[job.out] or not os.path.exists(job.out)]
+    print(f"Rendering {len(pending)} of {len(jobs)} figures")
+
+    failures = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(render_job, job): job for job in pending}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                future.result()
+                manifest[job.out] = keys[job.out]
+            except Exception as e:
+                failures += 1
+                manifest.pop(job.out, None)
+                print(f"Failed to render {job.out}: {e}", file=sys.stderr)
+
+    # Forget figures that no longer exist in the results tree
+    manifest = {out: key for out, key in manifest.items() if out in keys}
+
+    os.makedirs(out_dir, exist_ok=True)
+    with open(manifest_path, "w+") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+    return failures
@@ -0,0 +1,50 @@
+import hashlib
+import json
+import os
+import pickle
+
+# Bump when the cached representation changes
+CACHE_VERSION = 1
+
+# Set FREQBENCH_CACHE_DIR to an empty string to disable caching
+CACHE_DIR = os.environ.get(
+    "FREQBENCH_CACHE_DIR",
+    os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "freqbench"),
+)
+
+def file_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def load_json(path: str) -> dict:
+    """Load a JSON file, using a parsed copy from the cache if the file hasn't changed.
+
+    Cache entries are keyed by the hash of the file's contents, so they're
+    shared between copies of the same results and never go stale.
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+
+    if not CACHE_DIR:
+        return json.loads(raw)
+
+    cache_path = os.path.join(CACHE_DIR, f"{file_hash(raw)}.v{CACHE_VERSION}.pickle")
+    try:
+        with open(cache_path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+
+    data = json.loads(raw)
+
+    # Write atomically in case other processes are reading the same entry
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # Caching is best-effort, e.g. on read-only filesystems
+        pass
+
+    return data
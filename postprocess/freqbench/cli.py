@@ -0,0 +1,239 @@
+"""Command-line interface for running several analysis steps on the same results.
+
+Results are only loaded once, and matplotlib is only imported if a step draws a graph.
+Steps are separated by "+" and run in order. Steps that remove frequencies
+(filter, efficient-freqs) affect all later steps.
+
+Example:
+    analyze.py results.json idle-csv idle.csv + efficient-freqs eff.json + cluster-graph power_mean power.png
+"""
+
+import argparse
+import os
+import sys
+from contextlib import contextmanager
+
+from .results import load_results
+from .voltages import load_voltages, parse_voltages
+
+STEP_SEPARATOR = "+"
+
+@contextmanager
+def open_output(path):
+    """Open a text output file, or stdout for "-"."""
+    if path == "-":
+        yield sys.stdout
+    else:
+        with open(path, "w+", newline="" if path.endswith(".csv") else None) as f:
+            yield f
+
+def load_dtb(path):
+    """Load the first DTB in a file, which may contain several."""
+    from .fdt import load_dtbs
+
+    with open(path, "rb") as f:
+        fdts, _ = load_dtbs(f.read())
+    if len(fdts) > 1:
+        print(f"Using the first of {len(fdts)} DTBs in {path}", file=sys.stderr)
+
+    return fdts[0]
+
+def step_idle_csv(results, args, state):
+    from .tables import write_idle_csv
+
+    with open_output(args.out) as f:
+        write_idle_csv(results, f)
+
+def step_cluster_col(results, args, state):
+    from .tables import write_cluster_col_csv
+
+    with open_output(args.out) as f:
+        write_cluster_col_csv(results, args.col, f)
+
+def step_cluster_graph(results, args, state):
+    from .graphs import save_figure, unified_cluster_graph
+
+    fig = unified_cluster_graph(results, args.col, args.title, headless=state["headless"])
+    if args.out:
+        save_figure(fig, args.out)
+    else:
+        state["show"] = True
+
+def step_efficient_freqs(results, args, state):
+    from .efficiency import efficient_freqs
+
+    results.keep_opps(efficient_freqs(results, log=sys.stderr, count=args.count, tolerance=args.tolerance))
+    if args.out:
+        results.save(args.out)
+
+def step_filter(results, args, state):
+    results.keep_opps(set(tuple(int(v) for v in opp.split(".")) for opp in args.opps))
+    if args.out:
+        results.save(args.out)
+
+def step_save(results, args, state):
+    results.save(args.out)
+
+def step_legacy_model(results, args, state):
+    from .energy_model import legacy_energy_model, parse_legacy_model
+
+    key_type, value_type = args.type.split("/")
+    old_model = None
+    if args.old_model:
+        with open(args.old_model, "r") as f:
+            old_model = parse_legacy_model(f.read())
+
+    with open_output(args.out) as f:
+        f.write(legacy_energy_model(results, key_type, value_type, old_model))
+
+def step_simplified_model(results, args, state):
+    from .energy_model import simplified_energy_model
+
+    voltages = parse_voltages(args.opps)
+    if args.voltages:
+        voltages.update(load_voltages(args.voltages))
+
+    with open_output(args.out) as f:
+        f.write(simplified_energy_model(results, voltages))
+
+def step_opp_model(results, args, state):
+    from .energy_model import opp_energy_model
+
+    voltages = parse_voltages(args.opps)
+    if args.voltages:
+        voltages.update(load_voltages(args.voltages))
+
+    with open_output(args.out) as f:
+        f.write(opp_energy_model(load_dtb(args.dtb), results, voltages))
+
+def step_report(results, args, state):
+    """Write all text outputs and graphs for one set of results to a directory."""
+    from .energy_model import legacy_energy_model, opp_energy_model, simplified_energy_model
+    from .graphs import COL_LABELS, save_figure, unified_cluster_graph
+    from .tables import write_cluster_col_csv, write_idle_csv
+
+    os.makedirs(args.dir, exist_ok=True)
+    def out_path(name):
+        return os.path.join(args.dir, name)
+
+    with open(out_path("idle.csv"), "w+", newline="") as f:
+        write_idle_csv(results, f)
+
+    for col_name in COL_LABELS:
+        with open(out_path(f"{col_name}.csv"), "w+", newline="") as f:
+            write_cluster_col_csv(results, col_name, f)
+
+        fig = unified_cluster_graph(results, col_name, headless=True)
+        save_figure(fig, out_path(f"{col_name}.{args.format}"))
+
+    with open(out_path("legacy_energy_model.dtsi"), "w+") as f:
+        f.write(legacy_energy_model(results, "cap", "power"))
+
+    voltages = load_voltages(args.voltages) if args.voltages else {}
+    if voltages:
+        with open(out_path("simplified_energy_model.dtsi"), "w+") as f:
+            f.write(simplified_energy_model(results, voltages))
+
+    if args.dtb:
+        with open(out_path("opp_energy_model.dtso"), "w+") as f:
+            f.write(opp_energy_model(load_dtb(args.dtb), results, voltages))
+
+def create_parser():
+    parser = argparse.ArgumentParser(prog="analyze.py", add_help=False)
+    steps = parser.add_subparsers(dest="step", required=True)
+
+    step = steps.add_parser("idle-csv", help="idle power and energy for each frequency")
+    step.add_argument("out", help="CSV file, or - for stdout")
+    step.set_defaults(func=step_idle_csv)
+
+    step = steps.add_parser("cluster-col", help="value for each cluster as CSV")
+    step.add_argument("col", help="field in active stats, e.g. coremark_score")
+    step.add_argument("out", help="CSV file, or - for stdout")
+    step.set_defaults(func=step_cluster_col)
+
+    step = steps.add_parser("cluster-graph", help="graph a value for each cluster")
+    step.add_argument("col", help="field in active stats, e.g. coremark_score")
+    step.add_argument("out", nargs="?", help="image file (PNG, SVG, etc.), or show interactively if omitted")
+    step.add_argument("--title")
+    step.set_defaults(func=step_cluster_graph)
+
+    step = steps.add_parser("efficient-freqs", help="keep only efficient frequencies")
+    step.add_argument("out", nargs="?", help="results.json with only efficient frequencies")
+    step.add_argument("-n", "--count", type=int, help="maximum number of frequencies per cluster")
+    step.add_argument("-t", "--tolerance", type=float, default=0.0, help="keep frequencies using up to this fraction more power than the most efficient ones")
+    step.set_defaults(func=step_efficient_freqs)
+
+    step = steps.add_parser("filter", help="keep only the given frequencies")
+    step.add_argument("opps", nargs="+", metavar="cpu.freq")
+    step.add_argument("-o", "--out", help="results.json with only the given frequencies")
+    step.set_defaults(func=step_filter)
+
+    step = steps.add_parser("save", help="write results, e.g. after filtering")
+    step.add_argument("out", help="results.json")
+    step.set_defaults(func=step_save)
+
+    step = steps.add_parser("legacy-model", help="legacy EAS energy model (energy-costs)")
+    step.add_argument("out", nargs="?", default="-", help="DTS file, or - for stdout")
+    step.add_argument("--type", default="freq/power", help="key/value type: freq or cap / power or energy")
+    step.add_argument("--old-model", help="existing model to take idle and cluster costs from")
+    step.set_defaults(func=step_legacy_model)
+
+    step = steps.add_parser("simplified-model", help="simplified EAS energy model (dynamic-power-coefficient)")
+    step.add_argument("opps", nargs="*", metavar="cpu.freq=uV")
+    step.add_argument("-o", "--out", default="-", help="DTS file, or - for stdout")
+    step.add_argument("--voltages", help="voltages.txt with cpu.freq=uV entries")
+    step.set_defaults(func=step_simplified_model)
+
+    step = steps.add_parser("opp-model", help="EAS energy model overlay (opp-microwatt) for Linux 5.x and newer")
+    step.add_argument("dtb", help="DTB with the CPU OPP tables (the first one is used)")
+    step.add_argument("opps", nargs="*", metavar="cpu.freq=uV")
+    step.add_argument("-o", "--out", default="-", help="DTS overlay file, or - for stdout")
+    step.add_argument("--voltages", help="voltages.txt with cpu.freq=uV entries")
+    step.set_defaults(func=step_opp_model)
+
+    step = steps.add_parser("report", help="write all CSVs, graphs, and energy models to a directory")
+    step.add_argument("dir")
+    step.add_argument("--voltages", help="voltages.txt for the simplified energy model")
+    step.add_argument("--dtb", help="DTB with the CPU OPP tables for the OPP energy model")
+    step.add_argument("--format", default="png", help="image format for graphs")
+    step.set_defaults(func=step_report)
+
+    return parser
+
+def split_steps(argv):
+    steps = [[]]
+    for arg in argv:
+        if arg == STEP_SEPARATOR:
+            steps.append([])
+        else:
+            steps[-1].append(arg)
+
+    return [step for step in steps if step]
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    parser = create_parser()
+    if len(argv) < 2 or argv[0] in ("-h", "--help"):
+        print(f"Usage: analyze.py results.json step [args...] [{STEP_SEPARATOR} step [args...]]...", file=sys.stderr)
+        print(__doc__, file=sys.stderr)
+        parser.print_help(sys.stderr)
+        sys.exit(0 if argv[:1] in (["-h"], ["--help"]) else 2)
+
+    # Validate all steps before running any of them
+    step_args = [parser.parse_args(step) for step in split_steps(argv[1:])]
+
+    # Don't open windows unless a graph is going to be shown
+    state = {
+        "headless": all(args.step != "cluster-graph" or args.out for args in step_args),
+        "show": False,
+    }
+
+    results = load_results(argv[0])
+    for args in step_args:
+        args.func(results, args, state)
+
+    if state["show"]:
+        from .graphs import pyplot
+        pyplot().show()
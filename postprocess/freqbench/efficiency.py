@@ -0,0 +1,206 @@
+import sys
+from typing import List, Optional, Sequence, Set, TextIO, Tuple
+
+import numpy as np
+
+from .results import Cluster, Results
+
+def _gather(arr: np.ndarray, idx: np.ndarray) -> np.ndarray:
+    return np.take_along_axis(arr, idx, axis=1)
+
+def _neighbors(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Indices of the previous and next selected points for each point, or -1 and n if there are none."""
+    n = mask.shape[1]
+    idx = np.arange(n)
+
+    prev_sel = np.where(mask, idx, -1)
+    prev_sel = np.maximum.accumulate(prev_sel, axis=1)
+    prev_sel = np.concatenate([np.full((mask.shape[0], 1), -1), prev_sel[:, :-1]], axis=1)
+
+    next_sel = np.where(mask, idx, n)
+    next_sel = np.minimum.accumulate(next_sel[:, ::-1], axis=1)[:, ::-1]
+    next_sel = np.concatenate([next_sel[:, 1:], np.full((mask.shape[0], 1), n)], axis=1)
+
+    return prev_sel, next_sel
+
+def _chord_power(perf: np.ndarray, power: np.ndarray, prev_sel: np.ndarray, next_sel: np.ndarray) -> np.ndarray:
+    """Power on the line between the neighboring selected points, or NaN at the ends."""
+    n = perf.shape[1]
+    has_both = (prev_sel >= 0) & (next_sel < n)
+    prev_c = np.clip(prev_sel, 0, n - 1)
+    next_c = np.clip(next_sel, 0, n - 1)
+
+    x0, y0 = _gather(perf, prev_c), _gather(power, prev_c)
+    x1, y1 = _gather(perf, next_c), _gather(power, next_c)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        chord = y0 + (y1 - y0) * (perf - x0) / (x1 - x0)
+
+    return np.where(has_both, chord, np.nan)
+
+def lower_hull(perf: np.ndarray, power: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """Mark points on the lower convex hull of each row, using Andrew's monotone chain.
+
+    Rows must be sorted by performance, with invalid points at the end. All rows
+    are processed at the same time, so the number of NumPy operations only
+    depends on the row length.
+    """
+    rows, n = perf.shape
+    stack = np.zeros((rows, n), dtype=np.int64)
+    top = np.zeros(rows, dtype=np.int64)
+    all_rows = np.arange(rows)
+
+    for k in range(n):
+        active = valid[:, k]
+
+        # Pop points that would make a non-convex (clockwise or straight) turn
+        while True:
+            pop = active & (top >= 2)
+            if not pop.any():
+                break
+
+            a = stack[all_rows, np.maximum(top - 2, 0)]
+            b = stack[all_rows, np.maximum(top - 1, 0)]
+            xa, ya = perf[all_rows, a], power[all_rows, a]
+            xb, yb = perf[all_rows, b], power[all_rows, b]
+            cross = (xb - xa) * (power[:, k] - ya) - (yb - ya) * (perf[:, k] - xa)
+
+            pop &= cross <= 0
+            if not pop.any():
+                break
+
+            top[pop] -= 1
+
+        stack[all_rows[active], top[active]] = k
+        top[active] += 1
+
+    hull = np.zeros((rows, n), dtype=bool)
+    stack_rows, stack_pos = np.nonzero(np.arange(n) < top[:, None])
+    hull[stack_rows, stack[stack_rows, stack_pos]] = True
+    return hull
+
+def efficient_masks(perf: np.ndarray, power: np.ndarray, count: Optional[int] = None, tolerance: float = 0.0,
+        race_to_idle: bool = True) -> np.ndarray:
+    """Select efficient operating points for many clusters at once.
+
+    perf and power are 2D arrays with one row per cluster, padded with NaN.
+    Power must be relative to idle, as in results.json. Returns a boolean mask
+    of efficient points with the same shape.
+
+    A point is efficient if it's on the lower convex hull of power vs.
+    performance: points above it use more energy than alternating between the
+    two neighboring points on the hull for the same average performance. With
+    race_to_idle, running at a point and then idling counts as an alternative,
+    so points slower than the most energy-efficient one are never efficient.
+    Points that use more power than a faster point are never efficient.
+
+    tolerance keeps points that use up to the given fraction more power than
+    the hull, since measurements are noisy. If count is set, points are removed
+    until at most that many are left per cluster, starting with the ones that
+    add the least over the line between their neighbors. The fastest point is
+    always kept.
+    """
+    perf = np.atleast_2d(np.asarray(perf, dtype=np.float64))
+    power = np.atleast_2d(np.asarray(power, dtype=np.float64))
+    rows, n = perf.shape
+    valid = ~(np.isnan(perf) | np.isnan(power))
+
+    if race_to_idle:
+        # Idle is a free point at the origin
+        perf = np.concatenate([np.zeros((rows, 1)), perf], axis=1)
+        power = np.concatenate([np.zeros((rows, 1)), power], axis=1)
+        valid = np.concatenate([np.ones((rows, 1), dtype=bool), valid], axis=1)
+
+    # Sort by performance, then power, with invalid points at the end: O(n log n)
+    order = np.lexsort((np.where(valid, power, np.inf), np.where(valid, perf, np.inf)), axis=1)
+    s_perf = _gather(perf, order)
+    s_power = _gather(power, order)
+    s_valid = _gather(valid, order)
+
+    hull = lower_hull(s_perf, s_power, s_valid)
+
+    # Drop points that are slower than another point with the same or lower power
+    later_min = np.minimum.accumulate(np.where(s_valid, s_power, np.inf)[:, ::-1], axis=1)[:, ::-1]
+    later_min = np.concatenate([later_min[:, 1:], np.full((rows, 1), np.inf)], axis=1)
+    dominated = s_power >= later_min
+
+    selected = hull & ~dominated
+    if tolerance > 0:
+        prev_sel, next_sel = _neighbors(selected)
+        chord = _chord_power(s_perf, s_power, prev_sel, next_sel)
+        with np.errstate(invalid="ignore"):
+            near = s_valid & ~dominated & (s_power <= chord + np.abs(chord) * tolerance)
+
+        selected |= near
+
+    if race_to_idle:
+        # The origin is only used for the hull
+        selected &= order != 0
+
+    if count is not None:
+        fastest = np.zeros_like(selected)
+        last = np.where(selected.any(axis=1), np.max(np.where(selected, np.arange(selected.shape[1]), -1), axis=1), 0)
+        fastest[np.arange(rows), last] = selected[np.arange(rows), last]
+
+        while True:
+            excess = selected.sum(axis=1) - count
+            shrink = excess > 0
+            if not shrink.any():
+                break
+
+            # Cost of removing a point: how far it is below the line between its neighbors
+            anchors = selected | (order == 0) if race_to_idle else selected
+            prev_sel, next_sel = _neighbors(anchors)
+            chord = _chord_power(s_perf, s_power, prev_sel, next_sel)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                cost = (chord - s_power) / np.abs(chord)
+
+            cost = np.where(np.isnan(cost), np.inf, cost)
+            cost = np.where(selected & ~fastest & shrink[:, None], cost, np.inf)
+            worst = np.argmin(cost, axis=1)
+            remove = shrink & np.isfinite(cost[np.arange(rows), worst])
+            if not remove.any():
+                break
+
+            selected[np.arange(rows)[remove], worst[remove]] = False
+
+    # Undo sorting
+    mask = np.zeros_like(selected)
+    np.put_along_axis(mask, order, selected, axis=1)
+    return mask[:, 1:] if race_to_idle else mask
+
+def _perf_col(load: str) -> str:
+    return "coremark_score" if load in ("active", "idle") else "score"
+
+def cluster_masks(clusters: Sequence[Cluster], load: str = "active", **kwargs) -> List[np.ndarray]:
+    """Select efficient frequencies for any number of clusters, e.g. from a whole corpus, in one batch.
+
+    Returns a boolean mask for each cluster, aligned with cluster.freqs.
+    Keyword arguments are passed to efficient_masks.
+    """
+    width = max((len(cluster) for cluster in clusters), default=0)
+    perf = np.full((len(clusters), width), np.nan)
+    power = np.full((len(clusters), width), np.nan)
+    for i, cluster in enumerate(clusters):
+        perf[i, :len(cluster)] = cluster.column(_perf_col(load), load)
+        power[i, :len(cluster)] = cluster.column("power_mean", load)
+
+    masks = efficient_masks(perf, power, **kwargs)
+    return [masks[i, :len(cluster)] for i, cluster in enumerate(clusters)]
+
+def efficient_freqs(results: Results, log: TextIO = sys.stdout, count: Optional[int] = None,
+        tolerance: float = 0.0) -> Set[Tuple[int, int]]:
+    """Pick efficient (cpu, freq) pairs for each cluster, based on energy vs. performance."""
+    clusters = list(results)
+    masks = cluster_masks(clusters, count=count, tolerance=tolerance)
+
+    eff_opps = set()
+    for cluster, mask in zip(clusters, masks):
+        print(f"cpu{cluster.cpu}:", file=log)
+
+        for freq, eff in zip(cluster.freqs[mask].tolist(), cluster.ulpmark[mask].tolist()):
+            print(f"{freq} ({eff:.1f} iter/mJ)", file=log)
+            eff_opps.add((cluster.cpu, freq))
+
+        print(file=log)
+
+    return eff_opps
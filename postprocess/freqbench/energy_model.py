@@ -0,0 +1,456 @@
+import io
+import re
+import sys
+from typing import Dict, Optional, Sequence, TextIO, Tuple
+
+import numpy as np
+
+from .fdt import Fdt, Node
+from .power_model import PowerFit, fit_clusters
+from .results import Cluster, Results
+
+LEGACY_DTS_HEADER = """/*
+ * Auto-generated legacy EAS energy model for incorporation in SoC device tree.
+ * Generated by freqbench postprocessing scripts using freqbench results.
+ * More info at https://github.com/kdrag0n/freqbench
+ */
+
+/ {
+\tcpus {"""
+
+SIMPLIFIED_DTS_HEADER = """/*
+ * Auto-generated simplified EAS energy model for incorporation in SoC device tree.
+ * Generated by freqbench postprocessing scripts using freqbench results.
+ * More info at https://github.com/kdrag0n/freqbench
+ */
+
+/ {
+\tcpus {"""
+
+OPP_DTS_HEADER = """/*
+ * Auto-generated EAS energy model overlay with OPP power (opp-microwatt) and
+ * CPU capacities, for the Energy Model framework in Linux 5.x and newer.
+ * Generated by freqbench postprocessing scripts using freqbench results.
+ * More info at https://github.com/kdrag0n/freqbench
+ */
+
+/dts-v1/;
+/plugin/;
+"""
+
+def parse_legacy_model(dtsi: str) -> dict:
+    """Parse core and cluster costs from an existing legacy energy model.
+
+    Example:
+    {
+        "core": [
+            {
+                "busy": [1, 2, 3, 4, 5, 6],
+                "idle": [3, 2, 1],
+            },
+            {
+                "busy": [10, 20, 30, 40, 50, 60],
+                "idle": [5, 3, 2],
+            },
+        ],
+        "cluster": [
+            {
+                "busy": [1, 1, 1, 2, 3, 3],
+                "idle": [2, 2, 1],
+            },
+            {
+                "busy": [2, 2, 3, 4, 4, 5],
+                "idle": [4, 2, 1],
+            },
+        ],
+    }
+    """
+    old_model = {"core": [], "cluster": []}
+
+    # Rudimentary line-by-line DTS parser, will break with unexpected data
+    cpu_i = -1
+    data_block = None
+    cost_block = None
+    for line in dtsi.split("\n"):
+        match = re.search(r"(core|cluster)-cost(\d+)\s+\{", line)
+        if match:
+            new_data_block = match.group(1)
+            if new_data_block == data_block:
+                cpu_i += 1
+            else:
+                cpu_i = 0
+
+            data_block = new_data_block
+            old_model[data_block].append({})
+            continue
+
+        match = re.search(r"(busy|idle)-cost-data\s+=", line)
+        if match:
+            cost_block = match.group(1)
+            old_model[data_block][cpu_i][cost_block] = []
+            continue
+
+        if cost_block == "busy":
+            match = re.search(r"^\s*(\d+)\s+(\d+)\s*$", line)
+            if match:
+                value = int(match.group(2))
+
+                # Ignore keys (cap/freq) and use indices instead
+                # Assumption: all freqs are present in both
+                old_model[data_block][cpu_i]["busy"].append(value)
+        elif cost_block == "idle":
+            if re.match(r"^\s*(?:\d+\s*)+$", line):
+                # Extend array to accomodate single-line costs, e.g. qcom format
+                idle_costs = [int(cost) for cost in re.split(r"\s+", line.strip())]
+                old_model[data_block][cpu_i]["idle"] += idle_costs
+
+        if re.match(r"^\s*>;\s*$", line):
+            cost_block = None
+
+    return old_model
+
+def scaled_cm_mhz(results: Results) -> Dict[int, float]:
+    """Performance efficiency at the max freq of each cluster, scaled to 1024."""
+    unscaled_cpu_cm_mhz = {cluster.cpu: cluster.coremarks_per_mhz[-1] for cluster in results}
+
+    max_cm_mhz = max(unscaled_cpu_cm_mhz.values())
+    return {
+        cpu: cm_mhz / max_cm_mhz * 1024
+        for cpu, cm_mhz in unscaled_cpu_cm_mhz.items()
+    }
+
+def legacy_energy_model(results: Results, key_type: str = "freq", value_type: str = "power",
+        old_model: Optional[dict] = None) -> str:
+    """Create a legacy EAS energy model (energy-costs) as device tree source.
+
+    key_type is "freq" or "cap", and value_type is "power" or "energy".
+    Idle and cluster costs are taken from old_model if available.
+    """
+    out = io.StringIO()
+    print(LEGACY_DTS_HEADER, end="", file=out)
+
+    scaled_cpu_cm_mhz = scaled_cm_mhz(results)
+
+    # Pass 1: performance efficiency (for capacity scaling)
+    for cluster in results:
+        cpu = cluster.cpu
+        cm_mhz_norm = scaled_cpu_cm_mhz[cpu]
+
+        lb = "{"
+        rb = "}"
+        print(f"""
+\t\tcpu@{0 if cpu == 1 else cpu} {lb}
+\t\t\tefficiency = <{cm_mhz_norm:.0f}>;
+\t\t\tcapacity-dmips-mhz = <{cm_mhz_norm:.0f}>;
+\t\t{rb};""", file=out)
+
+    print("""\t};
+
+\tenergy_costs: energy-costs {
+\t\tcompatible = "sched-energy";""", file=out)
+
+    max_perf = max(cluster.score.max() for cluster in results)
+
+    # Pass 2: core costs
+    core_cost_keys = []
+    for cpu_i, cluster in enumerate(results):
+        core_cost_keys.append([])
+
+        lb = "{"
+        rb = "}"
+        print(f"""
+\t\tCPU_COST_{cpu_i}: core-cost{cpu_i} {lb}
+\t\t\tbusy-cost-data = <""", file=out)
+
+        if value_type == "power":
+            values = cluster.power
+        elif value_type == "energy":
+            values = cluster.energy
+
+        for freq, score, value in zip(cluster.freqs.tolist(), cluster.score.tolist(), values.tolist()):
+            if key_type == "freq":
+                key = freq
+                print(f"\t\t\t\t{key: 8.0f}{value: 5.0f}", file=out)
+            elif key_type == "cap":
+                # Floor to match CPU integer math
+                key = score / max_perf * 1024
+                print(f"\t\t\t\t{key: 5.0f}{value: 5.0f}", file=out)
+
+            core_cost_keys[cpu_i].append(key)
+
+        if old_model:
+            idle_costs = " ".join(map(str, old_model["core"][cpu_i]["idle"]))
+        else:
+            # Placeholder in lieu of real data
+            idle_costs = "3 2 1"
+
+        print(f"""\t\t\t>;
+\t\t\tidle-cost-data = <
+\t\t\t\t{idle_costs}
+\t\t\t>;
+\t\t{rb};""", file=out)
+
+    # Pass 3: cluster costs
+    if old_model:
+        for cpu_i, new_keys in enumerate(core_cost_keys):
+            lb = "{"
+            rb = "}"
+            print(f"""
+\t\tCLUSTER_COST_{cpu_i}: cluster-cost{cpu_i} {lb}
+\t\t\tbusy-cost-data = <""", file=out)
+
+            for cost_i, cost in enumerate(old_model["cluster"][cpu_i]["busy"]):
+                # Ignore silently for now instead of logging to stderr to make copy-pasting easier
+                # This happens with qcom speed bin differences on newer SoCs
+                if cost_i >= len(new_keys):
+                    continue
+
+                key = new_keys[cost_i]
+                print(f"\t\t\t\t{key: 5.0f}{cost: 5.0f}", file=out)
+
+            idle_costs = " ".join(map(str, old_model["cluster"][cpu_i]["idle"]))
+
+            print(f"""\t\t\t>;
+\t\t\tidle-cost-data = <
+\t\t\t\t{idle_costs}
+\t\t\t>;
+\t\t{rb};""", file=out)
+
+    print("""\t};
+};""", file=out)
+    return out.getvalue()
+
+def simplified_energy_model(results: Results, voltages: Dict[Tuple[int, int], int], mode: str = "power",
+        log: TextIO = sys.stderr) -> str:
+    """Create a simplified EAS energy model (dynamic-power-coefficient) as device tree source.
+
+    voltages are in µV, keyed by (cpu, freq). The coefficient is fitted to total
+    power at all freqs with known voltages, without a leakage term because the
+    kernel doesn't have one, and the other freqs are skipped with a warning. If
+    the fit is too uncertain, the mean of the per-freq coefficients is used.
+    Fit results, including leakage from a separate fit, are written to log.
+    """
+    out = io.StringIO()
+    print(SIMPLIFIED_DTS_HEADER, file=out)
+
+    scaled_cpu_cm_mhz = scaled_cm_mhz(results)
+    fits = fit_clusters([(cluster, voltages) for cluster in results], mode)
+
+    for cluster, fit in zip(results, fits):
+        cpu = cluster.cpu
+        if fit.dropped and len(fit.freqs):
+            print(f"cpu{cpu}: skipping freqs without voltages: {', '.join(map(str, fit.dropped))}", file=log)
+        print(fit.summary(), file=log)
+
+        cm_mhz_norm = scaled_cpu_cm_mhz[cpu]
+        dpc = 0 if np.isnan(fit.dpc) else fit.dpc
+
+        lb = "{"
+        rb = "}"
+        print(f"""\t\tcpu@{0 if cpu == 1 else cpu} {lb}
+\t\t\tefficiency = <{cm_mhz_norm:.0f}>;
+\t\t\tcapacity-dmips-mhz = <{cm_mhz_norm:.0f}>;
+\t\t\tdynamic-power-coefficient = <{dpc:.0f}>;
+\t\t{rb};
+""", file=out)
+
+    print("""\t};
+};""", file=out)
+    return out.getvalue()
+
+def opp_power(cluster: Cluster, freqs: Sequence[int], voltages: Dict[Tuple[int, int], int],
+        fit: Optional[PowerFit] = None, log: TextIO = sys.stderr) -> Tuple[np.ndarray, np.ndarray]:
+    """Power per CPU (µW) at the given freqs, interpolating freqs that weren't benchmarked.
+
+    Missing freqs use the fitted power model if their voltage is known, and
+    otherwise linear interpolation (or extrapolation) of measured power.
+    Returns power and whether each value was interpolated.
+    """
+    freqs = np.array(sorted(freqs), dtype=np.int64)
+    measured_freqs = cluster.freqs
+    # Power is measured for all benchmarked cores at once
+    cores = len(cluster.stats(int(measured_freqs[0])).get("cores", [cluster.cpu]))
+    measured = cluster.power * 1000
+
+    power = np.full(len(freqs), np.nan)
+    idx = np.searchsorted(measured_freqs, freqs)
+    is_measured = (idx < len(measured_freqs)) & (measured_freqs[np.minimum(idx, len(measured_freqs) - 1)] == freqs)
+    power[is_measured] = measured[idx[is_measured]]
+
+    volts = np.array([voltages.get((cluster.cpu, freq), np.nan) for freq in freqs.tolist()]) / 1_000_000
+    if fit is not None and not np.isnan(fit.coefs).any():
+        c, leakage = fit.coefs
+        modeled = c * volts**2 * (freqs / 1000) + leakage * volts
+        power = np.where(np.isnan(power), modeled, power)
+
+    missing = np.isnan(power)
+    if missing.any():
+        valid = ~np.isnan(measured)
+        known_freqs = measured_freqs[valid]
+        known_power = measured[valid]
+        power[missing] = np.interp(freqs[missing], known_freqs, known_power)
+
+        # np.interp clamps, so extend the line through the closest two points instead
+        if len(known_freqs) >= 2:
+            for end, (i0, i1) in (("low", (0, 1)), ("high", (-2, -1))):
+                outside = missing & ((freqs < known_freqs[0]) if end == "low" else (freqs > known_freqs[-1]))
+                slope = (known_power[i1] - known_power[i0]) / (known_freqs[i1] - known_freqs[i0])
+                power[outside] = known_power[i0] + slope * (freqs[outside] - known_freqs[i0])
+
+    # The EM framework needs positive power, and noise shouldn't make higher freqs cheaper
+    power = np.maximum(power / cores, 1)
+    clamped = np.maximum.accumulate(power)
+    raised = clamped > power
+    if raised.any():
+        changes = ", ".join(f"{freq} ({old:.0f} -> {new:.0f} µW)"
+                for freq, old, new in zip(freqs[raised].tolist(), power[raised].tolist(), clamped[raised].tolist()))
+        print(f"cpu{cluster.cpu}: warning: power decreases with frequency, raised to match lower freqs: {changes}",
+                file=log)
+
+    return clamped, ~is_measured
+
+def _opp_table(fdt: Fdt, cpu_node: Node) -> Optional[Tuple[str, Node]]:
+    """Path and node of the OPP table a CPU node points to, if any."""
+    phandle = cpu_node.cells("operating-points-v2")
+    if not phandle:
+        return None
+
+    for path, node in fdt.root.walk():
+        if node.phandle == phandle[0]:
+            return path, node
+
+    return None
+
+def _opp_freq(opp: Node) -> Optional[int]:
+    """Frequency of an OPP node in kHz, from the first clock in opp-hz."""
+    cells = opp.cells("opp-hz")
+    if not cells or len(cells) < 2:
+        return None
+
+    return ((cells[0] << 32) | cells[1]) // 1000
+
+def opp_energy_model(fdt: Fdt, results: Results, voltages: Optional[Dict[Tuple[int, int], int]] = None,
+        log: TextIO = sys.stderr) -> str:
+    """Create an EAS energy model as a device tree overlay for the OPP tables in fdt.
+
+    opp-microwatt is added to the existing OPP nodes in the table each
+    cluster's CPUs point to with operating-points-v2, and capacity-dmips-mhz is
+    set on every CPU. The tables are otherwise left alone, so voltages, flags,
+    and speed bin selection keep working. Nodes are referenced by path, so the
+    overlay is only valid for the device tree it was created from.
+
+    OPPs that weren't benchmarked, e.g. from another speed bin, are
+    interpolated using voltages from opp-microvolt or the given voltages (in
+    µV, keyed by (cpu, freq)), which take precedence.
+    """
+    out = io.StringIO()
+    print(OPP_DTS_HEADER, file=out)
+
+    cpu_nodes = fdt.cpu_nodes()
+    clusters = list(results)
+    tables = []
+    all_voltages = {}
+    for cluster in clusters:
+        table = _opp_table(fdt, cpu_nodes[cluster.cpu]) if cluster.cpu < len(cpu_nodes) else None
+        if table is None:
+            print(f"cpu{cluster.cpu}: no OPP table in device tree, skipping opp-microwatt", file=log)
+        else:
+            for opp in table[1].children:
+                freq = _opp_freq(opp)
+                microvolt = opp.cells("opp-microvolt")
+                if freq is not None and microvolt:
+                    all_voltages[(cluster.cpu, freq)] = microvolt[0]
+        tables.append(table)
+    all_voltages.update(voltages or {})
+
+    fits = fit_clusters([(cluster, all_voltages) for cluster in clusters]) if all_voltages else [None] * len(clusters)
+    scaled_cpu_cm_mhz = scaled_cm_mhz(results)
+
+    annotated = set()
+    for cluster, fit, table in zip(clusters, fits, tables):
+        cpu = cluster.cpu
+        if table is None:
+            continue
+
+        table_path, table_node = table
+        if table_path in annotated:
+            print(f"cpu{cpu}: OPP table {table_path} is shared with another cluster, skipping", file=log)
+            continue
+        annotated.add(table_path)
+
+        opps = [(opp, _opp_freq(opp)) for opp in table_node.children]
+        opps = [(opp, freq) for opp, freq in opps if freq is not None]
+        freqs = sorted({freq for _, freq in opps})
+        if not freqs:
+            continue
+
+        power, interpolated = opp_power(cluster, freqs, all_voltages, fit, log)
+        if interpolated.any():
+            print(f"cpu{cpu}: interpolated power for {interpolated.sum()} freqs", file=log)
+
+        opp_uw = dict(zip(freqs, power.tolist()))
+        opp_interpolated = dict(zip(freqs, interpolated.tolist()))
+        print(f"/* cpu{cpu}: {table_path} */", file=out)
+        for opp, freq in opps:
+            print(f"&{{{table_path}/{opp.name}}} {{" + (" /* interpolated */" if opp_interpolated[freq] else ""), file=out)
+            print(f"\topp-microwatt = <{opp_uw[freq]:.0f}>;", file=out)
+            print("};", file=out)
+            print(file=out)
+
+    for cluster in clusters:
+        for domain_cpu in cluster.cpus:
+            if domain_cpu >= len(cpu_nodes):
+                continue
+
+            print(f"""&{{/cpus/{cpu_nodes[domain_cpu].name}}} {{
+\tcapacity-dmips-mhz = <{scaled_cpu_cm_mhz[cluster.cpu]:.0f}>;
+}};
+""", file=out)
+
+    return out.getvalue()
+
+def patch_energy_model(fdt: Fdt, results: Results, voltages: Optional[Dict[Tuple[int, int], int]] = None,
+        log: TextIO = sys.stderr):
+    """Write an energy model from results into CPU nodes of a device tree.
+
+    capacity-dmips-mhz is set for every CPU, and dynamic-power-coefficient if
+    voltages are given. Existing legacy energy-costs nodes referenced by CPUs
+    (sched-energy-costs) get new core busy costs, keyed by freq or capacity
+    like the original costs. Idle and cluster costs are kept as-is. CPUs are
+    matched to nodes by their order in /cpus, like Linux does.
+    """
+    cpu_nodes = fdt.cpu_nodes()
+    scaled_cpu_cm_mhz = scaled_cm_mhz(results)
+    fits = fit_clusters([(cluster, voltages) for cluster in results]) if voltages else [None] * len(results.clusters)
+    max_perf = max(cluster.score.max() for cluster in results)
+
+    for cluster, fit in zip(results, fits):
+        if fit is not None:
+            print(fit.summary(), file=log)
+
+        for cpu in cluster.cpus:
+            if cpu >= len(cpu_nodes):
+                print(f"cpu{cpu}: no CPU node in device tree, skipping", file=log)
+                continue
+
+            node = cpu_nodes[cpu]
+            node.set_cells("capacity-dmips-mhz", [round(scaled_cpu_cm_mhz[cluster.cpu])])
+            if fit is not None and not np.isnan(fit.dpc):
+                node.set_cells("dynamic-power-coefficient", [max(round(fit.dpc), 0)])
+
+            # The first phandle is the core cost node, and the second is the cluster cost node
+            costs = node.cells("sched-energy-costs")
+            core_cost = fdt.by_phandle(costs[0]) if costs else None
+            if core_cost is None or "busy-cost-data" not in core_cost.props:
+                continue
+
+            # Keys are freqs on some kernels and capacities on others
+            old_costs = core_cost.cells("busy-cost-data")
+            key_type = "freq" if old_costs and old_costs[0] > 1024 else "cap"
+            new_costs = []
+            for freq, score, power in zip(cluster.freqs.tolist(), cluster.score.tolist(), cluster.power.tolist()):
+                # Floor to match CPU integer math
+                key = freq if key_type == "freq" else int(score / max_perf * 1024)
+                new_costs += [key, max(round(power), 0)]
+
+            core_cost.set_cells("busy-cost-data", new_costs)
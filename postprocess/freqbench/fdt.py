@@ -0,0 +1,221 @@
+"""Reading and writing of flattened device tree blobs (DTBs).
+
+Only the binary format is handled, without any knowledge of bindings, so
+properties are raw bytes with helpers for cells and strings. Boot images often
+contain several DTBs back to back, which load_dtbs() and dump_dtbs() support.
+"""
+
+import struct
+from typing import Dict, Iterator, List, Optional, Tuple
+
+FDT_MAGIC = 0xd00dfeed
+FDT_BEGIN_NODE = 1
+FDT_END_NODE = 2
+FDT_PROP = 3
+FDT_NOP = 4
+FDT_END = 9
+
+# Version written by dump(): 17 is the current version, compatible back to 16
+FDT_VERSION = 17
+FDT_LAST_COMP_VERSION = 16
+
+HEADER = struct.Struct(">10I")
+
+def _align(offset: int, alignment: int = 4) -> int:
+    return (offset + alignment - 1) & ~(alignment - 1)
+
+class Node:
+    def __init__(self, name: str):
+        self.name = name
+        # Raw values in big endian, as stored in the DTB
+        self.props: Dict[str, bytes] = {}
+        self.children: List["Node"] = []
+
+    def __repr__(self):
+        return f"Node({self.name!r})"
+
+    def child(self, name: str) -> Optional["Node"]:
+        for node in self.children:
+            if node.name == name:
+                return node
+
+        return None
+
+    def walk(self, path: str = "") -> Iterator[Tuple[str, "Node"]]:
+        """All nodes below this one, including itself, with their paths."""
+        path = path or "/"
+        yield path, self
+        for node in self.children:
+            yield from node.walk(f"{path.rstrip('/')}/{node.name}")
+
+    def cells(self, name: str) -> Optional[List[int]]:
+        value = self.props.get(name)
+        if value is None:
+            return None
+
+        return list(struct.unpack(f">{len(value) // 4}I", value))
+
+    def set_cells(self, name: str, cells: List[int]):
+        self.props[name] = struct.pack(f">{len(cells)}I", *cells)
+
+    def string(self, name: str) -> Optional[str]:
+        value = self.props.get(name)
+        if value is None:
+            return None
+
+        return value.rstrip(b"\0").split(b"\0")[0].decode()
+
+    @property
+    def phandle(self) -> Optional[int]:
+        cells = self.cells("phandle") or self.cells("linux,phandle")
+        return cells[0] if cells else None
+
+class Fdt:
+    """A device tree with its memory reservations and boot CPU."""
+
+    def __init__(self, root: Node, reservations: List[Tuple[int, int]], boot_cpuid_phys: int = 0):
+        self.root = root
+        self.reservations = reservations
+        self.boot_cpuid_phys = boot_cpuid_phys
+
+    def find(self, path: str) -> Optional[Node]:
+        node = self.root
+        for name in path.strip("/").split("/"):
+            if not name:
+                continue
+
+            node = node.child(name)
+            if node is None:
+                return None
+
+        return node
+
+    def by_phandle(self, phandle: int) -> Optional[Node]:
+        for _, node in self.root.walk():
+            if node.phandle == phandle:
+                return node
+
+        return None
+
+    def cpu_nodes(self) -> List[Node]:
+        """CPU nodes in /cpus, in the order Linux assigns logical CPU numbers."""
+        cpus = self.find("/cpus")
+        if cpus is None:
+            return []
+
+        return [node for node in cpus.children if node.string("device_type") == "cpu"]
+
+def load(data: bytes, offset: int = 0) -> Tuple[Fdt, int]:
+    """Parse a DTB starting at offset. Returns the tree and the blob's total size."""
+    (magic, totalsize, off_struct, off_strings, off_rsvmap, version, _, boot_cpuid_phys,
+            size_strings, size_struct) = HEADER.unpack_from(data, offset)
+    if magic != FDT_MAGIC:
+        raise ValueError(f"Bad DTB magic at offset {offset}: {magic:#x}")
+    if version < FDT_LAST_COMP_VERSION:
+        raise ValueError(f"Unsupported DTB version {version}")
+
+    reservations = []
+    pos = offset + off_rsvmap
+    while True:
+        address, size = struct.unpack_from(">QQ", data, pos)
+        pos += 16
+        if address == 0 and size == 0:
+            break
+        reservations.append((address, size))
+
+    strings = data[offset + off_strings:offset + off_strings + size_strings]
+    def get_string(nameoff):
+        return strings[nameoff:strings.index(b"\0", nameoff)].decode()
+
+    stack: List[Node] = []
+    root = None
+    pos = offset + off_struct
+    end = pos + size_struct if version >= 17 else offset + totalsize
+    while pos < end:
+        token, = struct.unpack_from(">I", data, pos)
+        pos += 4
+
+        if token == FDT_BEGIN_NODE:
+            name_end = data.index(b"\0", pos)
+            node = Node(data[pos:name_end].decode())
+            pos = _align(name_end + 1 - offset) + offset
+            if stack:
+                stack[-1].children.append(node)
+            else:
+                root = node
+            stack.append(node)
+        elif token == FDT_END_NODE:
+            stack.pop()
+        elif token == FDT_PROP:
+            length, nameoff = struct.unpack_from(">II", data, pos)
+            pos += 8
+            stack[-1].props[get_string(nameoff)] = bytes(data[pos:pos + length])
+            pos = _align(pos + length - offset) + offset
+        elif token == FDT_NOP:
+            continue
+        elif token == FDT_END:
+            break
+        else:
+            raise ValueError(f"Bad DTB token {token:#x} at offset {pos - 4}")
+
+    if root is None or stack:
+        raise ValueError("Truncated DTB structure")
+
+    return Fdt(root, reservations, boot_cpuid_phys), totalsize
+
+def dump(fdt: Fdt) -> bytes:
+    """Serialize a tree into a new DTB, with deduplicated property names."""
+    strings = bytearray()
+    string_offsets: Dict[str, int] = {}
+    struct_block = bytearray()
+
+    def add_node(node: Node):
+        name = node.name.encode() + b"\0"
+        struct_block.extend(struct.pack(">I", FDT_BEGIN_NODE) + name + b"\0" * (_align(len(name)) - len(name)))
+
+        for prop_name, value in node.props.items():
+            if prop_name not in string_offsets:
+                string_offsets[prop_name] = len(strings)
+                strings.extend(prop_name.encode() + b"\0")
+
+            struct_block.extend(struct.pack(">III", FDT_PROP, len(value), string_offsets[prop_name]))
+            struct_block.extend(value + b"\0" * (_align(len(value)) - len(value)))
+
+        for child in node.children:
+            add_node(child)
+
+        struct_block.extend(struct.pack(">I", FDT_END_NODE))
+
+    add_node(fdt.root)
+    struct_block.extend(struct.pack(">I", FDT_END))
+
+    rsvmap = b"".join(struct.pack(">QQ", address, size) for address, size in fdt.reservations)
+    rsvmap += struct.pack(">QQ", 0, 0)
+
+    off_rsvmap = _align(HEADER.size, 8)
+    off_struct = off_rsvmap + len(rsvmap)
+    off_strings = off_struct + len(struct_block)
+    # Keep concatenated DTBs 8-byte aligned, as bootloaders expect
+    totalsize = _align(off_strings + len(strings), 8)
+
+    header = HEADER.pack(FDT_MAGIC, totalsize, off_struct, off_strings, off_rsvmap, FDT_VERSION,
+            FDT_LAST_COMP_VERSION, fdt.boot_cpuid_phys, len(strings), len(struct_block))
+    blob = header + b"\0" * (off_rsvmap - HEADER.size) + rsvmap + bytes(struct_block) + bytes(strings)
+    return blob + b"\0" * (totalsize - len(blob))
+
+def load_dtbs(data: bytes) -> Tuple[List[Fdt], bytes]:
+    """Parse concatenated DTBs, e.g. from a boot image. Returns the trees and any trailing data."""
+    fdts = []
+    offset = 0
+    while offset + HEADER.size <= len(data) and struct.unpack_from(">I", data, offset)[0] == FDT_MAGIC:
+        fdt, size = load(data, offset)
+        fdts.append(fdt)
+        offset += size
+
+    if not fdts:
+        raise ValueError("No DTBs found")
+
+    return fdts, data[offset:]
+
+def dump_dtbs(fdts: List[Fdt], trailer: bytes = b"") -> bytes:
+    return b"".join(dump(fdt) for fdt in fdts) + trailer
@@ -0,0 +1,111 @@
+import collections
+from typing import Dict, Iterable, Optional, Tuple
+
+from .results import CPU_LABELS, Results
+
+COL_LABELS = {
+    "power_mean": "Power (mW)",
+    "coremark_score": "Performance (iter/s)",
+    "energy_joules": "Energy (J)",
+    "energy_millijoules": "Energy (mJ)",
+    "elapsed_sec": "Time (s)",
+    "coremarks_per_mhz": "CoreMarks/MHz",
+    "ulpmark_cm_score": "ULPMark-CM (iter/mJ)",
+}
+
+def pyplot(headless: bool = False):
+    """Import pyplot on first use, which is slow and not needed for text outputs."""
+    if headless:
+        import matplotlib
+        matplotlib.use("Agg")
+
+    import matplotlib.pyplot as plt
+    return plt
+
+def col_label(col_name: str) -> str:
+    return COL_LABELS.get(col_name, col_name)
+
+def unified_cluster_graph(results: Results, col_name: str, title: Optional[str] = None, headless: bool = False):
+    """Graph a value for each cluster within the same SoC."""
+    plt = pyplot(headless)
+    fig, ax = plt.subplots()
+
+    label = col_label(col_name)
+    ax.set_ylabel(label)
+    ax.set_xlabel("Frequency (MHz)")
+    ax.set_title(title or label)
+
+    for cluster in results:
+        ax.plot(cluster.mhz, cluster.column(col_name), label=cluster.label)
+
+    ax.legend()
+    return fig
+
+def cross_cpu_cluster_graph(socs: Dict[str, Results], col_name: str, freq_load: str = "active",
+        flags: Iterable[str] = (), headless: bool = False):
+    """Graph a value for each cluster across different SoCs.
+
+    Flags: soccolor (one color per SoC), minscl (subtract the minimum value).
+    """
+    plt = pyplot(headless)
+    fig, ax = plt.subplots()
+
+    label = col_label(col_name)
+    ax.set_ylabel(label)
+    ax.set_xlabel("Frequency (MHz)")
+    ax.set_title(label)
+
+    for soc_i, (soc, results) in enumerate(socs.items()):
+        for cluster in results:
+            values = cluster.column(col_name, freq_load)
+            if "minscl" in flags:
+                values = values - values.min()
+
+            val_label = f"{soc} {cluster.label}"
+            color = f"C{soc_i}"
+
+            if "soccolor" in flags:
+                ax.plot(cluster.mhz, values, color, label=val_label)
+            else:
+                ax.plot(cluster.mhz, values, label=val_label)
+
+    ax.legend()
+    return fig
+
+def cross_cpu_voltage_graph(socs: Dict[str, Dict[Tuple[int, int], int]], flags: Iterable[str] = (),
+        headless: bool = False):
+    """Graph voltages for each cluster across different SoCs."""
+    plt = pyplot(headless)
+    fig, ax = plt.subplots()
+
+    ax.set_ylabel("Voltage (mV)")
+    ax.set_xlabel("Frequency (MHz)")
+    ax.set_title("CPU Voltages")
+
+    for soc_i, (soc, soc_data) in enumerate(socs.items()):
+        cpu_freqs = collections.defaultdict(list)
+        cpu_volts = collections.defaultdict(list)
+
+        for (cpu, freq), volt in soc_data.items():
+            cpu_freqs[cpu].append(freq / 1000)
+            cpu_volts[cpu].append(volt / 1000)
+
+        for cpu, freqs in cpu_freqs.items():
+            volts = cpu_volts[cpu]
+
+            cpu_label = CPU_LABELS.get(cpu, f"CPU {cpu}")
+            val_label = f"{soc} {cpu_label}"
+            color = f"C{soc_i}"
+
+            if "soccolor" in flags:
+                ax.plot(freqs, volts, color, label=val_label)
+            else:
+                ax.plot(freqs, volts, label=val_label)
+
+    ax.legend()
+    return fig
+
+def save_figure(fig, path: str):
+    """Save a figure to a file, with the format based on the extension (e.g. PNG or SVG)."""
+    fig.savefig(path)
+    pyplot().close(fig)
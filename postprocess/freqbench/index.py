@@ -0,0 +1,357 @@
+"""SQLite index of a results tree for queries across SoCs and runs.
+
+Runs are only parsed again when their files change: file sizes and mtimes are
+checked first, then a hash of the contents in case the files were only touched.
+
+Example query (efficient frequencies under 500 mW):
+    SELECT soc, run, cpu, freq_khz, ulpmark_cm_score, power_mean FROM opp_stats
+    WHERE load = 'active' AND ulpmark_cm_score > 30 AND power_mean < 500
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+from .results import find_runs, load_results
+
+# Bump when the schema changes, which rebuilds the index
+INDEX_VERSION = 1
+
+# Files parsed for each run, relative to the run directory
+RUN_FILES = ["results.json", "device.txt", "versions.txt", "cpuinfo.txt", "cmdline.txt"]
+
+SCHEMA = """
+CREATE TABLE soc (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    model TEXT,
+    marketing_name TEXT
+);
+
+CREATE TABLE device (
+    id INTEGER PRIMARY KEY,
+    soc_id INTEGER NOT NULL REFERENCES soc(id),
+    model TEXT NOT NULL,
+    compatible TEXT NOT NULL,
+    UNIQUE (soc_id, model, compatible)
+);
+
+CREATE TABLE run (
+    id INTEGER PRIMARY KEY,
+    soc_id INTEGER NOT NULL REFERENCES soc(id),
+    device_id INTEGER REFERENCES device(id),
+    name TEXT NOT NULL,
+    path TEXT NOT NULL UNIQUE,
+    content_hash TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    kernel TEXT,
+    python TEXT,
+    cmdline TEXT,
+    cpu_count INTEGER,
+    housekeeping_cpu INTEGER,
+    power_sample_interval INTEGER,
+    total_elapsed_sec REAL
+);
+CREATE INDEX run_soc ON run(soc_id);
+
+CREATE TABLE run_file (
+    run_id INTEGER NOT NULL REFERENCES run(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (run_id, name)
+) WITHOUT ROWID;
+
+CREATE TABLE cpu_core (
+    run_id INTEGER NOT NULL REFERENCES run(id) ON DELETE CASCADE,
+    cpu INTEGER NOT NULL,
+    implementer TEXT,
+    architecture TEXT,
+    variant TEXT,
+    part TEXT,
+    revision TEXT,
+    PRIMARY KEY (run_id, cpu)
+) WITHOUT ROWID;
+
+CREATE TABLE cluster (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES run(id) ON DELETE CASCADE,
+    cpu INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    UNIQUE (run_id, cpu)
+);
+
+CREATE TABLE opp (
+    id INTEGER PRIMARY KEY,
+    cluster_id INTEGER NOT NULL REFERENCES cluster(id) ON DELETE CASCADE,
+    freq_khz INTEGER NOT NULL,
+    UNIQUE (cluster_id, freq_khz)
+);
+CREATE INDEX opp_freq ON opp(freq_khz);
+
+-- One row per value: load is active, idle, or the name of an extra workload
+CREATE TABLE metric (
+    opp_id INTEGER NOT NULL REFERENCES opp(id) ON DELETE CASCADE,
+    load TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (opp_id, load, name)
+) WITHOUT ROWID;
+CREATE INDEX metric_value ON metric(load, name, value);
+
+CREATE VIEW opp_stats AS
+SELECT
+    soc.name AS soc,
+    device.model AS device,
+    run.name AS run,
+    cluster.cpu AS cpu,
+    cluster.label AS cluster,
+    opp.freq_khz AS freq_khz,
+    metric.load AS load,
+    MAX(CASE WHEN metric.name = 'power_mean' THEN metric.value END) AS power_mean,
+    MAX(CASE WHEN metric.name = 'energy_millijoules' THEN metric.value END) AS energy_millijoules,
+    MAX(CASE WHEN metric.name = 'elapsed_sec' THEN metric.value END) AS elapsed_sec,
+    MAX(CASE WHEN metric.name = 'coremark_score' THEN metric.value END) AS coremark_score,
+    MAX(CASE WHEN metric.name = 'coremarks_per_mhz' THEN metric.value END) AS coremarks_per_mhz,
+    MAX(CASE WHEN metric.name = 'ulpmark_cm_score' THEN metric.value END) AS ulpmark_cm_score,
+    MAX(CASE WHEN metric.name = 'score' THEN metric.value END) AS score,
+    MAX(CASE WHEN metric.name = 'work_per_mj' THEN metric.value END) AS work_per_mj
+FROM metric
+JOIN opp ON opp.id = metric.opp_id
+JOIN cluster ON cluster.id = opp.cluster_id
+JOIN run ON run.id = cluster.run_id
+JOIN soc ON soc.id = run.soc_id
+LEFT JOIN device ON device.id = run.device_id
+GROUP BY metric.opp_id, metric.load;
+"""
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """Open an index, creating it or rebuilding it if the schema is outdated."""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys = ON")
+
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version != INDEX_VERSION:
+        conn.close()
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.executescript(SCHEMA)
+        conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+
+    return conn
+
+def parse_soc_table(path: str) -> Dict[str, Tuple[str, str]]:
+    """Parse the index table in results/README.md as {name: (model, marketing name)}."""
+    socs = {}
+    with open(path, "r") as f:
+        for line in f:
+            cells = [cell.strip() for cell in line.strip().strip("|").split("|")]
+            if len(cells) < 3 or not re.match(r"^[a-z0-9]+$", cells[0]):
+                continue
+
+            # SoCs can be listed more than once for different devices
+            socs.setdefault(cells[0], (cells[1], cells[2]))
+
+    return socs
+
+def parse_key_values(path: str) -> Dict[str, str]:
+    """Parse "Key: value" lines, e.g. from device.txt and versions.txt."""
+    values = {}
+    with open(path, "r", errors="replace") as f:
+        for line in f:
+            key, sep, value = line.partition(":")
+            if sep:
+                values[key.strip()] = value.strip().rstrip(";")
+
+    return values
+
+def parse_cpuinfo(path: str) -> Dict[int, Dict[str, str]]:
+    """Parse /proc/cpuinfo as {cpu: {field: value}}, e.g. "part"."""
+    cpus = {}
+    cpu = None
+    with open(path, "r", errors="replace") as f:
+        for line in f:
+            key, sep, value = line.partition(":")
+            if not sep:
+                continue
+
+            key = key.strip()
+            value = value.strip()
+            if key == "processor":
+                cpu = int(value)
+                cpus[cpu] = {}
+            elif cpu is not None and key.startswith("CPU "):
+                cpus[cpu][key[4:]] = value
+
+    return cpus
+
+def _file_stats(run_dir: str) -> Dict[str, Tuple[int, int]]:
+    stats = {}
+    for name in RUN_FILES:
+        path = os.path.join(run_dir, name)
+        if os.path.exists(path):
+            st = os.stat(path)
+            stats[name] = (st.st_mtime_ns, st.st_size)
+
+    return stats
+
+def _content_hash(run_dir: str, names: List[str]) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for name in sorted(names):
+        h.update(name.encode() + b"\0")
+        with open(os.path.join(run_dir, name), "rb") as f:
+            h.update(f.read())
+
+    return h.hexdigest()
+
+def _upsert_soc(conn: sqlite3.Connection, name: str, info: Optional[Tuple[str, str]]) -> int:
+    model, marketing_name = info or (None, None)
+    conn.execute("""
+        INSERT INTO soc (name, model, marketing_name) VALUES (?, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET
+            model = COALESCE(excluded.model, model),
+            marketing_name = COALESCE(excluded.marketing_name, marketing_name)
+    """, (name, model, marketing_name))
+    return conn.execute("SELECT id FROM soc WHERE name = ?", (name,)).fetchone()[0]
+
+def _ingest_run(conn: sqlite3.Connection, soc_id: int, name: str, path: str, run_dir: str, content_hash: str) -> int:
+    results = load_results(os.path.join(run_dir, "results.json"))
+
+    device_id = None
+    device_path = os.path.join(run_dir, "device.txt")
+    if os.path.exists(device_path):
+        device = parse_key_values(device_path)
+        model = device.get("Model", "")
+        compatible = device.get("Compatible", "")
+        conn.execute("INSERT OR IGNORE INTO device (soc_id, model, compatible) VALUES (?, ?, ?)",
+                (soc_id, model, compatible))
+        device_id = conn.execute("SELECT id FROM device WHERE soc_id = ? AND model = ? AND compatible = ?",
+                (soc_id, model, compatible)).fetchone()[0]
+
+    versions = {}
+    versions_path = os.path.join(run_dir, "versions.txt")
+    if os.path.exists(versions_path):
+        versions = parse_key_values(versions_path)
+
+    cmdline = None
+    cmdline_path = os.path.join(run_dir, "cmdline.txt")
+    if os.path.exists(cmdline_path):
+        with open(cmdline_path, "r", errors="replace") as f:
+            cmdline = f.read().strip()
+
+    meta = results.meta
+    run_id = conn.execute("""
+        INSERT INTO run (soc_id, device_id, name, path, content_hash, version, kernel, python, cmdline,
+            cpu_count, housekeeping_cpu, power_sample_interval, total_elapsed_sec)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (soc_id, device_id, name, path, content_hash, results.version, versions.get("Kernel"),
+            versions.get("Python"), cmdline, meta.get("cpu_count"), meta.get("housekeeping_cpu"),
+            meta.get("power_sample_interval"), results.data.get("total_elapsed_sec"))).lastrowid
+
+    cpuinfo_path = os.path.join(run_dir, "cpuinfo.txt")
+    if os.path.exists(cpuinfo_path):
+        conn.executemany("""
+            INSERT INTO cpu_core (run_id, cpu, implementer, architecture, variant, part, revision)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [
+            (run_id, cpu, fields.get("implementer"), fields.get("architecture"), fields.get("variant"),
+                    fields.get("part"), fields.get("revision"))
+            for cpu, fields in parse_cpuinfo(cpuinfo_path).items()
+        ])
+
+    for cluster in results:
+        cluster_id = conn.execute("INSERT INTO cluster (run_id, cpu, label) VALUES (?, ?, ?)",
+                (run_id, cluster.cpu, cluster.label)).lastrowid
+
+        for freq in cluster.freqs.tolist():
+            opp_id = conn.execute("INSERT INTO opp (cluster_id, freq_khz) VALUES (?, ?)",
+                    (cluster_id, freq)).lastrowid
+
+            freq_data = cluster.freq_data(freq)
+            loads = {load: stats for load, stats in freq_data.items() if load != "workloads"}
+            loads.update(freq_data.get("workloads", {}))
+
+            conn.executemany("INSERT INTO metric (opp_id, load, name, value) VALUES (?, ?, ?, ?)", [
+                (opp_id, load, key, value)
+                for load, stats in loads.items()
+                for key, value in stats.items()
+                # Only scalars: raw samples and per-core scores aren't indexed
+                if isinstance(value, (int, float)) and not isinstance(value, bool)
+            ])
+
+    return run_id
+
+def update_index(conn: sqlite3.Connection, results_dir: str) -> Dict[str, int]:
+    """Add new and changed runs in a results tree to the index, and remove deleted ones.
+
+    Returns counts of added, updated, unchanged, and removed runs.
+    """
+    counts = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0}
+
+    readme_path = os.path.join(results_dir, "README.md")
+    soc_table = parse_soc_table(readme_path) if os.path.exists(readme_path) else {}
+
+    with conn:
+        for soc, info in soc_table.items():
+            _upsert_soc(conn, soc, info)
+
+        runs = find_runs(results_dir)
+        seen = set()
+        for soc, name, results_path in runs:
+            run_dir = os.path.dirname(results_path)
+            # Relative to the results tree, so the index doesn't depend on the working directory
+            path = f"{soc}/{name}"
+            seen.add(path)
+
+            stats = _file_stats(run_dir)
+            row = conn.execute("SELECT id, content_hash FROM run WHERE path = ?", (path,)).fetchone()
+            if row:
+                run_id, old_hash = row
+                old_stats = {
+                    file_name: (mtime_ns, size)
+                    for file_name, mtime_ns, size in conn.execute(
+                            "SELECT name, mtime_ns, size FROM run_file WHERE run_id = ?", (run_id,))
+                }
+                if old_stats == stats:
+                    counts["unchanged"] += 1
+                    continue
+
+            content_hash = _content_hash(run_dir, list(stats.keys()))
+            if row and content_hash == old_hash:
+                # Touched but not modified
+                conn.execute("DELETE FROM run_file WHERE run_id = ?", (run_id,))
+                counts["unchanged"] += 1
+            else:
+                if row:
+                    conn.execute("DELETE FROM run WHERE id = ?", (run_id,))
+                    counts["updated"] += 1
+                else:
+                    counts["added"] += 1
+
+                soc_id = _upsert_soc(conn, soc, soc_table.get(soc))
+                run_id = _ingest_run(conn, soc_id, name, path, run_dir, content_hash)
+
+            conn.executemany("INSERT INTO run_file (run_id, name, mtime_ns, size) VALUES (?, ?, ?, ?)",
+                    [(run_id, file_name, mtime_ns, size) for file_name, (mtime_ns, size) in stats.items()])
+
+        for run_id, path in conn.execute("SELECT id, path FROM run").fetchall():
+            if path not in seen:
+                conn.execute("DELETE FROM run WHERE id = ?", (run_id,))
+                counts["removed"] += 1
+
+        indexed = conn.execute("SELECT COUNT(*) FROM run").fetchone()[0]
+        if indexed != len(runs):
+            raise ValueError(f"Indexed {indexed} runs, but found {len(runs)} results.json files in {results_dir}")
+
+        conn.execute("DELETE FROM device WHERE id NOT IN (SELECT device_id FROM run WHERE device_id IS NOT NULL)")
+        conn.execute(f"""
+            DELETE FROM soc WHERE id NOT IN (SELECT soc_id FROM run)
+            AND name NOT IN ({", ".join("?" * len(soc_table))})
+        """, list(soc_table.keys()))
+
+    return counts
@@ -0,0 +1,239 @@
+"""Fitting of CPU power models to freqbench results and voltages.
+
+Power is modeled as P = C·V²·f + L·V, where L·V approximates leakage. bench.py
+subtracts the baseline power of the system with only the housekeeping CPU
+online from measured power, so there's no constant term. All clusters in a
+batch are fitted together with weighted least squares.
+
+The kernel's simplified energy model has no leakage term and computes power as
+C·V²·f alone, so the dynamic-power-coefficient it uses is fitted separately to
+total power without L. The two-term fit is kept for interpolating power and as
+a diagnostic of how much leakage the coefficient absorbs.
+
+Units follow dynamic-power-coefficient in device trees: P in µW, V in volts,
+and f in MHz.
+"""
+
+import glob
+import os
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+from .results import Cluster, find_runs, load_results
+from .voltages import load_voltages
+
+# Two-sided 95% Student's t critical values by degrees of freedom
+# Larger degrees of freedom use the normal approximation
+T_CRITICAL_95 = np.array([
+    np.nan, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+])
+
+# Coefficients in the order of columns in the design matrix
+COEF_NAMES = ["dpc", "leakage"]
+# Relative difference between the fitted C and the per-freq mean that is reported
+DPC_CHANGE_NOTE_THRESHOLD = 0.1
+
+class PowerFit(NamedTuple):
+    cpu: int
+    # Frequencies used for the fit, in kHz
+    freqs: np.ndarray
+    # Frequencies skipped because their voltages are unknown
+    dropped: List[int]
+    # C and L, with NaN for terms that couldn't be fitted
+    coefs: np.ndarray
+    # 95% confidence interval half-widths of coefs
+    ci95: np.ndarray
+    # Measured power for each frequency (µW)
+    measured: np.ndarray
+    # Measured minus fitted power
+    residuals: np.ndarray
+    # C fitted to total power without a leakage term, as used by the kernel
+    dpc_fit: float
+    # 95% confidence interval half-width of dpc_fit
+    dpc_fit_ci95: float
+    # Mean of P / (V²·f) over all freqs, the coefficient used before fitting
+    dpc_mean: float
+
+    @property
+    def dpc_uncertain(self) -> bool:
+        """Whether the fitted coefficient is missing, has no confidence interval, or isn't distinguishable from 0."""
+        return not self.dpc_fit_ci95 <= abs(self.dpc_fit)
+
+    @property
+    def dpc(self) -> float:
+        """Dynamic power coefficient for the device tree, falling back to the per-freq mean if the fit is uncertain."""
+        return self.dpc_mean if self.dpc_uncertain else self.dpc_fit
+
+    @property
+    def rms_residual(self) -> float:
+        """Root mean square of residuals, relative to measured power."""
+        if not len(self.measured):
+            return np.nan
+
+        return float(np.sqrt(np.mean((self.residuals / self.measured) ** 2)))
+
+    def summary(self) -> str:
+        if not len(self.freqs):
+            return f"cpu{self.cpu}: no freqs with voltages, skipping power model fit"
+
+        dpc, leakage = self.coefs
+        dpc_ci, leakage_ci = self.ci95
+        summary = (f"cpu{self.cpu}: C = {self.dpc_fit:.1f} ± {self.dpc_fit_ci95:.1f} (mean {self.dpc_mean:.1f}); "
+                f"with leakage C = {dpc:.1f} ± {dpc_ci:.1f}, L = {leakage:.0f} ± {leakage_ci:.0f} µW/V, "
+                f"RMS residual {self.rms_residual:.1%} ({len(self.freqs)} freqs)")
+        if self.dpc_uncertain and not np.isnan(self.dpc_mean):
+            summary += f"\ncpu{self.cpu}: warning: fitted C is uncertain, using mean {self.dpc_mean:.1f} instead"
+        elif abs(self.dpc_fit - self.dpc_mean) > self.dpc_mean * DPC_CHANGE_NOTE_THRESHOLD:
+            change = self.dpc_fit / self.dpc_mean - 1
+            summary += (f"\ncpu{self.cpu}: note: fitted C is {abs(change):.0%} {'lower' if change < 0 else 'higher'} "
+                    f"than the per-freq mean, because the fit weights each freq by the inverse variance of its power")
+
+        return summary
+
+def fit_batch(power: np.ndarray, volts: np.ndarray, mhz: np.ndarray,
+        sigma: np.ndarray, leakage: bool = True) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Fit P = C·V²·f + L·V for each row of 2D arrays padded with NaN.
+
+    sigma is the uncertainty of each power value, used for weighting. Leakage
+    is only fitted with at least 3 points, or never if leakage is False, and is
+    NaN otherwise.
+
+    Returns coefficients and their 95% confidence interval half-widths with
+    shape (rows, 2), and residuals with the same shape as power.
+    """
+    valid = ~(np.isnan(power) | np.isnan(volts) | np.isnan(mhz) | np.isnan(sigma)) & (sigma > 0)
+    count = valid.sum(axis=1)
+
+    # Dynamic power is always fitted, and leakage only with enough data
+    use_cols = np.stack([count >= 1, (count >= 3) & leakage], axis=1)
+    n_coefs = use_cols.sum(axis=1)
+
+    y = np.where(valid, power, 0)
+    w = np.where(valid, 1 / np.where(valid, sigma, 1) ** 2, 0)
+    X = np.stack([volts**2 * mhz, volts], axis=2)
+    X = np.where(valid[:, :, None] & use_cols[:, None, :], X, 0)
+
+    # Scale columns to similar magnitudes for numerical stability
+    scale = np.sqrt((X**2).sum(axis=1) / np.maximum(count, 1)[:, None])
+    scale = np.where(scale > 0, scale, 1)
+    Xs = X / scale[:, None, :]
+
+    # Weighted normal equations, solved for all rows at once
+    A = np.einsum("bni,bn,bnj->bij", Xs, w, Xs)
+    b = np.einsum("bni,bn,bn->bi", Xs, w, y)
+    A_inv = np.linalg.pinv(A)
+    coefs_s = np.einsum("bij,bj->bi", A_inv, b)
+
+    residuals = np.where(valid, power - np.einsum("bni,bi->bn", Xs, coefs_s), np.nan)
+
+    # Scale the covariance by the reduced chi-squared, since sigma only covers measurement noise
+    dof = count - n_coefs
+    with np.errstate(divide="ignore", invalid="ignore"):
+        chi2 = np.nansum(w * np.where(valid, residuals, 0) ** 2, axis=1) / dof
+        t = np.where(dof < len(T_CRITICAL_95), T_CRITICAL_95[np.clip(dof, 0, len(T_CRITICAL_95) - 1)], 1.96)
+        t = np.where(dof > 0, t, np.nan)
+        ci95_s = t[:, None] * np.sqrt(chi2[:, None] * np.diagonal(A_inv, axis1=1, axis2=2))
+
+    coefs = np.where(use_cols, coefs_s / scale, np.nan)
+    ci95 = np.where(use_cols, ci95_s / scale, np.nan)
+    return coefs, ci95, residuals
+
+def fit_clusters(clusters: Sequence[Tuple[Cluster, Dict[Tuple[int, int], int]]],
+        mode: str = "power") -> List[PowerFit]:
+    """Fit power models for (cluster, voltages) pairs, e.g. from different SoCs, in one batch.
+
+    voltages are in µV, keyed by (cpu, freq). Frequencies without voltages are
+    skipped and listed in PowerFit.dropped. mode is "power" (µW) or "energy"
+    (10 µJ, as in the legacy energy model).
+    """
+    width = max((len(cluster) for cluster, _ in clusters), default=0)
+    shape = (len(clusters), width)
+    power = np.full(shape, np.nan)
+    volts = np.full(shape, np.nan)
+    mhz = np.full(shape, np.nan)
+    sigma = np.full(shape, np.nan)
+    dropped = []
+
+    for i, (cluster, voltages) in enumerate(clusters):
+        n = len(cluster)
+        if mode == "power":
+            # mW -> µW
+            factor = 1000
+            costs = cluster.power * factor
+        elif mode == "energy":
+            factor = 10 * cluster.column("elapsed_sec")
+            costs = cluster.energy * 10
+        else:
+            raise ValueError(f"Unknown mode: {mode}")
+
+        freqs = cluster.freqs.tolist()
+        power[i, :n] = costs
+        volts[i, :n] = [voltages.get((cluster.cpu, freq), np.nan) / 1_000_000 for freq in freqs]
+        mhz[i, :n] = cluster.mhz
+        dropped.append([freq for freq in freqs if (cluster.cpu, freq) not in voltages])
+
+        # Use measured confidence intervals if available, otherwise assume constant relative error
+        ci = cluster.column("power_ci95") * factor
+        sigma[i, :n] = ci / 1.96 if not np.isnan(ci).any() else np.abs(costs)
+
+    coefs, ci95, residuals = fit_batch(power, volts, mhz, sigma)
+    dpc_coefs, dpc_ci95, _ = fit_batch(power, volts, mhz, sigma, leakage=False)
+    per_freq = power / (volts**2 * mhz)
+    with np.errstate(invalid="ignore"):
+        dpc_mean = np.nansum(per_freq, axis=1) / (~np.isnan(per_freq)).sum(axis=1)
+
+    fits = []
+    for i, (cluster, _) in enumerate(clusters):
+        n = len(cluster)
+        used = ~np.isnan(residuals[i, :n])
+        fits.append(PowerFit(cluster.cpu, cluster.freqs[used], dropped[i], coefs[i], ci95[i], power[i, :n][used],
+                residuals[i, :n][used], float(dpc_coefs[i, 0]), float(dpc_ci95[i, 0]), float(dpc_mean[i])))
+
+    return fits
+
+def voltage_runs(results_dir: str) -> List[Tuple[str, str, str]]:
+    """Find voltages files in a results tree and the runs they belong to.
+
+    voltages_<tag>.txt belongs to the run whose name is a prefix of the tag or
+    starts with it (e.g. voltages_k30su.txt and k30s), and voltages.txt and
+    files without a matching run belong to the main run.
+    Returns (soc, results.json path, voltages path) tuples.
+    """
+    soc_runs: Dict[str, Dict[str, str]] = {}
+    for soc, name, path in find_runs(results_dir):
+        soc_runs.setdefault(soc, {})[name] = path
+
+    runs = []
+    for volt_path in sorted(glob.glob(os.path.join(results_dir, "*", "voltages*.txt"))):
+        soc = os.path.basename(os.path.dirname(volt_path))
+        tag = os.path.splitext(os.path.basename(volt_path))[0][len("voltages_"):]
+
+        run_paths = soc_runs.get(soc, {})
+        run = "main"
+        if tag:
+            matches = [name for name in run_paths if tag.startswith(name) or name.startswith(tag)]
+            if matches:
+                # Prefer the longest, i.e. most specific, match
+                run = max(matches, key=len)
+
+        if run in run_paths:
+            runs.append((soc, run_paths[run], volt_path))
+
+    return runs
+
+def fit_corpus(results_dir: str, mode: str = "power") -> List[Tuple[str, str, str, PowerFit]]:
+    """Fit power models for every run with voltages in a results tree, in one batch.
+
+    Returns (soc, results.json path, voltages path, fit) tuples for each cluster.
+    """
+    keys = []
+    clusters: List[Tuple[Cluster, Dict[Tuple[int, int], int]]] = []
+    for soc, results_path, volt_path in voltage_runs(results_dir):
+        voltages = load_voltages(volt_path)
+        for cluster in load_results(results_path):
+            keys.append((soc, results_path, volt_path))
+            clusters.append((cluster, voltages))
+
+    return [(*key, fit) for key, fit in zip(keys, fit_clusters(clusters, mode))]
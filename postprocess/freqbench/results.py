@@ -0,0 +1,246 @@
+import glob
+import json
+import os
+from functools import cached_property
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .cache import load_json
+from .samples import inline_samples, load_samples, new_samples_path, rebase_samples_file, write_samples
+
+CPU_LABELS = {
+    1: "Little",
+    4: "Big",
+    6: "Big",
+    7: "Prime"
+}
+
+# Name of runs stored directly in a SoC directory, e.g. results/sm7225/results.json
+ROOT_RUN_NAME = "main"
+
+class Cluster:
+    """Results for one frequency domain, identified by its first benchmarked CPU.
+
+    Columns are NumPy arrays ordered by frequency and created on first use.
+    """
+
+    def __init__(self, results: "Results", cpu: int, freqs_data: Dict[str, dict]):
+        self.results = results
+        self.cpu = cpu
+        # Sort numerically: keys are strings in JSON, and merged results may be out of order
+        self._freqs_data = sorted(((int(freq), data) for freq, data in freqs_data.items()), key=lambda f: f[0])
+        self._columns: Dict[Tuple[str, str], np.ndarray] = {}
+
+    def __repr__(self):
+        return f"Cluster(cpu={self.cpu}, freqs={len(self)})"
+
+    def __len__(self):
+        return len(self._freqs_data)
+
+    @property
+    def label(self) -> str:
+        return CPU_LABELS.get(self.cpu, f"CPU {self.cpu}")
+
+    @cached_property
+    def cpus(self) -> List[int]:
+        """All CPUs in the frequency domain.
+
+        Older results don't list them, so each cluster is assumed to extend to
+        the next one, and the first one to start at CPU 0.
+        """
+        domains = self.results.meta.get("cpu_domains")
+        if domains and str(self.cpu) in domains:
+            return sorted(domains[str(self.cpu)])
+
+        starts = list(self.results.clusters.keys())
+        i = starts.index(self.cpu)
+        start = 0 if i == 0 else self.cpu
+        end = starts[i + 1] if i + 1 < len(starts) else self.results.meta.get("cpu_count", self.cpu + 1)
+        return list(range(start, end))
+
+    @cached_property
+    def freqs(self) -> np.ndarray:
+        """Frequencies in kHz."""
+        return np.array([freq for freq, _ in self._freqs_data], dtype=np.int64)
+
+    @cached_property
+    def mhz(self) -> np.ndarray:
+        return self.freqs / 1000
+
+    def freq_data(self, freq: int) -> dict:
+        """Raw data for a frequency, as stored in results.json."""
+        for data_freq, data in self._freqs_data:
+            if data_freq == freq:
+                return data
+
+        raise KeyError(freq)
+
+    def stats(self, freq: int, load: str = "active") -> dict:
+        return _load_stats(self.freq_data(freq), load)
+
+    def column(self, name: str, load: str = "active") -> np.ndarray:
+        """Values of a field for all frequencies, with NaN where it's missing.
+
+        load is "active", "idle", or the name of an extra workload.
+        """
+        key = (load, name)
+        if key not in self._columns:
+            values = []
+            for _, data in self._freqs_data:
+                value = _load_stats(data, load).get(name)
+                values.append(np.nan if value is None else value)
+
+            self._columns[key] = np.array(values, dtype=np.float64)
+
+        return self._columns[key]
+
+    @property
+    def score(self) -> np.ndarray:
+        """CoreMark scores (iter/s)."""
+        return self.column("coremark_score")
+
+    @property
+    def coremarks_per_mhz(self) -> np.ndarray:
+        return self.column("coremarks_per_mhz")
+
+    @property
+    def power(self) -> np.ndarray:
+        """Mean power usage while running CoreMark (mW)."""
+        return self.column("power_mean")
+
+    @property
+    def energy(self) -> np.ndarray:
+        """Energy used while running CoreMark (mJ)."""
+        return self.column("energy_millijoules")
+
+    @property
+    def ulpmark(self) -> np.ndarray:
+        """ULPMark-CM scores (iter/mJ)."""
+        return self.column("ulpmark_cm_score")
+
+    @property
+    def idle_power(self) -> np.ndarray:
+        return self.column("power_mean", "idle")
+
+    def samples(self, freq: int, load: str = "active") -> Dict[str, np.ndarray]:
+        """Raw power samples for a frequency as {column: array}."""
+        columns = load_samples(self.results.path, self.results.data, self.stats(freq, load))
+        return {key: np.frombuffer(column, dtype=np.float64) for key, column in columns.items()}
+
+def _load_stats(freq_data: dict, load: str) -> dict:
+    if load in freq_data:
+        return freq_data[load]
+
+    return freq_data["workloads"][load]
+
+class Results:
+    """Results of a freqbench run, loaded from results.json."""
+
+    def __init__(self, path: str, data: dict):
+        self.path = path
+        # Raw JSON data, with string keys for CPUs and frequencies
+        self.data = data
+
+    def __repr__(self):
+        return f"Results({self.path!r})"
+
+    @property
+    def version(self) -> int:
+        return self.data.get("version", 1)
+
+    @property
+    def meta(self) -> dict:
+        return self.data.get("meta", {})
+
+    @property
+    def housekeeping(self) -> Optional[dict]:
+        # Some results were contributed without housekeeping stats
+        return self.data.get("housekeeping")
+
+    @cached_property
+    def clusters(self) -> Dict[int, Cluster]:
+        """Clusters by CPU, in CPU order."""
+        return {
+            int(cpu): Cluster(self, int(cpu), cpu_data["freqs"])
+            for cpu, cpu_data in sorted(self.data["cpus"].items(), key=lambda c: int(c[0]))
+        }
+
+    def __iter__(self) -> Iterator[Cluster]:
+        return iter(self.clusters.values())
+
+    def opps(self) -> Set[Tuple[int, int]]:
+        return {(cluster.cpu, int(freq)) for cluster in self for freq in cluster.freqs}
+
+    def keep_opps(self, opps: Set[Tuple[int, int]]):
+        """Remove all frequencies except the given (cpu, freq) pairs."""
+        for cpu, cpu_data in self.data["cpus"].items():
+            freqs = cpu_data["freqs"]
+            for freq in list(freqs.keys()):
+                if (int(cpu), int(freq)) not in opps:
+                    del freqs[freq]
+
+        self._invalidate()
+
+    def merge(self, other: "Results"):
+        """Add frequencies from other results, replacing existing ones.
+
+        Raw samples are moved into the JSON data so that they can be saved with
+        save(), which writes a new sidecar for the merged results.
+        """
+        inline_samples(self.path, self.data)
+        inline_samples(other.path, other.data)
+
+        cpus_data = self.data["cpus"]
+        for cpu, cpu_data in other.data["cpus"].items():
+            freqs = cpus_data.setdefault(cpu, {"freqs": {}})["freqs"]
+            freqs.update(cpu_data["freqs"])
+            # Keep frequencies sorted for anything that relies on the order
+            cpus_data[cpu]["freqs"] = dict(sorted(freqs.items(), key=lambda f: int(f[0])))
+
+        self.data["cpus"] = dict(sorted(cpus_data.items(), key=lambda c: int(c[0])))
+        self.data["version"] = 2
+        self._invalidate()
+
+    def save(self, path: str):
+        """Write results to a new results.json.
+
+        Inline samples are written to a new sidecar, and existing sidecars are
+        referenced from the new location.
+        """
+        if "samples_file" in self.data:
+            rebase_samples_file(self.data, self.path, path)
+        elif self.version >= 2:
+            write_samples(self.data, new_samples_path(path))
+
+        with open(path, "w+") as f:
+            f.write(json.dumps(self.data))
+
+        self.path = path
+
+    def _invalidate(self):
+        self.__dict__.pop("clusters", None)
+
+def load_results(path: str) -> Results:
+    return Results(path, load_json(path))
+
+def find_runs(results_dir: str) -> List[Tuple[str, str, str]]:
+    """Find all runs in a results tree as (soc, run name, results.json path) tuples.
+
+    Runs are usually in soc/run/results.json, but some are directly in
+    soc/results.json. Those are named ROOT_RUN_NAME, or "root" if a run
+    directory already has that name.
+    """
+    runs = []
+    for path in glob.glob(os.path.join(results_dir, "*", "*", "results.json")):
+        run_dir = os.path.dirname(path)
+        runs.append((os.path.basename(os.path.dirname(run_dir)), os.path.basename(run_dir), path))
+
+    for path in glob.glob(os.path.join(results_dir, "*", "results.json")):
+        soc_dir = os.path.dirname(path)
+        name = ROOT_RUN_NAME
+        if os.path.exists(os.path.join(soc_dir, name, "results.json")):
+            name = "root"
+        runs.append((os.path.basename(soc_dir), name, path))
+
+    return sorted(runs)
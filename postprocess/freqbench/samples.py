@@ -0,0 +1,104 @@
+
+import os
+import sys
+from array import array
+
+# Raw power samples are stored in a binary sidecar next to results.json since version 2,
+# e.g. results.samples.bin for results.json
+# Each phase's samples are stored as consecutive little-endian float64 columns
+SAMPLES_SUFFIX = ".samples.bin"
+SAMPLES_MAGIC = b"FBSAMP1\n"
+# All columns, in order; older results may only have some of them
+SAMPLE_COLUMNS = ["power_sample_times", "power_samples", "power_sample_currents", "power_sample_voltages"]
+
+def iter_power_stats(json_data):
+    """Yield the power stats for every phase: housekeeping, idle, active, and workloads."""
+    # Some results were contributed without housekeeping stats
+    if "housekeeping" in json_data:
+        yield json_data["housekeeping"]
+    for cpu_data in json_data["cpus"].values():
+        for freq_data in cpu_data["freqs"].values():
+            yield freq_data["idle"]
+            yield freq_data["active"]
+            yield from freq_data.get("workloads", {}).values()
+
+def new_samples_path(results_path):
+    return os.path.splitext(results_path)[0] + SAMPLES_SUFFIX
+
+def samples_path(results_path, json_data):
+    return os.path.join(os.path.dirname(results_path), json_data["samples_file"])
+
+def rebase_samples_file(json_data, results_path, out_path):
+    """Point results written to out_path at the samples of the results they were derived from."""
+    if "samples_file" in json_data:
+        path = samples_path(results_path, json_data)
+        json_data["samples_file"] = os.path.relpath(path, os.path.dirname(os.path.abspath(out_path)))
+
+def read_samples(f, ref):
+    """Read the sample columns for one set of stats from an open sidecar file."""
+    f.seek(ref["offset"])
+    columns = {}
+    for key in ref["columns"]:
+        column = array("d")
+        column.fromfile(f, ref["count"])
+        if sys.byteorder == "big":
+            column.byteswap()
+        columns[key] = column
+
+    return columns
+
+def load_samples(results_path, json_data, stats):
+    """Load the raw samples for one set of stats as {column: array}.
+
+    Older results store samples inline. Columns that weren't recorded are left out.
+    """
+    if "samples" not in stats:
+        return {key: array("d", stats[key]) for key in SAMPLE_COLUMNS if key in stats}
+
+    with open(samples_path(results_path, json_data), "rb") as f:
+        return read_samples(f, stats["samples"])
+
+def inline_samples(results_path, json_data):
+    """Move samples from the sidecar back into the stats as lists, like version 1."""
+    if "samples_file" not in json_data:
+        return
+
+    with open(samples_path(results_path, json_data), "rb") as f:
+        if f.read(len(SAMPLES_MAGIC)) != SAMPLES_MAGIC:
+            raise ValueError(f"Invalid samples file for {results_path}")
+
+        for stats in iter_power_stats(json_data):
+            if "samples" not in stats:
+                continue
+
+            for key, column in read_samples(f, stats.pop("samples")).items():
+                stats[key] = column.tolist()
+
+    del json_data["samples_file"]
+
+def write_samples(json_data, path):
+    """Move inline samples from all stats into a sidecar file at path.
+
+    Only columns present in the stats are stored, and stats without any
+    samples are left as-is.
+    """
+    with open(path, "wb") as f:
+        f.write(SAMPLES_MAGIC)
+        for stats in iter_power_stats(json_data):
+            if "power_samples" not in stats:
+                continue
+
+            columns = [key for key in SAMPLE_COLUMNS if key in stats]
+            stats["samples"] = {
+                "offset": f.tell(),
+                "count": len(stats["power_samples"]),
+                "columns": columns,
+            }
+
+            for key in columns:
+                column = array("d", stats.pop(key))
+                if sys.byteorder == "big":
+                    column.byteswap()
+                column.tofile(f)
+
+    json_data["samples_file"] = os.path.basename(path)
@@ -0,0 +1,55 @@
+import csv
+from typing import TextIO
+
+from .results import Results
+
+def write_idle_csv(results: Results, f: TextIO):
+    """Write idle power and energy for each frequency as CSV."""
+    fields = [
+        "CPU",
+        "Frequency (kHz)",
+        "Power (mW)",
+        "Energy (J)"
+    ]
+
+    writer = csv.DictWriter(f, fieldnames=fields)
+    writer.writeheader()
+
+    for cluster in results:
+        powers = cluster.idle_power
+        energies = cluster.column("energy_joules", "idle")
+
+        for freq, power, energy in zip(cluster.freqs, powers, energies):
+            writer.writerow({
+                "CPU": cluster.cpu,
+                "Frequency (kHz)": freq,
+                "Power (mW)": power,
+                "Energy (J)": energy,
+            })
+
+def write_cluster_col_csv(results: Results, col_name: str, f: TextIO):
+    """Write a value for each cluster as CSV, with one row per frequency."""
+    fields = [
+        "Frequency (kHz)",
+        *[f"CPU {cluster.cpu} {col_name}" for cluster in results]
+    ]
+
+    writer = csv.DictWriter(f, fieldnames=fields)
+    writer.writeheader()
+
+    values = {}
+    for cluster in results:
+        for freq, value in zip(cluster.freqs.tolist(), cluster.column(col_name).tolist()):
+            values[(cluster.cpu, freq)] = value
+
+    # Clusters may share freqs, which are only listed once
+    freqs = sorted({freq for _, freq in values.keys()}, reverse=True)
+    for freq in freqs:
+        row = {
+            "Frequency (kHz)": freq
+        }
+
+        for cluster in results:
+            row[f"CPU {cluster.cpu} {col_name}"] = str(values.get((cluster.cpu, freq), ""))
+
+        writer.writerow(row)
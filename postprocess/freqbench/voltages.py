@@ -0,0 +1,16 @@
+import re
+from typing import Dict, Iterable, Tuple
+
+def parse_voltages(opps: Iterable[str]) -> Dict[Tuple[int, int], int]:
+    """Parse cpu#.khz=microvolts arguments into {(cpu, freq): voltage}."""
+    voltages = {}
+    for opp in opps:
+        cpu, freq, voltage = map(int, re.split(r"[\.=]", opp))
+        voltages[(cpu, freq)] = voltage
+
+    return voltages
+
+def load_voltages(path: str) -> Dict[Tuple[int, int], int]:
+    """Load a voltages.txt file with space-separated cpu#.khz=microvolts entries."""
+    with open(path, "r") as f:
+        return parse_voltages(f.read().split())
@@ -1,32 +1,11 @@
 #!/usr/bin/env python3
 
-import json
-import csv
 import sys
 
-with open(sys.argv[1], "r") as f:
-    json_data = json.loads(f.read())
+from freqbench import load_results
+from freqbench.tables import write_idle_csv
 
-cpus_data = json_data["cpus"]
+results = load_results(sys.argv[1])
 
 with open(sys.argv[2], "w+") as f:
-    fields = [
-        "CPU",
-        "Frequency (kHz)",
-        "Power (mW)",
-        "Energy (J)"
-    ]
-
-    writer = csv.DictWriter(f, fieldnames=fields)
-    writer.writeheader()
-
-    for cpu, cpu_data in cpus_data.items():
-        for freq, freq_data in cpu_data["freqs"].items():
-            freq_data = freq_data["idle"]
-
-            writer.writerow({
-                "CPU": cpu,
-                "Frequency (kHz)": freq,
-                "Power (mW)": freq_data["power_mean"],
-                "Energy (J)": freq_data["energy_joules"],
-            })
+    write_idle_csv(results, f)
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+
+import argparse
+import csv
+import sys
+import time
+
+from freqbench.index import connect, update_index
+
+parser = argparse.ArgumentParser(description="Index a results tree in an SQLite database and query it.")
+parser.add_argument("results_dir", nargs="?", default="../results")
+parser.add_argument("-d", "--db", default="results.db", help="database file (default: results.db)")
+parser.add_argument("-q", "--query", help="SQL query to run after indexing, printed as CSV")
+args = parser.parse_args()
+
+conn = connect(args.db)
+
+start = time.perf_counter()
+counts = update_index(conn, args.results_dir)
+elapsed_ms = (time.perf_counter() - start) * 1000
+print(", ".join(f"{count} {state}" for state, count in counts.items()) + f" runs in {elapsed_ms:.0f} ms", file=sys.stderr)
+
+if args.query:
+    cursor = conn.execute(args.query)
+    writer = csv.writer(sys.stdout)
+    writer.writerow(col[0] for col in cursor.description)
+    writer.writerows(cursor)
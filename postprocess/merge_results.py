@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+
+import sys
+
+from freqbench import load_results
+
+# Usage: merge_results.py base.json out.json partial.json...
+# Frequencies in later files replace the same frequencies in earlier ones,
+# e.g. to merge targeted re-runs of a few OPPs into a full run.
+results = load_results(sys.argv[1])
+for path in sys.argv[3:]:
+    results.merge(load_results(path))
+
+results.save(sys.argv[2])
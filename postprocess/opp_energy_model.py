@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+
+from freqbench import load_results, load_voltages, parse_voltages
+from freqbench.energy_model import opp_energy_model
+from freqbench.fdt import load_dtbs
+
+parser = argparse.ArgumentParser(description="Create an EAS energy model overlay that adds opp-microwatt to existing OPP tables.")
+parser.add_argument("results")
+parser.add_argument("dtb", help="DTB with the CPU OPP tables, e.g. from the boot image (the first one is used)")
+parser.add_argument("opps", nargs="*", metavar="cpu.freq=uV", help="voltages for each frequency (optional, overrides opp-microvolt)")
+parser.add_argument("--voltages", help="voltages.txt with cpu.freq=uV entries")
+args = parser.parse_args()
+
+results = load_results(args.results)
+voltages = parse_voltages(args.opps)
+if args.voltages:
+    voltages.update(load_voltages(args.voltages))
+
+with open(args.dtb, "rb") as f:
+    fdts, _ = load_dtbs(f.read())
+if len(fdts) > 1:
+    print(f"Using the first of {len(fdts)} DTBs", file=sys.stderr)
+
+print(opp_energy_model(fdts[0], results, voltages), end="")
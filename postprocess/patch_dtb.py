@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import subprocess
+import sys
+
+from freqbench import load_results, load_voltages, parse_voltages
+from freqbench.energy_model import patch_energy_model
+from freqbench.fdt import dump_dtbs, load_dtbs
+
+PACK_IMG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pack-img.sh")
+
+parser = argparse.ArgumentParser(description="Write an energy model from results into a DTB, and optionally rebuild the boot image.")
+parser.add_argument("results")
+parser.add_argument("dtb", help="input DTB, e.g. alpine-dt.dtb (may contain several DTBs)")
+parser.add_argument("out", help="patched DTB")
+parser.add_argument("opps", nargs="*", metavar="cpu.freq=uV", help="voltages for dynamic-power-coefficient (optional)")
+parser.add_argument("--voltages", help="voltages.txt with cpu.freq=uV entries")
+parser.add_argument("--pack", nargs="?", const="bench.img", metavar="IMG", help="rebuild the boot image with pack-img.sh (default: bench.img)")
+args = parser.parse_args()
+
+results = load_results(args.results)
+voltages = parse_voltages(args.opps)
+if args.voltages:
+    voltages.update(load_voltages(args.voltages))
+
+with open(args.dtb, "rb") as f:
+    fdts, trailer = load_dtbs(f.read())
+
+for fdt in fdts:
+    patch_energy_model(fdt, results, voltages)
+print(f"Patched {len(fdts)} DTB(s)", file=sys.stderr)
+
+with open(args.out, "wb") as f:
+    f.write(dump_dtbs(fdts, trailer))
+
+if args.pack:
+    env = dict(os.environ, DTB=os.path.abspath(args.out))
+    subprocess.run([PACK_IMG, args.pack], env=env, check=True)
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+
+from freqbench.batch import render_all
+
+parser = argparse.ArgumentParser(description="Render graphs for all results in a results tree.")
+parser.add_argument("results_dir", nargs="?", default="../results")
+parser.add_argument("out_dir", nargs="?", default="graphs")
+parser.add_argument("-f", "--format", action="append", help="image format, can be repeated (default: png)")
+parser.add_argument("-j", "--jobs", type=int, help="number of worker processes (default: CPU count)")
+parser.add_argument("--force", action="store_true", help="render all figures, even if they're up to date")
+args = parser.parse_args()
+
+failures = render_all(args.results_dir, args.out_dir, args.format or ["png"], args.jobs, args.force)
+sys.exit(1 if failures else 0)